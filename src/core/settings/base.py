@@ -454,6 +454,18 @@ PIPELINE_JS = {
         ),
         'output_filename': 'js/transmittal-list.js',
     },
+    'archive_download': {
+        'source_filenames': (
+            'js/archive-download.js',
+        ),
+        'output_filename': 'js/archive-download.min.js',
+    },
+    'task_progress': {
+        'source_filenames': (
+            'js/task-progress.js',
+        ),
+        'output_filename': 'js/task-progress.min.js',
+    },
     'reporting': {
         'source_filenames': (
             'js/vendor/d3.min.js',
@@ -488,11 +500,29 @@ CELERY_RESULT_BACKEND = 'amqp'
 ELASTIC_HOSTS = [{'host': 'localhost', 'port': 9200}]
 ELASTIC_INDEX = 'documents'
 ELASTIC_BULK_SIZE = 150
+ELASTIC_BULK_MAX_BYTES = 5 * 1024 * 1024  # Max payload size of a bulk request
+ELASTIC_BULK_MAX_RETRIES = 3
+ELASTIC_BULK_RETRY_DELAY = 0.5  # Seconds, doubled after every retry
 ELASTIC_AUTOINDEX = True
+SEARCH_BACKEND = 'search.backends.elastic.ElasticBackend'
+ELASTIC_ANALYZER_PROFILE = 'ngram'  # See search.analysis
+SEARCH_CACHE_TIMEOUT = 600  # Seconds
+# Seconds before written documents are searchable (at least the index
+# refresh interval). Results cached meanwhile expire after this delay.
+SEARCH_CACHE_WRITE_DELAY = 5
+ELASTIC_REINDEX_CHUNK_SIZE = 1000  # Revisions fetched from the db at once
+ELASTIC_REINDEX_WORKERS = 1
+ELASTIC_OUTBOX_BATCH_SIZE = 500  # Outbox entries drained at once
+ELASTIC_OUTBOX_DRAIN_DELAY = 2  # Seconds
 
 # ######### CUSTOM CONFIGURATION
 PAGINATE_BY = 50  # Document list pagination
 API_PAGINATE_BY = 10
+CHANGES_PAGE_SIZE = 500  # Change feed pagination
+CHANGES_MAX_PAGE_SIZE = 5000
+# Seconds. Change feed windows end this long ago, so transactions running
+# when a sync starts are committed before their changes are read.
+CHANGES_SAFETY_LAG = 60
 CACHE_TIMEOUT_SECONDS = 300  # seconds == 5 minutes
 AUTH_USER_MODEL = 'accounts.User'
 LOGIN_URL = 'login'
@@ -522,7 +552,41 @@ EXPORTS_CHUNK_SIZE = 150
 EXPORTS_VALIDITY_DURATION = 60
 EXPORTS_TO_KEEP = 20
 
+# Write xlsx rows to disk as they come, instead of building the sheet in memory
+EXPORTS_XLSX_WRITE_ONLY = True
+
+# Read indexed columns from the search results instead of the db
+EXPORTS_FROM_INDEX = True
+
+# Exports of categories with more revisions are split into pk ranges, that
+# are written in parallel
+EXPORTS_SHARD_SIZE = 20000
+EXPORTS_MAX_SHARDS = 8
+
+# Batch downloads are zipped by celery tasks in this private subdir, and kept
+# (in days) to be reused
+ARCHIVES_SUBDIR = 'archives'
+ARCHIVES_VALIDITY_DURATION = 2
+
 # Where to look for files to import?
 IMPORT_ROOT = SITE_ROOT.child('import')
 
+# Transmittals intake (see `run_transmittals_intake`): number of transmittals
+# imported at the same time, seconds without modification before a directory
+# is imported, and seconds between two checks of the directories
+TRS_INTAKE_WORKERS = 4
+TRS_INTAKE_SETTLE_DELAY = 30
+TRS_INTAKE_POLL_INTERVAL = 5
+
+# Revisions of an accepted transmittal are saved by batches, each in its own
+# transaction
+TRANSMITTALS_PROCESSING_BATCH_SIZE = 100
+
+# Imported rows are read and saved by chunks
+IMPORTS_CHUNK_SIZE = 500
+
+# Imports with more rows are split into chunks, that are imported in parallel
+IMPORTS_SHARD_SIZE = 2000
+IMPORTS_MAX_SHARDS = 8
+
 # ######### END CUSTOM CONFIGURATION
@@ -56,6 +56,8 @@ STATICFILES_STORAGE = 'pipeline.storage.NonPackagingPipelineStorage'
 
 ELASTIC_INDEX = 'test_documents'
 ELASTIC_AUTOINDEX = False
+SEARCH_BACKEND = 'search.backends.local.LocalBackend'
+ELASTIC_BULK_RETRY_DELAY = 0
 
 # Makes Celery working synchronously and in memory
 CELERY_ALWAYS_EAGER = True
@@ -161,6 +161,10 @@ class ContractorDeliverable(ScheduleMixin, Metadata):
             'docclass', 'status', 'unit', 'discipline',
             'document_type', 'under_review', 'overdue', 'leader', 'approver'
         )
+        facet_sizes = {
+            'leader': 100,
+            'approver': 100,
+        }
         indexable_fields = ['is_existing', 'can_be_transmitted']
         column_fields = (
             ('', 'under_preparation_by'),
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models
+
+from rest_framework import serializers
+
+from documents.models import Tombstone
+
+
+class TombstoneSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Tombstone
+        fields = ('document_key', 'document_number', 'revision', 'deleted_on')
+
+
+def serialize_row(row):
+    """Related objects are displayed as text, like in exports."""
+    return dict(
+        (field, unicode(value) if isinstance(value, models.Model) else value)
+        for field, value in row.items())
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf.urls import patterns, url
+
+from documents.api.views import ChangeFeedView
+
+
+urlpatterns = patterns(
+    '',
+    url(r'^(?P<organisation>[\w-]+)/(?P<category>[\w-]+)/$',
+        ChangeFeedView.as_view(),
+        name='change_feed'),
+)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from urllib import urlencode
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.exceptions import ParseError
+
+from restapi.views import CategoryAPIViewMixin
+from documents.changes import ChangeFeed
+from documents.api.serializers import TombstoneSerializer, serialize_row
+from exports.generators import ExportProjection
+
+
+class ChangeFeedView(CategoryAPIViewMixin, APIView):
+    """Revisions and deletions since a watermark, for incremental syncs.
+
+    Start a sync with `?since=<watermark>` (omit it for a full sync), then
+    follow the `next` links until it's null. The returned `watermark` is the
+    `since` value of the next sync.
+
+    Revisions are given with the category export fields.
+
+    """
+    # Those fields identify the revisions
+    KEY_FIELDS = ('pk', 'document_key', 'revision', 'updated_on')
+
+    def get_feed(self):
+        category = self.get_category()
+        cursor = self.request.query_params.get('cursor')
+        if cursor:
+            try:
+                return ChangeFeed.from_cursor(category, cursor)
+            except ValueError:
+                raise ParseError('Invalid cursor')
+
+        since = self.request.query_params.get('since')
+        if since:
+            since = parse_datetime(since)
+            if since is None:
+                raise ParseError('Invalid "since" date')
+        return ChangeFeed(category, since=since or None)
+
+    def get_page_size(self):
+        try:
+            page_size = int(self.request.query_params.get(
+                'page_limit', settings.CHANGES_PAGE_SIZE))
+        except ValueError:
+            raise ParseError('Invalid page limit')
+        return max(1, min(page_size, settings.CHANGES_MAX_PAGE_SIZE))
+
+    def get_fields(self):
+        Model = self.get_category().document_class()
+        export_fields = getattr(Model.PhaseConfig, 'export_fields', {})
+        fields = list(self.KEY_FIELDS)
+        fields += [field for field in export_fields.values()
+                   if field not in fields]
+        return fields
+
+    def get(self, request, *args, **kwargs):
+        feed = self.get_feed()
+        page_size = self.get_page_size()
+
+        revision_pks = feed.next_revisions(page_size)
+        tombstones = feed.next_tombstones(page_size)
+
+        projection = ExportProjection(
+            self.get_category().revision_class(),
+            self.get_fields())
+        rows = projection.get_db_rows(revision_pks)
+
+        has_next = len(revision_pks) == page_size or \
+            len(tombstones) == page_size
+        next_url = None
+        if has_next:
+            next_url = request.build_absolute_uri('{}?{}'.format(
+                request.path,
+                urlencode({'cursor': feed.get_cursor(),
+                           'page_limit': page_size})))
+
+        return Response({
+            'watermark': feed.until,
+            'next': next_url,
+            'revisions': [serialize_row(row) for row in rows],
+            'tombstones': TombstoneSerializer(tombstones, many=True).data,
+        })
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.apps import AppConfig, apps
+from django.db.models.signals import pre_delete
+
+
+class DocumentsConfig(AppConfig):
+    name = 'documents'
+    verbose_name = 'Documents'
+
+    def ready(self):
+        from documents.models import (
+            Document, MetadataRevisionBase, create_tombstone)
+
+        # Receivers are connected with a sender, so querysets of other
+        # models can still be deleted without signals
+        pre_delete.connect(
+            create_tombstone,
+            sender=Document,
+            dispatch_uid='create_document_tombstone')
+
+        # Revision classes are only known once all apps are loaded
+        for model in apps.get_models():
+            if issubclass(model, MetadataRevisionBase):
+                pre_delete.connect(
+                    create_tombstone,
+                    sender=model,
+                    dispatch_uid='create_revision_tombstone')
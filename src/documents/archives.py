@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import json
+import uuid
+import time
+import stat
+import struct
+import zipfile
+import zlib
+import hashlib
+import logging
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+# Those formats are already compressed, deflating them is a waste of time
+STORED_EXTENSIONS = ('.pdf', '.dwg', '.zip')
+
+READ_SIZE = 64 * 1024
+
+# Written after the entry data, when the sizes and crc were not known
+# beforehand
+DATA_DESCRIPTOR_SIGNATURE = b'PK\x07\x08'
+DATA_DESCRIPTOR_FLAG = 0x08
+
+
+class StreamBuffer(object):
+    """A write only file, that keeps the written data until it's read.
+
+    `ZipFile` only needs to know the position in the file to write the
+    archive index.
+
+    """
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(data)
+        self.position += len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def read(self):
+        """Returns and forget all the data written so far."""
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class Archive(object):
+    """A zip archive of private files, that is built by a celery task.
+
+    `files` is a list of `(filepath, archive name)` pairs. Archives are
+    identified by a hash of their member files, so an archive that was
+    already built is reused until one of its files is modified.
+
+    """
+    def __init__(self, files, key=None):
+        self.files = list(files)
+        self.key = key or self.compute_key()
+
+    def compute_key(self):
+        members = []
+        for filepath, arcname in self.files:
+            try:
+                st = os.stat(filepath)
+                members.append((filepath, arcname, st.st_size, st.st_mtime))
+            except OSError:
+                members.append((filepath, arcname, None, None))
+        data = json.dumps(members)
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def get_url(self):
+        """The file url, relative to the private root."""
+        return os.path.join(
+            settings.ARCHIVES_SUBDIR,
+            '{}.zip'.format(self.key))
+
+    def get_filepath(self):
+        return os.path.join(settings.PRIVATE_ROOT, self.get_url())
+
+    def exists(self):
+        return os.path.exists(self.get_filepath())
+
+    def start_build(self, async=True):
+        """Build the archive, unless it already exists.
+
+        Returns the celery job, or None if the archive is ready.
+
+        """
+        if self.exists():
+            logger.info('Reusing archive {}'.format(self.key))
+            return None
+
+        from documents.tasks import build_archive
+        if async:
+            return build_archive.delay(self.files, self.key)
+        else:
+            return build_archive.apply((self.files, self.key))
+
+    def write(self):
+        """Write the archive file.
+
+        The file is written under a temporary name, so a download that starts
+        meanwhile cannot see an incomplete archive.
+
+        """
+        filepath = self.get_filepath()
+        filedir = os.path.dirname(filepath)
+        if not os.path.exists(filedir):
+            os.makedirs(filedir)
+
+        tmp_filepath = '{}.{}.tmp'.format(filepath, uuid.uuid4())
+        with open(tmp_filepath, 'wb') as the_file:
+            for data in stream_zip(self.files):
+                the_file.write(data)
+        os.rename(tmp_filepath, filepath)
+        logger.info('Archive {} done'.format(self.key))
+
+
+def get_compress_type(filepath):
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def stream_zip(files):
+    """Yields a zip archive of the given files, as it's being built.
+
+    `files` is an iterable of `(filepath, archive name)` pairs. Entries are
+    written while the files are read, and the archive index is written at
+    the end, so neither the files nor the archive are ever kept in memory.
+
+    Missing files are skipped.
+
+    """
+    buf = StreamBuffer()
+    zip_file = zipfile.ZipFile(buf, mode='w', allowZip64=True)
+    for filepath, arcname in files:
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            logger.warning('File: {} missing in archive'.format(filepath))
+            continue
+
+        for _ in write_entry(zip_file, filepath, arcname, st):
+            yield buf.read()
+
+    zip_file.close()
+    yield buf.read()
+
+
+def write_entry(zip_file, filepath, arcname, st):
+    """Write a single file in the archive.
+
+    The archive cannot be rewinded, so the crc and sizes are written in a
+    data descriptor after the data (like with `zip -` on a pipe).
+
+    Yields after every chunk of data.
+
+    """
+    zinfo = zipfile.ZipInfo(arcname, time.localtime(st.st_mtime)[0:6])
+    zinfo.external_attr = (stat.S_IMODE(st.st_mode) | stat.S_IFREG) << 16
+    zinfo.compress_type = get_compress_type(filepath)
+    zinfo.flag_bits = DATA_DESCRIPTOR_FLAG
+    zinfo.header_offset = zip_file.fp.tell()
+    zinfo.file_size = zinfo.compress_size = zinfo.CRC = 0
+
+    # Compressed size can be larger than uncompressed size
+    zip64 = st.st_size * 1.05 > zipfile.ZIP64_LIMIT
+    zip_file.fp.write(zinfo.FileHeader(zip64))
+
+    if zinfo.compress_type == zipfile.ZIP_DEFLATED:
+        compressor = zlib.compressobj(
+            zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    else:
+        compressor = None
+
+    crc = file_size = compress_size = 0
+    with open(filepath, 'rb') as the_file:
+        while True:
+            data = the_file.read(READ_SIZE)
+            if not data:
+                break
+            file_size += len(data)
+            crc = zlib.crc32(data, crc) & 0xffffffff
+            if compressor:
+                data = compressor.compress(data)
+            compress_size += len(data)
+            zip_file.fp.write(data)
+            yield
+
+    if compressor:
+        data = compressor.flush()
+        compress_size += len(data)
+        zip_file.fp.write(data)
+
+    zinfo.CRC = crc
+    zinfo.file_size = file_size
+    zinfo.compress_size = compress_size
+    descriptor_format = b'<4sLQQ' if zip64 else b'<4sLLL'
+    zip_file.fp.write(struct.pack(
+        descriptor_format, DATA_DESCRIPTOR_SIGNATURE, crc, compress_size,
+        file_size))
+
+    zip_file.filelist.append(zinfo)
+    zip_file.NameToInfo[zinfo.filename] = zinfo
+    yield
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import base64
+import datetime
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from documents.models import Tombstone
+
+
+def get_watermark():
+    """The latest date that can safely end a sync window.
+
+    Dates are set before transactions are committed, so rows with an older
+    date can still appear while a sync runs. Those rows would be before the
+    next `since` watermark, and never synced. The window ends
+    `settings.CHANGES_SAFETY_LAG` seconds ago, so such transactions are
+    committed when it is read.
+
+    """
+    return timezone.now() - datetime.timedelta(
+        seconds=settings.CHANGES_SAFETY_LAG)
+
+
+class ChangeFeed(object):
+    """Revisions modified in a time window, and deletions.
+
+    A sync reads the changes after a `since` watermark (all revisions if
+    `since` is None). The end of the window (`until`) is set when the sync
+    starts (see `get_watermark`), and must be used as the `since` watermark
+    of the next sync.
+
+    A revision is changed if it was saved, or if it's the latest revision
+    of a document that was saved. Deleted documents and revisions are
+    returned as tombstones.
+
+    Revisions and tombstones are paged with a keyset cursor (the last pk
+    read), so pages do not depend on offsets and stay consistent if data
+    is modified during the sync.
+
+    """
+    def __init__(self, category, since=None, until=None, last_revision=0,
+                 last_tombstone=0, only_latest=False):
+        self.category = category
+        self.since = since
+        self.until = until or get_watermark()
+        self.last_revision = last_revision
+        self.last_tombstone = last_tombstone
+        self.only_latest = only_latest
+
+    @classmethod
+    def from_cursor(cls, category, cursor, **kwargs):
+        """Resume a sync where the cursor was created.
+
+        Raises `ValueError` if the cursor is invalid.
+
+        """
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            since, until, last_revision, last_tombstone = data
+            last_revision = int(last_revision)
+            last_tombstone = int(last_tombstone)
+        except (TypeError, ValueError, UnicodeError):
+            raise ValueError('Invalid cursor')
+
+        since = parse_datetime(since) if since else None
+        until = parse_datetime(until or '')
+        if until is None:
+            raise ValueError('Invalid cursor')
+
+        return cls(category, since=since, until=until,
+                   last_revision=last_revision,
+                   last_tombstone=last_tombstone, **kwargs)
+
+    def get_cursor(self):
+        """An opaque string to resume the sync after the last page read."""
+        data = json.dumps([
+            self.since.isoformat() if self.since else None,
+            self.until.isoformat(),
+            self.last_revision,
+            self.last_tombstone])
+        return base64.urlsafe_b64encode(data.encode('ascii')).decode('ascii')
+
+    def get_revisions(self):
+        Revision = self.category.revision_class()
+        revisions = Revision.objects \
+            .filter(metadata__document__category=self.category)
+
+        if self.only_latest:
+            revisions = revisions.filter(metadata__latest_revision=F('pk'))
+
+        if self.since is not None:
+            revisions = revisions.filter(
+                Q(updated_on__gt=self.since, updated_on__lte=self.until) |
+                Q(metadata__document__updated_on__gt=self.since,
+                  metadata__document__updated_on__lte=self.until,
+                  metadata__latest_revision=F('pk')))
+        return revisions
+
+    def get_tombstones(self):
+        tombstones = Tombstone.objects \
+            .filter(category=self.category) \
+            .filter(deleted_on__lte=self.until)
+        if self.since is not None:
+            tombstones = tombstones.filter(deleted_on__gt=self.since)
+        return tombstones
+
+    def next_revisions(self, limit):
+        """Returns the pks of the next `limit` changed revisions."""
+        pks = list(self.get_revisions()
+                   .filter(pk__gt=self.last_revision)
+                   .order_by('pk')
+                   .values_list('pk', flat=True)[:limit])
+        if pks:
+            self.last_revision = pks[-1]
+        return pks
+
+    def next_tombstones(self, limit):
+        """Returns the next `limit` tombstones."""
+        tombstones = list(self.get_tombstones()
+                          .filter(pk__gt=self.last_tombstone)
+                          .order_by('pk')[:limit])
+        if tombstones:
+            self.last_tombstone = tombstones[-1].pk
+        return tombstones
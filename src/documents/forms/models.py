@@ -57,6 +57,7 @@ class GenericBaseDocumentForm(forms.ModelForm):
         self.read_only = kwargs.pop('read_only', False)
         self.request = kwargs.pop('request', None)
         self.category = kwargs.pop('category')
+        self.choices_cache = kwargs.pop('choices_cache', None)
         super(GenericBaseDocumentForm, self).__init__(*args, **kwargs)
         self.prepare_form(*args, **kwargs)
         self.helper = FormHelper()
@@ -76,13 +77,29 @@ class GenericBaseDocumentForm(forms.ModelForm):
             # See metadata.fields.ConfigurableChoiceField
             model_field = self._meta.model._meta.get_field(field_name)
             if isinstance(model_field, ConfigurableChoiceField):
-                self.fields[field_name].choices = model_field.get_choices()
+                self.fields[field_name].choices = self.get_list_choices(
+                    model_field)
 
             # Call custom prepare method
             method_name = 'prepare_field_%s' % field_name
             if hasattr(self, method_name):
                 getattr(self, method_name)()
 
+    def get_list_choices(self, model_field):
+        """Returns the values list choices of the field.
+
+        Forms that are built in a loop (e.g imports) can share a
+        `choices_cache` dict, so each values list is read only once.
+
+        """
+        if self.choices_cache is None:
+            return model_field.get_choices()
+
+        list_index = model_field.list_index
+        if list_index not in self.choices_cache:
+            self.choices_cache[list_index] = model_field.get_choices()
+        return self.choices_cache[list_index]
+
     def prepare_field_document_number(self):
         # Document key is automatically generated, this field should not
         # be required
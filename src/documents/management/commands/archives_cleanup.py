@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import time
+import logging
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    def handle(self, *args, **options):
+        logger.info('Cleaning old archives')
+
+        archives_dir = os.path.join(
+            settings.PRIVATE_ROOT, settings.ARCHIVES_SUBDIR)
+        if not os.path.exists(archives_dir):
+            return
+
+        validity = settings.ARCHIVES_VALIDITY_DURATION * 24 * 60 * 60
+        clean_before = time.time() - validity
+        for filename in os.listdir(archives_dir):
+            filepath = os.path.join(archives_dir, filename)
+            if os.path.getmtime(filepath) < clean_before:
+                logger.info('Removing archive {}'.format(filepath))
+                os.remove(filepath)
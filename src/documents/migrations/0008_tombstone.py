@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0010_auto_20160202_1624'),
+        ('documents', '0007_set_metadata_value'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('document_key', models.SlugField(max_length=250, verbose_name='Document key')),
+                ('document_number', models.CharField(max_length=250, verbose_name='Document number')),
+                ('revision', models.PositiveIntegerField(help_text='Empty when the whole document was deleted', null=True, verbose_name='Revision', blank=True)),
+                ('deleted_on', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Deleted on', db_index=True)),
+                ('category', models.ForeignKey(verbose_name='Category', to='categories.Category')),
+            ],
+            options={
+                'verbose_name': 'Tombstone',
+                'verbose_name_plural': 'Tombstones',
+            },
+        ),
+    ]
@@ -1,7 +1,5 @@
 # -*- coding: utf-8 -*-
 
-import zipfile
-import tempfile
 from collections import OrderedDict
 
 from django.db import models
@@ -14,7 +12,9 @@ from django.core.urlresolvers import reverse
 from annoying.functions import get_object_or_None
 
 from accounts.models import User
+from documents.archives import Archive
 from documents.fields import RevisionFileField
+from documents.serializers import get_serializer
 from categories.models import Category
 from documents.templatetags.documents import MenuItem, DividerMenuItem
 
@@ -332,6 +332,42 @@ class Metadata(six.with_metaclass(MetadataBase, models.Model)):
         from documents.forms.utils import DocumentDownloadForm
         return DocumentDownloadForm(data, queryset=queryset)
 
+    @classmethod
+    def get_revisions_to_download(cls, documents, revisions='latest'):
+        """Returns the revisions of the given documents, in a single query.
+
+        * revisions can be either 'latest' or 'all'
+
+        """
+        Revision = cls.get_revision_class()
+        qs = Revision.objects \
+            .filter(metadata__document__in=documents) \
+            .select_related('metadata__document') \
+            .order_by('metadata__document', '-id')
+        if revisions == 'latest':
+            qs = qs.filter(metadata__latest_revision=models.F('pk'))
+        return qs
+
+    @classmethod
+    def get_archive_files(cls, documents, **kwargs):
+        """List the files of the given documents to download.
+
+        See `compress_documents` for the parameters.
+
+        Returns a list of `(file path, archive name)` pairs.
+        """
+        format = kwargs.pop('format', 'both')
+        revisions = kwargs.pop('revisions', 'latest')
+
+        files = []
+        for rev in cls.get_revisions_to_download(documents, revisions):
+            if format in ('native', 'both'):
+                files.append(rev.native_file)
+            if format in ('pdf', 'both'):
+                files.append(rev.pdf_file)
+
+        return [(file_.path, file_.name) for file_ in files if file_.name]
+
     @classmethod
     def compress_documents(cls, documents, **kwargs):
         """Compress the given files' documents (or queryset) in a zip file.
@@ -339,35 +375,9 @@ class Metadata(six.with_metaclass(MetadataBase, models.Model)):
         * format can be either 'both', 'native' or 'pdf'
         * revisions can be either 'latest' or 'all'
 
-        Returns the name of the ziped file.
+        Returns a `documents.archives.Archive`, that still has to be built.
         """
-        format = kwargs.pop('format', 'both')
-        revisions = kwargs.pop('revisions', 'latest')
-        temp_file = tempfile.TemporaryFile()
-
-        with zipfile.ZipFile(temp_file, mode='w') as zip_file:
-            files = []
-            for document in documents:
-                if revisions == 'latest':
-                    revs = [document.latest_revision]
-                elif revisions == 'all':
-                    revs = document.get_all_revisions()
-
-                for rev in revs:
-                    if rev is not None:
-                        if format in ('native', 'both'):
-                            files.append(rev.native_file)
-                        if format in ('pdf', 'both'):
-                            files.append(rev.pdf_file)
-
-            for file_ in files:
-                if file_.name:
-                    zip_file.write(
-                        file_.path,
-                        file_.name,
-                        compress_type=zipfile.ZIP_DEFLATED
-                    )
-        return temp_file
+        return Archive(cls.get_archive_files(documents, **kwargs))
 
 
 class RevisionBase(ModelBase):
@@ -470,67 +480,11 @@ class MetadataRevisionBase(models.Model):
 
         Suitable for indexing in ES, for example.
 
-        The first element of the list is the linkified document number.
+        See `documents.serializers.RevisionSerializer`.
 
-        If a value is a Model instance (e.g a foreign key), we return both it's
-        unicode and id values.
         """
-        fields = tuple()
         metadata = self.metadata
-        document = metadata.document
-
-        def add_to_fields(key):
-            # Search the value of `key` in the revision, metadata and document,
-            # in that order. If not found, raise an exception.
-            # Note that the value can be "None" so careful with have to
-            # explicitely catch the AttributeError exception
-            try:
-                value = getattr(self, key)
-            except AttributeError:
-                try:
-                    value = getattr(metadata, key)
-                except AttributeError:
-                    try:
-                        value = getattr(document, key)
-                    except AttributeError:
-                        error = 'Cannot find field {} in doc {} ({})'.format(
-                            key, document.document_key, document.document_type())
-                        raise RuntimeError(error)
-
-            if callable(value):
-                value = value()
-
-            if isinstance(value, models.Model):
-                field = (
-                    (unicode(key), value.__unicode__()),
-                    (u'%s_id' % key, value.pk)
-                )
-            else:
-                field = ((unicode(key), value),)
-
-            return field
-
-        config = document.category.document_class().PhaseConfig
-        filter_fields = list(config.filter_fields)
-        column_fields = dict(config.column_fields).values()
-        indexable_fields = getattr(config, 'indexable_fields', [])
-        fields_to_index = set(filter_fields + column_fields + indexable_fields)
-
-        for field in fields_to_index:
-            fields += add_to_fields(field)
-
-        fields_infos = dict(fields)
-        fields_infos.update({
-            u'url': document.get_absolute_url(),
-            u'document_key': document.document_key,
-            u'document_number': document.document_number,
-            u'document_pk': document.pk,
-            u'metadata_pk': metadata.pk,
-            u'pk': self.pk,
-            u'revision': self.revision,
-            u'is_latest_revision': document.current_revision == self.revision,
-        })
-        return fields_infos
+        return get_serializer(type(metadata)).serialize(self)
 
     def get_initial_ignored_fields(self):
         """New revision initial data that must stay default."""
@@ -661,3 +615,54 @@ class MetadataRevision(MetadataRevisionBase):
 
     class Meta(MetadataRevisionBase.Meta):
         abstract = True
+
+
+class Tombstone(models.Model):
+    """Remembers deleted documents and revisions.
+
+    Systems that sync incrementally (see `documents.changes`) cannot see
+    deletions otherwise.
+
+    """
+    category = models.ForeignKey(
+        'categories.Category',
+        verbose_name=_('Category'))
+    document_key = models.SlugField(
+        _('Document key'),
+        max_length=250)
+    document_number = models.CharField(
+        _('Document number'),
+        max_length=250)
+    revision = models.PositiveIntegerField(
+        _('Revision'),
+        null=True, blank=True,
+        help_text=_('Empty when the whole document was deleted'))
+    deleted_on = models.DateTimeField(
+        _('Deleted on'),
+        default=timezone.now,
+        db_index=True)
+
+    class Meta:
+        app_label = 'documents'
+        verbose_name = _('Tombstone')
+        verbose_name_plural = _('Tombstones')
+
+
+def create_tombstone(sender, instance, **kwargs):
+    """Record the deletion of documents and revisions.
+
+    Connected in `DocumentsConfig.ready`.
+
+    """
+    if isinstance(instance, Document):
+        document = instance
+        revision = None
+    else:
+        document = instance.metadata.document
+        revision = instance.revision
+
+    Tombstone.objects.create(
+        category_id=document.category_id,
+        document_key=document.document_key,
+        document_number=document.document_number,
+        revision=revision)
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from operator import attrgetter
+
+from django.db import models
+from django.core.exceptions import FieldDoesNotExist
+from django.core.urlresolvers import reverse
+
+
+# Objects in which fields values are looked for, in that order
+REVISION, METADATA, DOCUMENT = range(3)
+
+# Besides the columns, those keys are required to display the document list
+LIST_KEYS = ('document_pk', 'document_key')
+
+
+def get_fields_to_index(metadata_class):
+    """Returns the set of fields to index for a Metadata class."""
+    config = metadata_class.PhaseConfig
+    filter_fields = list(config.filter_fields)
+    column_fields = dict(config.column_fields).values()
+    indexable_fields = getattr(config, 'indexable_fields', [])
+    return set(filter_fields + column_fields + indexable_fields)
+
+
+def lookup_value(objects, key):
+    """Search the value of `key` in the revision, metadata and document.
+
+    If not found, raise an exception.
+
+    Note that the value can be "None" so careful with have to
+    explicitely catch the AttributeError exception.
+
+    """
+    for obj in objects:
+        try:
+            return getattr(obj, key)
+        except AttributeError:
+            pass
+
+    document = objects[DOCUMENT]
+    error = 'Cannot find field {} in doc {} ({})'.format(
+        key, document.document_key, document.document_type())
+    raise RuntimeError(error)
+
+
+def has_field(model_class, key):
+    """Is `key` a field, attribute, property or method of the class?"""
+    try:
+        model_class._meta.get_field(key)
+        return True
+    except FieldDoesNotExist:
+        attnames = [getattr(f, 'attname', None) for f in model_class._meta.fields]
+        return key in attnames or hasattr(model_class, key)
+
+
+def get_document_url_prefix(category):
+    """Returns the document detail url, without the document key.
+
+    This prevents running a full `reverse` for every document of the
+    same category.
+
+    """
+    url = reverse('document_detail', args=[
+        category.organisation.slug,
+        category.slug,
+        'x'])
+    return url[:-len('x/')]
+
+
+class RevisionSerializer(object):
+    """Converts revisions of a single Metadata class into json.
+
+    The json data is suitable for indexing in ES, for example.
+
+    Looking up fields in the revision, metadata and document is done
+    only once, when the serializer is created. Then, every value is read
+    with a simple `attrgetter` on the owning object.
+
+    Use `get_serializer` instead of instanciating this class, so a single
+    serializer is compiled for every Metadata class.
+
+    """
+    def __init__(self, metadata_class):
+        from documents.models import Document
+
+        self.metadata_class = metadata_class
+        owner_classes = (
+            metadata_class.get_revision_class(),
+            metadata_class,
+            Document)
+
+        self.fields = []
+        for key in sorted(get_fields_to_index(metadata_class)):
+            owner = None
+            for index, owner_class in enumerate(owner_classes):
+                if has_field(owner_class, key):
+                    owner = index
+                    break
+
+            # If the field is not found, it may still be an instance
+            # attribute, so we look it up for every revision
+            self.fields.append((key, owner, attrgetter(key)))
+
+        # The subset of indexed keys that is displayed in the document list
+        column_fields = [
+            field for _, field in metadata_class.PhaseConfig.column_fields]
+        self.list_fields = tuple(sorted(set(column_fields) | set(LIST_KEYS)))
+
+    def get_value(self, objects, key, owner, getter):
+        if owner is None:
+            return lookup_value(objects, key)
+
+        try:
+            return getter(objects[owner])
+        except AttributeError:
+            # Properties can raise AttributeError, e.g when a related
+            # object is missing. Fallback to a full lookup then.
+            return lookup_value(objects, key)
+
+    def serialize(self, revision, url=None):
+        """Converts a single revision.
+
+        If a value is a Model instance (e.g a foreign key), we return both
+        it's unicode and id values.
+
+        """
+        metadata = revision.metadata
+        document = metadata.document
+        objects = (revision, metadata, document)
+
+        fields_infos = {}
+        for key, owner, getter in self.fields:
+            value = self.get_value(objects, key, owner, getter)
+            if callable(value):
+                value = value()
+
+            if isinstance(value, models.Model):
+                fields_infos[key] = value.__unicode__()
+                fields_infos['%s_id' % key] = value.pk
+            else:
+                fields_infos[key] = value
+
+        fields_infos.update({
+            'url': url or document.get_absolute_url(),
+            'document_key': document.document_key,
+            'document_number': document.document_number,
+            'document_pk': document.pk,
+            'metadata_pk': metadata.pk,
+            'pk': revision.pk,
+            'revision': revision.revision,
+            'is_latest_revision': document.current_revision == revision.revision,
+            'updated_on': revision.updated_on,
+        })
+        return fields_infos
+
+    def serialize_many(self, revisions):
+        """Converts a list of revisions.
+
+        Document urls are built from a prefix computed once per category.
+
+        """
+        url_prefixes = {}
+        data = []
+        for revision in revisions:
+            document = revision.metadata.document
+            category_id = document.category_id
+            if category_id not in url_prefixes:
+                url_prefixes[category_id] = get_document_url_prefix(
+                    document.category)
+            url = '{}{}/'.format(url_prefixes[category_id], document.document_key)
+            data.append(self.serialize(revision, url=url))
+        return data
+
+
+_serializers = {}
+
+
+def get_serializer(metadata_class):
+    """Returns the compiled serializer for the given Metadata class."""
+    metadata_class = metadata_class._meta.concrete_model
+    if metadata_class not in _serializers:
+        _serializers[metadata_class] = RevisionSerializer(metadata_class)
+    return _serializers[metadata_class]
+
+
+def legacy_to_json(revision):
+    """The uncompiled revision serialization.
+
+    This is the former `MetadataRevisionBase.to_json` implementation, that
+    looks up every field in the revision, metadata and document every time.
+    It is only kept as a reference for tests and benchmarks.
+
+    """
+    fields = tuple()
+    metadata = revision.metadata
+    document = metadata.document
+    objects = (revision, metadata, document)
+
+    def add_to_fields(key):
+        value = lookup_value(objects, key)
+        if callable(value):
+            value = value()
+
+        if isinstance(value, models.Model):
+            field = (
+                (unicode(key), value.__unicode__()),
+                (u'%s_id' % key, value.pk)
+            )
+        else:
+            field = ((unicode(key), value),)
+
+        return field
+
+    metadata_class = document.category.document_class()
+    for field in get_fields_to_index(metadata_class):
+        fields += add_to_fields(field)
+
+    fields_infos = dict(fields)
+    fields_infos.update({
+        u'url': document.get_absolute_url(),
+        u'document_key': document.document_key,
+        u'document_number': document.document_number,
+        u'document_pk': document.pk,
+        u'metadata_pk': metadata.pk,
+        u'pk': revision.pk,
+        u'revision': revision.revision,
+        u'is_latest_revision': document.current_revision == revision.revision,
+        u'updated_on': revision.updated_on,
+    })
+    return fields_infos
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import logging
+
+from core.celery import app
+
+from documents.archives import Archive
+
+
+logger = logging.getLogger(__name__)
+
+
+@app.task
+def build_archive(files, key):
+    archive = Archive(files, key=key)
+    if not archive.exists():
+        archive.write()
+    return archive.key
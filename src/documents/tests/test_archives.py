@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+
+from django.test import TestCase, override_settings
+
+from documents.archives import Archive, stream_zip
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.settings_override = override_settings(PRIVATE_ROOT=self.tmpdir)
+        self.settings_override.enable()
+
+        self.files = []
+        for filename, content in (('doc.pdf', b'%PDF' * 1000),
+                                  ('doc.docx', b'docx' * 1000)):
+            filepath = os.path.join(self.tmpdir, filename)
+            with open(filepath, 'wb') as the_file:
+                the_file.write(content)
+            self.files.append((filepath, 'documents/{}'.format(filename)))
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.tmpdir)
+
+    def test_stream_zip(self):
+        missing = (os.path.join(self.tmpdir, 'missing.pdf'), 'missing.pdf')
+        content = b''.join(stream_zip(self.files + [missing]))
+        zip_file = ZipFile(BytesIO(content))
+        self.assertIsNone(zip_file.testzip())
+        self.assertEqual(
+            [(info.filename, info.compress_type)
+             for info in zip_file.infolist()],
+            [('documents/doc.pdf', ZIP_STORED),
+             ('documents/doc.docx', ZIP_DEFLATED)])
+        self.assertEqual(zip_file.read('documents/doc.docx'), b'docx' * 1000)
+
+    def test_key_depends_on_files(self):
+        archive = Archive(self.files)
+        self.assertEqual(archive.key, Archive(list(self.files)).key)
+        self.assertNotEqual(archive.key, Archive(self.files[:1]).key)
+
+        # Modified files are archived again
+        filepath = self.files[0][0]
+        with open(filepath, 'ab') as the_file:
+            the_file.write(b'modified')
+        self.assertNotEqual(archive.key, Archive(self.files).key)
+
+    def test_archive_is_built_once(self):
+        archive = Archive(self.files)
+        self.assertFalse(archive.exists())
+
+        job = archive.start_build(async=False)
+        self.assertEqual(job.result, archive.key)
+        self.assertTrue(archive.exists())
+        self.assertEqual(
+            ZipFile(archive.get_filepath()).namelist(),
+            ['documents/doc.pdf', 'documents/doc.docx'])
+
+        self.assertIsNone(Archive(self.files).start_build(async=False))
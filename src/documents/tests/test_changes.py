@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import base64
+import datetime
+
+from django.test import TestCase, override_settings
+from django.core.urlresolvers import reverse
+from django.db.models.deletion import Collector
+from django.utils import timezone
+
+from rest_framework.test import APIClient
+
+from accounts.factories import UserFactory
+from categories.factories import CategoryFactory
+from default_documents.factories import MetadataRevisionFactory
+from documents.changes import ChangeFeed
+from documents.factories import DocumentFactory
+from documents.models import Document, Tombstone
+from search.models import IndexOutboxEntry
+
+
+class ChangeFeedTests(TestCase):
+    def setUp(self):
+        self.category = CategoryFactory()
+        self.docs = [DocumentFactory(category=self.category)
+                     for i in range(5)]
+        self.Revision = self.category.revision_class()
+
+    def set_updated_on(self, revisions, updated_on):
+        self.Revision.objects \
+            .filter(pk__in=[revision.pk for revision in revisions]) \
+            .update(updated_on=updated_on)
+
+    def test_tombstones(self):
+        doc = self.docs[0]
+        metadata = doc.get_metadata()
+        revision = MetadataRevisionFactory(
+            metadata=metadata,
+            revision=2)
+
+        # Like `DocumentRevisionDelete`
+        metadata.latest_revision = doc.get_all_revisions()[1]
+        metadata.save()
+        revision.delete()
+        tombstone = Tombstone.objects.get()
+        self.assertEqual(tombstone.document_key, doc.document_key)
+        self.assertEqual(tombstone.revision, 2)
+
+        # Revisions are deleted along with the document
+        doc.delete()
+        self.assertEqual(
+            sorted(Tombstone.objects
+                   .filter(document_key=doc.document_key)
+                   .values_list('revision', flat=True)),
+            [None, 1, 2])
+
+    def test_other_models_are_fast_deleted(self):
+        collector = Collector(using='default')
+        self.assertTrue(collector.can_fast_delete(IndexOutboxEntry.objects.all()))
+        self.assertFalse(collector.can_fast_delete(
+            self.Revision.objects.all()))
+
+    def test_changes_since(self):
+        since = timezone.now() - datetime.timedelta(days=1)
+        revisions = [doc.get_latest_revision() for doc in self.docs]
+        self.set_updated_on(revisions, since - datetime.timedelta(days=1))
+        Document.objects \
+            .filter(category=self.category) \
+            .update(updated_on=since - datetime.timedelta(days=1))
+
+        # Only saved revisions, or the latest revisions of saved documents
+        self.set_updated_on(revisions[:1], since + datetime.timedelta(hours=1))
+        document = self.docs[1]
+        document.updated_on = since + datetime.timedelta(hours=1)
+        document.save()
+
+        feed = ChangeFeed(self.category, since=since)
+        self.assertEqual(
+            feed.next_revisions(10),
+            sorted([revisions[0].pk, revisions[1].pk]))
+
+        # The full sync returns everything
+        feed = ChangeFeed(self.category)
+        self.assertEqual(len(feed.next_revisions(10)), 5)
+
+    @override_settings(CHANGES_SAFETY_LAG=0)
+    def test_keyset_pagination(self):
+        feed = ChangeFeed(self.category)
+        first_page = feed.next_revisions(2)
+        self.assertEqual(len(first_page), 2)
+
+        # Data changes do not shift the pages
+        self.docs[0].delete()
+
+        feed = ChangeFeed.from_cursor(self.category, feed.get_cursor())
+        second_page = feed.next_revisions(2)
+        third_page = feed.next_revisions(2)
+        self.assertEqual(len(second_page), 2)
+        self.assertEqual(len(third_page), 1)
+        self.assertTrue(min(second_page) > max(first_page))
+        self.assertEqual(feed.next_revisions(2), [])
+
+        # The deletion is part of the sync window
+        self.assertEqual(len(feed.next_tombstones(10)), 0)
+        self.assertEqual(
+            len(ChangeFeed(self.category).next_tombstones(10)), 2)
+
+    def test_safety_lag(self):
+        """Changes still being committed are left to the next sync."""
+        since = timezone.now() - datetime.timedelta(days=1)
+        feed = ChangeFeed(self.category, since=since)
+        self.assertTrue(feed.until < timezone.now() - datetime.timedelta(
+            seconds=59))
+        self.assertEqual(feed.next_revisions(10), [])
+
+        self.docs[0].delete()
+        self.assertEqual(feed.next_tombstones(10), [])
+
+        feed = ChangeFeed(self.category, since=feed.until,
+                          until=timezone.now())
+        self.assertEqual(len(feed.next_revisions(10)), 4)
+        self.assertEqual(len(feed.next_tombstones(10)), 2)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            ChangeFeed.from_cursor(self.category, 'toto')
+
+        cursor = base64.urlsafe_b64encode(json.dumps(
+            [None, timezone.now().isoformat(), None, 0]))
+        with self.assertRaises(ValueError):
+            ChangeFeed.from_cursor(self.category, cursor)
+
+
+class ChangeFeedApiTests(TestCase):
+    def setUp(self):
+        self.category = CategoryFactory()
+        self.user = UserFactory(
+            email='testadmin@phase.fr', password='pass',
+            category=self.category)
+        self.apiclient = APIClient()
+        self.apiclient.login(email=self.user.email, password='pass')
+        self.url = reverse('change_feed', args=[
+            self.category.organisation.slug,
+            self.category.slug])
+        self.docs = [DocumentFactory(category=self.category)
+                     for i in range(3)]
+
+    @override_settings(CHANGES_SAFETY_LAG=0)
+    def test_sync(self):
+        res = self.apiclient.get(self.url, {'page_limit': 2})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(res.data['revisions']), 2)
+        self.assertEqual(
+            sorted(res.data['revisions'][0].keys())[:3],
+            ['document_key', 'pk', 'revision'])
+
+        res = self.apiclient.get(res.data['next'])
+        self.assertEqual(len(res.data['revisions']), 1)
+        self.assertIsNone(res.data['next'])
+
+        # Next sync
+        watermark = res.data['watermark']
+        self.docs[0].delete()
+        res = self.apiclient.get(self.url, {'since': watermark.isoformat()})
+        self.assertEqual(res.data['revisions'], [])
+        self.assertEqual(
+            sorted((tombstone['document_key'], tombstone['revision'])
+                   for tombstone in res.data['tombstones']),
+            [(self.docs[0].document_key, None),
+             (self.docs[0].document_key, 1)])
+
+    def test_invalid_parameters(self):
+        res = self.apiclient.get(self.url, {'since': 'toto'})
+        self.assertEqual(res.status_code, 400)
+
+        res = self.apiclient.get(self.url, {'cursor': 'toto'})
+        self.assertEqual(res.status_code, 400)
+
+        cursor = base64.urlsafe_b64encode(json.dumps(
+            [None, timezone.now().isoformat(), None, 0]))
+        res = self.apiclient.get(self.url, {'cursor': cursor})
+        self.assertEqual(res.status_code, 400)
+
+    def test_permission(self):
+        other_user = UserFactory(email='other@phase.fr', password='pass')
+        self.apiclient.login(email=other_user.email, password='pass')
+        res = self.apiclient.get(self.url)
+        self.assertEqual(res.status_code, 403)
@@ -7,6 +7,7 @@ from os.path import join
 from django.conf import settings
 from django.core.urlresolvers import reverse
 from django.test import TestCase
+from mock import patch
 
 from accounts.factories import UserFactory
 from audit_trail.models import Activity
@@ -15,6 +16,8 @@ from default_documents.models import DemoMetadataRevision, \
     ContractorDeliverable
 from documents.factories import DocumentFactory
 from documents.models import Document
+from documents.forms.models import documentform_factory
+from metadata.fields import ConfigurableChoiceField
 
 from ..forms.filters import filterform_factory
 
@@ -581,3 +584,24 @@ class FilterFormTest(TestCase):
 
         # Checking fields are in the right order
         self.assertEqual(form_fields, fields_order)
+
+
+class ListChoicesTest(TestCase):
+    def setUp(self):
+        self.category = CategoryFactory()
+        self.form_class = documentform_factory(ContractorDeliverable)
+
+    def test_choices_cache_is_shared(self):
+        choices_cache = {}
+        with patch.object(ConfigurableChoiceField, 'get_choices',
+                          return_value=[('1', '1 - One')]) as get_choices:
+            for i in range(3):
+                form = self.form_class(
+                    category=self.category,
+                    choices_cache=choices_cache)
+            nb_lists = get_choices.call_count
+            self.assertEqual(nb_lists, len(choices_cache))
+
+            form = self.form_class(category=self.category)
+            self.assertEqual(get_choices.call_count, nb_lists * 2)
+        self.assertEqual(form.fields['unit'].choices, [('1', '1 - One')])
@@ -66,6 +66,7 @@ class DocumentTest(TestCase):
                 u'metadata_pk': document.metadata.pk,
                 u'document_key': 'FAC09001-FWF-000-HSE-REP-0004',
                 u'document_number': 'FAC09001-FWF-000-HSE-REP-0004',
+                u'updated_on': document.metadata.latest_revision.updated_on,
             }
         )
 
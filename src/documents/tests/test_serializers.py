@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.test import TestCase
+from django.contrib.contenttypes.models import ContentType
+
+from documents.factories import DocumentFactory
+from documents.serializers import get_serializer, legacy_to_json
+from categories.factories import CategoryFactory
+from default_documents.factories import (
+    ContractorDeliverableFactory, ContractorDeliverableRevisionFactory)
+from default_documents.models import ContractorDeliverable
+
+
+class RevisionSerializerTests(TestCase):
+    def setUp(self):
+        Model = ContentType.objects.get_for_model(ContractorDeliverable)
+        self.category = CategoryFactory(category_template__metadata_model=Model)
+        self.docs = [
+            DocumentFactory(
+                metadata_factory_class=ContractorDeliverableFactory,
+                revision_factory_class=ContractorDeliverableRevisionFactory,
+                category=self.category)
+            for i in range(5)]
+        self.revisions = [doc.latest_revision for doc in self.docs]
+
+    def test_serializer_is_cached(self):
+        serializer = get_serializer(ContractorDeliverable)
+        self.assertIs(serializer, get_serializer(ContractorDeliverable))
+
+    def test_serialize_matches_legacy_to_json(self):
+        serializer = get_serializer(ContractorDeliverable)
+        for revision in self.revisions:
+            self.assertEqual(
+                serializer.serialize(revision),
+                legacy_to_json(revision))
+
+    def test_serialize_many_matches_legacy_to_json(self):
+        serializer = get_serializer(ContractorDeliverable)
+        data = serializer.serialize_many(self.revisions)
+        self.assertEqual(
+            data,
+            [legacy_to_json(revision) for revision in self.revisions])
+
+    def test_to_json(self):
+        revision = self.revisions[0]
+        self.assertEqual(revision.to_json(), legacy_to_json(revision))
+        self.assertEqual(
+            revision.to_json()['url'],
+            self.docs[0].get_absolute_url())
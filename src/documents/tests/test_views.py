@@ -2,8 +2,10 @@
 from __future__ import unicode_literals
 
 import os
+import json
+import shutil
 from io import BytesIO
-from zipfile import ZipFile
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
 
 from django.test import TestCase, override_settings
 from django.test.client import Client
@@ -11,6 +13,8 @@ from django.core.urlresolvers import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
 
+from mock import patch
+
 from accounts.factories import UserFactory
 from audit_trail.models import Activity
 from categories.factories import CategoryFactory
@@ -138,6 +142,22 @@ class DocumentDownloadTest(TestCase):
                 if os.path.isfile(file_path) and file_path.startswith('/tmp/'):
                     os.unlink(file_path)
 
+        archives_root = os.path.join(
+            settings.PRIVATE_ROOT, settings.ARCHIVES_SUBDIR)
+        if archives_root.startswith('/tmp/'):
+            shutil.rmtree(archives_root, ignore_errors=True)
+
+    def download(self, data):
+        """Post the download form, and wait for the archive."""
+        r = self.client.post(self.download_url, data)
+        self.assertEqual(r.status_code, 302)
+        r = self.client.get(r['Location'])
+        self.assertEqual(r.status_code, 200)
+        return r
+
+    def get_zip_file(self, response):
+        return ZipFile(BytesIO(b''.join(response.streaming_content)))
+
     def test_unique_document_download(self):
         """
         Tests that a document download returns a zip file of the latest revision.
@@ -154,18 +174,16 @@ class DocumentDownloadTest(TestCase):
                 'pdf_file': SimpleUploadedFile(pdf_doc, sample_path + pdf_doc),
             }
         )
-        c = self.client
-        r = c.post(self.download_url, {
+        r = self.download({
             'document_ids': document.id,
             'revisions': 'latest',
             'format': 'both',
         })
-        self.assertEqual(r.status_code, 200)
-        self.assertEqual(r._headers['vary'], ('Vary', 'Cookie, Accept-Encoding'))
-        self.assertEqual(r._headers['content-type'], ('Content-Type', 'application/zip'))
-        self.assertEqual(r._headers['content-disposition'], (
-            'Content-Disposition',
-            'attachment; filename=download.zip'))
+        self.assertEqual(r['Content-Type'], 'application/zip')
+        self.assertEqual(
+            r['Content-Disposition'],
+            'attachment; filename=download.zip')
+        self.assertEqual(len(self.get_zip_file(r).namelist()), 2)
 
     def test_empty_document_download(self):
         """
@@ -175,21 +193,14 @@ class DocumentDownloadTest(TestCase):
             document_key=u'HAZOP-related',
             category=self.category,
         )
-        r = self.client.post(self.download_url, {
+        r = self.download({
             'document_ids': [document.id],
             'revisions': 'latest',
             'format': 'both',
         })
-        self.assertEqual(r.status_code, 200)
-        self.assertEqual(r._headers, {
-            'content-length': ('Content-Length', '22'),
-            'content-type': ('Content-Type', 'application/zip'),
-            'vary': ('Vary', 'Cookie'),
-            'content-disposition': (
-                'Content-Disposition',
-                'attachment; filename=download.zip'
-            )
-        })
+        self.assertEqual(r['Content-Type'], 'application/zip')
+        self.assertEqual(r['Content-Length'], '22')
+        self.assertEqual(self.get_zip_file(r).namelist(), [])
 
     def test_all_revisions_document_download(self):
         """
@@ -215,16 +226,116 @@ class DocumentDownloadTest(TestCase):
             native_file=SimpleUploadedFile(native_doc, sample_path + native_doc),
             pdf_file=SimpleUploadedFile(pdf_doc, sample_path + pdf_doc),
         )
-        r = self.client.post(document.category.get_download_url(), {
+        r = self.download({
             'document_ids': document.id,
             'revisions': 'all',
             'format': 'both',
         })
+        filelist = self.get_zip_file(r).namelist()
+        self.assertEqual(len(filelist), 4)
+
+    def test_pdf_files_are_not_compressed(self):
+        sample_path = b'documents/tests/'
+        native_doc = b'sample_doc_native.docx'
+        pdf_doc = b'sample_doc_pdf.pdf'
+
+        document = DocumentFactory(
+            category=self.category,
+            revision={
+                'native_file': SimpleUploadedFile(native_doc, sample_path + native_doc),
+                'pdf_file': SimpleUploadedFile(pdf_doc, sample_path + pdf_doc),
+            }
+        )
+        r = self.download({
+            'document_ids': document.id,
+            'revisions': 'latest',
+            'format': 'both',
+        })
+        zip_file = self.get_zip_file(r)
+        self.assertIsNone(zip_file.testzip())
+        compress_types = dict(
+            (os.path.splitext(info.filename)[1], info.compress_type)
+            for info in zip_file.infolist())
+        self.assertEqual(compress_types, {
+            '.docx': ZIP_DEFLATED,
+            '.pdf': ZIP_STORED,
+        })
+
+    def test_archives_are_reused(self):
+        document = DocumentFactory(category=self.category)
+        data = {
+            'document_ids': document.id,
+            'revisions': 'latest',
+            'format': 'both',
+        }
+        self.download(data)
+
+        with patch('documents.tasks.build_archive.delay') as build_mock:
+            r = self.client.post(self.download_url, data)
+        self.assertFalse(build_mock.called)
+        self.assertNotIn('job_id', r['Location'])
+
+    def test_archive_is_built_asynchronously(self):
+        document = DocumentFactory(category=self.category)
+        with patch('documents.tasks.build_archive.delay') as build_mock:
+            build_mock.return_value.id = 'job-id'
+            r = self.client.post(
+                self.download_url, {
+                    'document_ids': document.id,
+                    'revisions': 'latest',
+                    'format': 'both',
+                },
+                HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertTrue(build_mock.called)
+        data = json.loads(r.content)
+        self.assertEqual(data['poll_url'], reverse('task_poll', args=['job-id']))
+
+        # The archive is not ready yet
+        r = self.client.get(data['download_url'])
         self.assertEqual(r.status_code, 200)
+        self.assertTemplateUsed(r, 'documents/archive_download.html')
 
-        zipfile = BytesIO(r.content)
-        filelist = ZipFile(zipfile).namelist()
-        self.assertEqual(len(filelist), 4)
+    def test_archive_access(self):
+        document = DocumentFactory(category=self.category)
+        r = self.client.post(self.download_url, {
+            'document_ids': document.id,
+            'revisions': 'latest',
+            'format': 'both',
+        })
+        download_url = r['Location']
+
+        other_user = UserFactory(email='other@phase.fr', password='pass',
+                                 category=self.category)
+        self.client.login(email=other_user.email, password='pass')
+        r = self.client.get(download_url)
+        self.assertEqual(r.status_code, 404)
+
+    def test_revisions_are_fetched_at_once(self):
+        sample_path = b'documents/tests/'
+        pdf_doc = b'sample_doc_pdf.pdf'
+
+        documents = []
+        for i in range(5):
+            document = DocumentFactory(category=self.category)
+            for revision in (2, 3):
+                MetadataRevisionFactory(
+                    metadata=document.get_metadata(),
+                    revision=revision,
+                    pdf_file=SimpleUploadedFile(pdf_doc, sample_path + pdf_doc),
+                )
+            documents.append(document)
+
+        with self.assertNumQueries(1):
+            files = DemoMetadata.get_archive_files(
+                Document.objects.filter(pk__in=[doc.pk for doc in documents]),
+                revisions='all', format='pdf')
+        self.assertEqual(len(files), 10)
+
+        with self.assertNumQueries(1):
+            files = DemoMetadata.get_archive_files(
+                Document.objects.filter(pk__in=[doc.pk for doc in documents]),
+                revisions='latest', format='pdf')
+        self.assertEqual(len(files), 5)
 
 
 class DocumentReviseTests(TestCase):
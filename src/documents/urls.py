@@ -3,7 +3,8 @@ from django.conf.urls import patterns, url
 from documents.views import (
     DocumentList, DocumentCreate, DocumentDetail, DocumentEdit,
     DocumentDownload, DocumentRedirect, DocumentRevise, DocumentDelete,
-    DocumentRevisionDelete, RevisionFileDownload, DocumentFileDownload
+    DocumentRevisionDelete, RevisionFileDownload, DocumentFileDownload,
+    ArchiveDownload
 )
 
 urlpatterns = patterns(
@@ -15,6 +16,9 @@ urlpatterns = patterns(
         name='document_short_url'),
 
     # Downloads
+    url(r'^archives/(?P<key>[0-9a-f]{40})/$',
+        ArchiveDownload.as_view(),
+        name='archive_download'),
     url(r'^(?P<organisation>[\w-]+)/(?P<category>[\w-]+)/download/$',
         DocumentDownload.as_view(),
         name="document_download"),
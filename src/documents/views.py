@@ -2,22 +2,23 @@
 from __future__ import unicode_literals
 
 import json
+from urllib import urlencode
 
 from django.utils import timezone
 from django.conf import settings
 from django.http import (
     HttpResponse, Http404, HttpResponseForbidden, HttpResponseRedirect
 )
-from django.core.servers.basehttp import FileWrapper
 from django.core.exceptions import PermissionDenied
 from django.views.generic import (
-    ListView, DetailView, RedirectView, DeleteView)
+    ListView, DetailView, RedirectView, DeleteView, TemplateView)
 from django.views.generic.edit import (
     ModelFormMixin, ProcessFormView, SingleObjectTemplateResponseMixin)
 from django.core.urlresolvers import reverse
 from django.shortcuts import get_object_or_404
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.contenttypes.models import ContentType
+from django.utils.text import get_valid_filename
 
 from braces.views import LoginRequiredMixin, PermissionRequiredMixin
 from rest_framework.renderers import JSONRenderer
@@ -30,12 +31,13 @@ from favorites.api.serializers import FavoriteSerializer
 from bookmarks.models import get_user_bookmarks
 from bookmarks.api.serializers import BookmarkSerializer
 from categories.views import CategoryMixin
+from documents.archives import Archive
 from documents.models import Document
 from documents.utils import save_document_forms
 from documents.forms.models import documentform_factory
 from documents.forms.filters import filterform_factory
 from notifications.models import notify
-from privatemedia.views import serve_model_file_field
+from privatemedia.views import serve_model_file_field, serve_private_file
 
 
 class DocumentListMixin(CategoryMixin):
@@ -582,7 +584,80 @@ class DocumentRevise(DocumentEdit):
         return context
 
 
-class DocumentDownload(BaseDocumentList):
+class ArchiveDownloadMixin(object):
+    """Download several files at once, in a zip archive.
+
+    The archive is built by a celery task, and the user is redirected to a
+    page that waits for it to be ready (see `ArchiveDownload`). Ajax requests
+    get the poll and download urls instead.
+
+    """
+    archive_name = 'download.zip'
+
+    # Only the last archives of a user can be downloaded
+    ARCHIVES_IN_SESSION = 20
+
+    def get_archive_files(self):
+        """Must return a list of `(file path, archive name)` pairs."""
+        raise NotImplementedError()
+
+    def get_archive(self):
+        return Archive(self.get_archive_files())
+
+    def archive_response(self, archive):
+        job = archive.start_build()
+
+        keys = self.request.session.get('archives', [])
+        if archive.key not in keys:
+            keys = keys[-(self.ARCHIVES_IN_SESSION - 1):] + [archive.key]
+            self.request.session['archives'] = keys
+
+        params = {'name': self.archive_name}
+        if job is not None:
+            params['job_id'] = job.id
+        download_url = '{}?{}'.format(
+            reverse('archive_download', args=[archive.key]),
+            urlencode(params))
+
+        if self.request.is_ajax():
+            data = {
+                'download_url': download_url,
+                'poll_url': reverse('task_poll', args=[job.id]) if job else None,
+            }
+            return HttpResponse(json.dumps(data), content_type='application/json')
+        return HttpResponseRedirect(download_url)
+
+
+class ArchiveDownload(LoginRequiredMixin, TemplateView):
+    """Serves an archive, or waits for it to be built."""
+    template_name = 'documents/archive_download.html'
+
+    def get(self, request, *args, **kwargs):
+        key = self.kwargs.get('key')
+        if key not in request.session.get('archives', []):
+            raise Http404('No such archive')
+
+        archive = Archive([], key=key)
+        name = get_valid_filename(request.GET.get('name', 'download.zip'))
+        if archive.exists():
+            return serve_private_file(archive.get_url(), name)
+
+        job_id = request.GET.get('job_id')
+        if not job_id:
+            raise Http404('This archive does not exist anymore')
+
+        return super(ArchiveDownload, self).get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super(ArchiveDownload, self).get_context_data(**kwargs)
+        context.update({
+            'archive_name': self.request.GET.get('name', 'download.zip'),
+            'poll_url': reverse('task_poll', args=[self.request.GET['job_id']]),
+        })
+        return context
+
+
+class DocumentDownload(ArchiveDownloadMixin, BaseDocumentList):
 
     def post(self, request, *args, **kwargs):
         _class = self.category.document_class()
@@ -594,17 +669,9 @@ class DocumentDownload(BaseDocumentList):
         else:
             raise Http404('Invalid parameters to download files.')
 
-        # Generates the temporary zip file
-        zip_filename = _class.compress_documents(data['document_ids'], **data)
-        zip_filename.seek(0)
-        wrapper = FileWrapper(zip_filename)
-
-        # Returns the zip file for download
-        response = HttpResponse(wrapper, content_type='application/zip')
-        response['Content-Disposition'] = 'attachment; filename=download.zip'
-        response['Content-Length'] = zip_filename.tell()
-        zip_filename.seek(0)
-        return response
+        # The zip file is built by a celery task
+        archive = _class.compress_documents(data['document_ids'], **data)
+        return self.archive_response(archive)
 
 
 class BaseFileDownload(LoginRequiredMixin, CategoryMixin, DetailView):
@@ -2,6 +2,8 @@
 from __future__ import unicode_literals
 import datetime as dt
 
+from django.utils import timezone
+
 from documents.models import MetadataRevisionBase
 from transmittals.utils import FieldWrapper
 from documents.utils import stringify_value as stringify
@@ -15,8 +17,8 @@ class BaseFormatter(object):
     """Base class for all formatters.
 
     A formatter is a class responsible for converting raw data
-    (i.e a queryset) into a format suitable for writing as is in
-    a file.
+    (i.e a queryset, or a list of `{field: value}` rows) into a format
+    suitable for writing as is in a file.
 
     """
     def __init__(self, fields):
@@ -48,6 +50,9 @@ class CSVFormatter(BaseFormatter):
     def prepare_data(self, doc):
         if isinstance(doc, list):
             data = doc
+        elif isinstance(doc, dict):
+            fields = self.fields.values()
+            data = [self.format_value(doc.get(field)) for field in fields]
         elif isinstance(doc, MetadataRevisionBase):
             doc = FieldWrapper((
                 doc,
@@ -72,6 +77,9 @@ class CSVFormatter(BaseFormatter):
         if callable(data):
             data = data()
 
+        return self.format_value(data)
+
+    def format_value(self, data):
         # We want dd-mm-yyy format for exports whereas
         if type(data) == dt.date:
             data = data.strftime(FR_DATE_FORMAT)
@@ -83,6 +91,19 @@ class CSVFormatter(BaseFormatter):
 
 
 class XLSXFormatter(CSVFormatter):
+    """Keeps dates as is, so they can be written as typed cells."""
+
+    def format_value(self, data):
+        if type(data) == dt.datetime:
+            if timezone.is_aware(data):
+                data = timezone.localtime(data).replace(tzinfo=None)
+            return data
+
+        if type(data) == dt.date:
+            return data
+
+        return super(XLSXFormatter, self).format_value(data)
+
     def format_doc(self, doc):
         return self.prepare_data(doc)
 
@@ -1,10 +1,175 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+from collections import OrderedDict
+from itertools import islice
+
 from django.conf import settings
+from django.db import models
+from django.db.models.fields import FieldDoesNotExist
+from django.utils.dateparse import parse_date, parse_datetime
 
 from accounts.models import Entity
+from documents.models import Document
+from documents.serializers import get_fields_to_index
+from search.backends import get_backend
 from search.builder import SearchBuilder
+from transmittals.utils import FieldWrapper
+
+
+def get_index_converter(model_field):
+    """Returns a function to convert indexed values back to python.
+
+    Dates are indexed as iso formatted strings.
+
+    """
+    if isinstance(model_field, models.DateTimeField):
+        parse = parse_datetime
+    elif isinstance(model_field, models.DateField):
+        parse = parse_date
+    else:
+        return lambda value: value
+
+    def convert(value):
+        if isinstance(value, basestring):
+            value = parse(value)
+        return value
+    return convert
+
+
+def chunked(iterable, size):
+    """Lazily splits an iterable into lists of `size` items."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class ExportProjection(object):
+    """Loads the exported fields of revisions, and nothing more.
+
+    Like with `FieldWrapper`, fields are looked up on the revision, then on
+    the metadata, then on the document.
+
+     * Indexed fields are read from the search hits `_source`.
+     * Db columns are fetched with a single `values` query, that only joins
+       the metadata and document tables when needed.
+     * Foreign keys are fetched by id, and displayed as text.
+     * Other attributes (properties, methods) require the revision
+       instances, that are only loaded when such fields are exported.
+
+    Rows are returned as `{field: value}` dicts.
+
+    """
+    PREFIXES = ('', 'metadata__', 'metadata__document__')
+
+    def __init__(self, revision_class, fields, indexed_fields=()):
+        self.revision_class = revision_class
+        metadata_class = revision_class._meta.get_field('metadata').rel.to
+        self.models = (revision_class, metadata_class, Document)
+
+        self.indexed = {}
+        self.columns = {}
+        self.foreign_keys = {}
+        self.computed = []
+        for field in fields:
+            prefix, model_field = self.find_field(field)
+            if prefix is None:
+                continue
+
+            if field in indexed_fields and \
+                    not isinstance(model_field, models.DecimalField):
+                # Decimals are indexed as floats, and would not be exported
+                # the same way
+                self.indexed[field] = get_index_converter(model_field)
+            elif model_field is None or not model_field.concrete:
+                self.computed.append(field)
+            elif model_field.is_relation:
+                self.foreign_keys[field] = (
+                    prefix + field, model_field.rel.to)
+            else:
+                self.columns[field] = prefix + field
+
+    def find_field(self, field):
+        """Returns the lookup prefix and the model field (if any).
+
+        The prefix is None if the field cannot be found at all.
+
+        """
+        for prefix, model in zip(self.PREFIXES, self.models):
+            try:
+                return prefix, model._meta.get_field(field)
+            except FieldDoesNotExist:
+                if hasattr(model, field):
+                    return prefix, None
+        return None, None
+
+    def get_rows(self, hits):
+        """Returns the rows of the given search hits, in the same order."""
+        rows = OrderedDict()
+        for hit in hits:
+            rows[hit.pk] = dict(
+                (field, convert(hit.get(field)))
+                for field, convert in self.indexed.items())
+        return self.load_rows(rows)
+
+    def get_db_rows(self, pks):
+        """Returns the rows of the given revisions, read from the db only."""
+        if self.indexed:
+            raise ValueError('Indexed fields can only be read from hits')
+
+        rows = OrderedDict((pk, {}) for pk in pks)
+        return self.load_rows(rows)
+
+    def load_rows(self, rows):
+        if self.columns or self.foreign_keys:
+            self.load_columns(rows)
+        self.load_computed(rows)
+        return rows.values()
+
+    def load_columns(self, rows):
+        paths = self.columns.values() + [
+            path for path, _ in self.foreign_keys.values()]
+        values = self.revision_class.objects \
+            .filter(pk__in=rows.keys()) \
+            .values('pk', *paths)
+
+        for value in values:
+            row = rows[value['pk']]
+            row.update(dict((field, value[path])
+                            for field, path in self.columns.items()))
+            row.update(dict((field, value[path])
+                            for field, (path, _) in self.foreign_keys.items()))
+
+        self.load_foreign_keys(rows.values())
+
+    def load_foreign_keys(self, rows):
+        """Replace foreign key ids with the related objects."""
+        for field, (_, model) in self.foreign_keys.items():
+            ids = set(row.get(field) for row in rows) - set([None])
+            related = model._default_manager.in_bulk(ids) if ids else {}
+            for row in rows:
+                row[field] = related.get(row.get(field))
+
+    def load_computed(self, rows):
+        if not self.computed:
+            return
+
+        revisions = self.revision_class.objects \
+            .filter(pk__in=rows.keys()) \
+            .select_related('metadata__document')
+        for revision in revisions:
+            wrapper = FieldWrapper((
+                revision,
+                revision.metadata,
+                revision.metadata.document))
+            row = rows[revision.pk]
+            for field in self.computed:
+                value = getattr(wrapper, field)
+                # Attributes and method can be passed
+                row[field] = value() if callable(value) else value
 
 
 class ExportGenerator(object):
@@ -13,24 +178,64 @@ class ExportGenerator(object):
     Use Elasticsearch and the db to efficiently (as far as possible) fetch data
     from a certain category filtered by the given filters.
 
+    Search hits are scrolled from the index, and rows are built by chunks,
+    so the memory usage does not depend on the export size.
+
+    With `EXPORTS_FROM_INDEX`, indexed fields are read from the hits
+    themselves, and only the other fields are loaded from the db.
+
+    The export can be restricted to a `(start_pk, end_pk)` range of
+    revisions, and the number of exported rows can be reported to a
+    `progress` object (see `exports.progress.ExportProgress`).
+
+    Delta exports only contain the revisions of a `documents.changes`
+    feed, followed by the deleted documents and revisions.
+
     Yields data in chunks.
 
     """
-    def __init__(self, category, filters, fields, owner=None):
+    def __init__(self, category, filters, fields, owner=None, pk_range=None,
+                 progress=None, changes=None):
         self.category = category
         self.fields = fields
+        self.chunk_size = settings.EXPORTS_CHUNK_SIZE
         self.filters = filters
         self.filters.update({
             'start': 0,
-            'size': 60000})
+            'size': self.chunk_size})
 
         self.owner = owner
+        self.pk_range = pk_range
+        self.progress = progress
+        self.changes = changes
 
     def __iter__(self):
-        self.pks, self.total = self.get_es_results()
-        self.start = -1
-        self.chunk_size = settings.EXPORTS_CHUNK_SIZE
-        return self
+        self.projection = ExportProjection(
+            self.category.revision_class(),
+            self.fields.values(),
+            self.get_indexed_fields())
+
+        yield self.data_header()
+        if self.changes is None:
+            chunks = (self.get_chunk(hits) for hits in
+                      chunked(self.iter_hits(), self.chunk_size))
+        else:
+            chunks = self.iter_changes()
+
+        for chunk in chunks:
+            if self.progress:
+                self.progress.add(len(chunk))
+            yield chunk
+
+    def get_indexed_fields(self):
+        """The exported fields that can be read from the index."""
+        if not settings.EXPORTS_FROM_INDEX:
+            return set()
+
+        metadata_class = self.category.document_class()
+        indexed = get_fields_to_index(metadata_class) | set((
+            'document_key', 'document_number'))
+        return indexed & set(self.fields.values())
 
     def get_entities(self):
         if not self.owner:
@@ -39,13 +244,7 @@ class ExportGenerator(object):
         return list(Entity.objects.filter(users=self.owner).
                     values_list('pk', flat=True))
 
-    def get_es_results(self):
-        """Perform initial doc search using elasticsearch.
-
-        Only return document ids, since the actual data export will use db.
-
-        """
-
+    def build_query(self, source=None):
         # For contractor accessing phase, we have to filter
         # OutgoingTransmittals according to recipient
         entities = self.get_entities()
@@ -53,46 +252,70 @@ class ExportGenerator(object):
             self.category,
             self.filters,
             filter_on_entities=entities)
-        result = builder.scan_results(['pk'], only_latest_revisions=True)
-        pks = [doc['pk'][0] for doc in result]
-        total = len(pks)
-        return pks, total
+        s = builder.build_query(only_latest_revisions=True, source=source)
+        if self.pk_range:
+            start_pk, end_pk = self.pk_range
+            s = s.filter('range', pk={'gt': start_pk, 'lte': end_pk})
+        return s
+
+    def count(self):
+        """The number of revisions to export."""
+        if self.changes is not None:
+            return self.changes.get_revisions().count() + \
+                self.changes.get_tombstones().count()
+
+        s = self.build_query().extra(size=0)
+        return get_backend().execute(s).hits.total
 
-    def __next__(self):
-        return self.next()
+    def iter_hits(self):
+        """Lazily yields the search hits of the revisions to export.
 
-    def next(self):
-        return self.next_data_chunk()
+        The search results are scrolled, so there is no limit to the number
+        of exported revisions.
 
-    def next_data_chunk(self):
-        """Actual next() implementation.
+        """
+        source = ['pk'] + sorted(self.projection.indexed.keys())
+        return get_backend().scan(self.build_query(source=source))
+
+    def iter_changes(self):
+        """Yields the rows of the changed revisions, then of the deletions.
 
-        Must return the next formatted chunk of data to be
-        dumped in the file.
+        Changed revisions are read from the db by pages, and the search
+        filters are applied to every page.
 
         """
-        if self.start == -1:
-            self.start = 0
-            return self.data_header()
+        source = ['pk'] + sorted(self.projection.indexed.keys())
+        while True:
+            pks = self.changes.next_revisions(self.chunk_size)
+            if not pks:
+                break
+
+            s = self.build_query(source=source).filter('terms', pk=pks)
+            chunk = self.get_chunk(get_backend().scan(s))
+            if chunk:
+                yield chunk
 
-        if self.start >= self.total:
-            raise StopIteration()
+        while True:
+            tombstones = self.changes.next_tombstones(self.chunk_size)
+            if not tombstones:
+                break
+            yield [self.get_tombstone_row(tombstone)
+                   for tombstone in tombstones]
 
-        chunk = self.get_chunk()
-        self.start += self.chunk_size
-        return chunk
+    def get_tombstone_row(self, tombstone):
+        return {
+            'document_key': tombstone.document_key,
+            'document_number': tombstone.document_number,
+            'revision': tombstone.revision,
+            'deleted_on': tombstone.deleted_on,
+        }
 
     def data_header(self):
         return
 
-    def get_chunk(self):
+    def get_chunk(self, hits):
         """Get a single piece of data."""
-        Model = self.category.revision_class()
-        pks = self.pks[self.start:self.start + self.chunk_size]
-        qs = Model.objects \
-            .filter(pk__in=pks) \
-            .select_related()
-        return qs
+        return self.projection.get_rows(hits)
 
 
 class CSVGenerator(ExportGenerator):
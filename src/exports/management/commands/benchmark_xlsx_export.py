@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+import logging
+import os
+import random
+import resource
+import shutil
+import tempfile
+from multiprocessing import Process, Queue
+from timeit import default_timer as timer
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from default_documents.models import ContractorDeliverable
+from exports.formatters import XLSXFormatter
+from exports.generators import chunked
+from exports.writers import write_xlsx
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_peak_rss():
+    """Peak resident memory of the current process, in KiB (on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_writer(queue, filepath, data_generator, formatter, write_only):
+    """Writes the file, and reports the time and memory usage."""
+    start_rss = get_peak_rss()
+    start = timer()
+    write_xlsx(filepath, data_generator, formatter, write_only=write_only)
+    queue.put((
+        timer() - start,
+        get_peak_rss() - start_rss,
+        os.path.getsize(filepath)))
+
+
+class Command(BaseCommand):
+    """Compare the write only xlsx writer with the in memory one.
+
+    Rows are generated on the fly with the `ContractorDeliverable` export
+    fields. Each writer runs in a process of its own, so the peak memory
+    usage of one run does not hide the other.
+
+    """
+    help = 'Benchmark the xlsx export writers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, default=50000,
+            help='Number of rows to export')
+        parser.add_argument(
+            '--seed', type=int, default=42,
+            help='Random seed used to generate the rows')
+
+    def handle(self, *args, **options):
+        fields = ContractorDeliverable.PhaseConfig.export_fields
+        self.stdout.write('{} rows x {} columns'.format(
+            options['rows'], len(fields)))
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for write_only in (False, True):
+                filepath = os.path.join(
+                    tmpdir, 'export_{}.xlsx'.format(write_only))
+                data_generator = self.generate_chunks(
+                    fields, options['rows'], options['seed'])
+                duration, rss, size = self.run(
+                    filepath, data_generator, XLSXFormatter(fields),
+                    write_only)
+                self.stdout.write(
+                    '{writer}: {duration:.1f} s, peak rss +{rss:.1f} MiB, '
+                    'file {size:.1f} MiB'.format(
+                        writer='write only' if write_only else 'in memory',
+                        duration=duration,
+                        rss=rss / 1024.0,
+                        size=size / 1024.0 / 1024.0))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def run(self, filepath, data_generator, formatter, write_only):
+        queue = Queue()
+        process = Process(target=run_writer, args=(
+            queue, filepath, data_generator, formatter, write_only))
+        process.start()
+        results = queue.get()
+        process.join()
+        return results
+
+    def generate_chunks(self, fields, nb_rows, seed):
+        """Lazily generates chunks of export rows."""
+        rand = random.Random(seed)
+        yield [fields.keys()]
+        rows = (self.generate_row(rand, fields) for _ in xrange(nb_rows))
+        for chunk in chunked(rows, settings.EXPORTS_CHUNK_SIZE):
+            yield chunk
+
+    def generate_row(self, rand, fields):
+        row = {}
+        for field in fields.values():
+            if field.endswith('date') or field == 'created_on':
+                value = datetime.date(2016, 1, 1) + datetime.timedelta(
+                    days=rand.randint(0, 1000))
+            elif field == 'weight':
+                value = rand.randint(0, 500)
+            else:
+                value = '{}-{:05d}'.format(field, rand.randint(0, 99999))
+            row[field] = value
+        return row
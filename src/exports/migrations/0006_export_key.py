@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exports', '0005_auto_20160322_1156'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='export',
+            name='key',
+            field=models.CharField(default='', max_length=40, blank=True, help_text='Exports with the same key have the same content', verbose_name='Key', db_index=True),
+        ),
+    ]
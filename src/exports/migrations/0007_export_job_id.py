@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exports', '0006_export_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='export',
+            name='job_id',
+            field=models.CharField(default='', help_text='Used to poll the export progress', max_length=50, verbose_name='Job id', blank=True),
+        ),
+    ]
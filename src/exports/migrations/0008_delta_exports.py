@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exports', '0007_export_job_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='export',
+            name='changed_since',
+            field=models.DateTimeField(help_text='Only export the changes after this date', null=True, verbose_name='Changed since', blank=True),
+        ),
+        migrations.AddField(
+            model_name='export',
+            name='changed_until',
+            field=models.DateTimeField(help_text='Use as the "changed since" date of the next export', null=True, verbose_name='Changed until', blank=True),
+        ),
+    ]
@@ -3,9 +3,13 @@ from __future__ import unicode_literals
 
 import os
 import uuid
+import shutil
+import hashlib
 import logging
+from collections import OrderedDict
 
 from django.db import models
+from django.db.models import Count, Max, Min
 from django.utils.translation import ugettext_lazy as _
 from django.utils import timezone
 from django.utils.module_loading import import_string
@@ -14,13 +18,50 @@ from django.core.urlresolvers import reverse
 from django.conf import settings
 
 from model_utils import Choices
-from openpyxl import Workbook
 
+from core.celery import my_dumps
+from documents.changes import ChangeFeed, get_watermark
+from documents.models import Document
 from exports.tasks import process_export
+from exports.writers import write_xlsx, merge_xlsx
+from search.caching import get_index_generation
 
 
 logger = logging.getLogger(__name__)
 
+# Those filters have no effect on the exported data
+IGNORED_FILTERS = ('csrfmiddlewaretoken', 'start', 'size', 'sort_by',
+                   'changed_since')
+
+
+class ExportQuerySet(models.QuerySet):
+    def delete(self):
+        """Delete exports, and the files that are not used anymore.
+
+        Exports with the same key share the same file, so the file is only
+        deleted with the last export that references it.
+
+        """
+        files = set((export.key, export.get_filepath()) for export in self)
+        super(ExportQuerySet, self).delete()
+
+        used_keys = set(Export.objects
+                        .filter(key__in=[key for key, _ in files if key])
+                        .values_list('key', flat=True))
+        for key, filepath in files:
+            if not key or key not in used_keys:
+                delete_export_file(filepath)
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
+def delete_export_file(filepath):
+    export_dir = os.path.realpath(settings.PRIVATE_ROOT)
+    filepath = os.path.realpath(filepath)
+    if os.path.exists(filepath) and filepath.startswith(export_dir):
+        logger.info('Removing export file {}'.format(filepath))
+        os.remove(filepath)
+
 
 class Export(models.Model):
     """Represents a document export request."""
@@ -56,6 +97,27 @@ class Export(models.Model):
     created_on = models.DateTimeField(
         _('Created on'),
         default=timezone.now)
+    changed_since = models.DateTimeField(
+        _('Changed since'),
+        null=True, blank=True,
+        help_text=_('Only export the changes after this date'))
+    changed_until = models.DateTimeField(
+        _('Changed until'),
+        null=True, blank=True,
+        help_text=_('Use as the "changed since" date of the next export'))
+    job_id = models.CharField(
+        _('Job id'),
+        max_length=50,
+        blank=True, default='',
+        help_text=_('Used to poll the export progress'))
+    key = models.CharField(
+        _('Key'),
+        max_length=40,
+        blank=True, default='',
+        db_index=True,
+        help_text=_('Exports with the same key have the same content'))
+
+    objects = ExportQuerySet.as_manager()
 
     class Meta:
         app_label = 'exports'
@@ -72,16 +134,85 @@ class Export(models.Model):
         """Parse querystring and returns a dict."""
         return QueryDict(self.querystring, mutable=True)
 
+    def get_normalized_filters(self):
+        """Filters as a sorted list, without empty or useless values."""
+        filters = self.get_filters()
+        normalized = []
+        for name in sorted(filters.keys()):
+            values = sorted(value for value in filters.getlist(name) if value)
+            if name not in IGNORED_FILTERS and values:
+                normalized.append((name, values))
+        return normalized
+
+    def get_data_generation(self):
+        """A value that changes every time the exported data may change."""
+        Revision = self.category.revision_class()
+        revisions = Revision.objects \
+            .filter(metadata__document__category=self.category) \
+            .aggregate(Max('updated_on'), Count('pk'))
+        documents = Document.objects \
+            .filter(category=self.category) \
+            .aggregate(Max('updated_on'), Count('pk'))
+        return (
+            sorted(revisions.items()),
+            sorted(documents.items()),
+            get_index_generation(self.category.document_type()))
+
+    def compute_key(self):
+        """Hash everything the content of the export depends on."""
+        data = my_dumps((
+            self.category_id,
+            self.format,
+            self.changed_since,
+            self.get_normalized_filters(),
+            list(self.get_fields().items()),
+            self.get_data_generation()))
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def get_reusable_export(self):
+        """Returns a finished export with the same content, if any."""
+        if not self.key:
+            return None
+
+        exports = Export.objects \
+            .filter(key=self.key) \
+            .filter(status=self.STATUSES.done) \
+            .exclude(pk=self.pk)
+        for export in exports:
+            if os.path.exists(export.get_filepath()):
+                return export
+        return None
+
     def get_fields(self):
-        """Get the list of fields that must be exported."""
+        """Get the list of fields that must be exported.
+
+        Delta exports have an additional column for deleted documents.
+
+        """
         default_fields = {
             'Document Number': 'document_key',
             'Title': 'title',
         }
         Model = self.category.document_class()
         fields = getattr(Model.PhaseConfig, 'export_fields', default_fields)
+        if self.is_delta():
+            fields = OrderedDict(fields)
+            fields['Deleted on'] = 'deleted_on'
         return fields
 
+    def is_delta(self):
+        return self.changed_since is not None
+
+    def get_changes(self):
+        """The change feed of delta exports."""
+        if not self.is_delta():
+            return None
+        return ChangeFeed(
+            self.category,
+            since=self.changed_since,
+            until=self.changed_until,
+            only_latest=True)
+
     def get_pretty_filename(self):
         """Return the filename as it should be downloaded."""
         return 'export_{time:%Y%m%d-%H%M}_{org}_{cat}.{exten}'.format(
@@ -91,6 +222,12 @@ class Export(models.Model):
             exten=self.format)
 
     def get_filename(self):
+        """Exports with the same key share the same file."""
+        if self.key:
+            return 'export_{key}.{exten}'.format(
+                key=self.key,
+                exten=self.format)
+
         return 'export_{time:%Y%m%d}_{uid}.{exten}'.format(
             time=self.created_on,
             uid=self.id,
@@ -111,53 +248,151 @@ class Export(models.Model):
             self.get_filedir(),
             self.get_filename())
 
+    def get_tmp_filepath(self):
+        """The file is written there, then moved when it's complete."""
+        return '{}.{}.tmp'.format(self.get_filepath(), self.id)
+
+    def get_shard_filepath(self, shard_index):
+        return '{}.{}.part'.format(self.get_tmp_filepath(), shard_index)
+
+    def get_poll_url(self):
+        """Where the export progress can be polled (see `TaskPollView`)."""
+        if not self.job_id:
+            return None
+        return reverse('task_poll', args=[self.job_id])
+
     def start_export(self, async=True, user_pk=None):
-        """Asynchronously starts the export"""
+        """Asynchronously starts the export.
+
+        If an identical export was already done, the file is reused right
+        away.
+
+        """
         logger.info('Starting export {}'.format(self.id))
+        if self.is_delta() and self.changed_until is None:
+            self.changed_until = get_watermark()
+        self.key = self.compute_key()
+        self.job_id = unicode(uuid.uuid4())
+        self.save()
+        if self.get_reusable_export() is not None:
+            async = False
+
         if async:
             process_export.delay(unicode(self.pk), user_pk=user_pk)
         else:
             process_export(unicode(self.pk), user_pk=user_pk)
 
-    def csv_file_writer(self, data_generator, formatter):
-        with self.open_file() as the_file:
+    def get_shards(self):
+        """Split the export into pk ranges of (roughly) the same width.
+
+        Returns a list of `(start_pk, end_pk)` ranges, or `[None]` if the
+        export is too small to be split.
+
+        """
+        # Delta exports are small
+        if self.is_delta():
+            return [None]
+
+        Revision = self.category.revision_class()
+        pks = Revision.objects \
+            .filter(metadata__document__category=self.category) \
+            .aggregate(min_pk=Min('pk'), max_pk=Max('pk'), count=Count('pk'))
+        nb_shards = min(
+            pks['count'] // settings.EXPORTS_SHARD_SIZE,
+            settings.EXPORTS_MAX_SHARDS)
+        if nb_shards < 2:
+            return [None]
+
+        start = pks['min_pk'] - 1
+        end = pks['max_pk']
+        width = max((end - start) // nb_shards, 1)
+        shards = []
+        while start < end:
+            range_end = end if end - start < 2 * width else start + width
+            shards.append((start, range_end))
+            start = range_end
+        return shards
+
+    def csv_file_writer(self, data_generator, formatter, filepath):
+        with open(filepath, 'wb') as the_file:
             for data_chunk in data_generator:
                 the_file.write(formatter.format(data_chunk))
 
-    def xlsx_file_writer(self, data_generator, formatter):
-        wb = Workbook()
-        ws = wb.active
-        for data_chunk in data_generator:
-            formatted = formatter.format(data_chunk)
-            for el in formatted:
-                ws.append(el)
-        wb.save(self.get_filepath())
-
-    def write_file(self):
-        """Generates and write the file."""
-        data_generator = self.get_data_generator()
+    def xlsx_file_writer(self, data_generator, formatter, filepath):
+        write_xlsx(filepath, data_generator, formatter)
+
+    def csv_file_merger(self, header, formatter, filepaths, filepath):
+        with open(filepath, 'wb') as the_file:
+            the_file.write(formatter.format(header))
+            for part_filepath in filepaths:
+                with open(part_filepath, 'rb') as part_file:
+                    shutil.copyfileobj(part_file, the_file)
+
+    def xlsx_file_merger(self, header, formatter, filepaths, filepath):
+        merge_xlsx(filepath, formatter.format(header), filepaths)
+
+    def write_file(self, progress=None):
+        """Generates and write the file.
+
+        The file is written under a temporary name, so an identical export
+        that runs at the same time cannot see an incomplete file.
+
+        """
+        data_generator = self.get_data_generator(progress=progress)
         formatter = self.get_data_formatter()
 
+        self.create_filedir()
         file_writer_name = '{}_file_writer'.format(self.format)
         file_writer = getattr(self, file_writer_name)
-        file_writer(data_generator, formatter)
+        file_writer(data_generator, formatter, self.get_tmp_filepath())
+        os.rename(self.get_tmp_filepath(), self.get_filepath())
         logger.info('Import {} done'.format(self.id))
 
-    def open_file(self):
-        """Opens the file in which data should be dumped."""
+    def write_shard(self, shard_index, pk_range, progress=None):
+        """Write the rows of a single pk range, without the header."""
+        data_generator = self.get_data_generator(
+            pk_range=pk_range, progress=progress)
+        formatter = self.get_data_formatter()
+
+        # The header is written when shards are merged
+        data_chunks = iter(data_generator)
+        next(data_chunks)
+
+        self.create_filedir()
+        file_writer_name = '{}_file_writer'.format(self.format)
+        file_writer = getattr(self, file_writer_name)
+        file_writer(data_chunks, formatter,
+                    self.get_shard_filepath(shard_index))
+
+    def merge_shards(self, nb_shards):
+        """Concatenate the shard files into the final export file."""
+        data_generator = self.get_data_generator()
+        formatter = self.get_data_formatter()
+        filepaths = [self.get_shard_filepath(shard_index)
+                     for shard_index in range(nb_shards)]
+
+        file_merger_name = '{}_file_merger'.format(self.format)
+        file_merger = getattr(self, file_merger_name)
+        file_merger(data_generator.data_header(), formatter, filepaths,
+                    self.get_tmp_filepath())
+        os.rename(self.get_tmp_filepath(), self.get_filepath())
+        for filepath in filepaths:
+            os.remove(filepath)
+        logger.info('Import {} done'.format(self.id))
 
-        # Create the export dir if it does not exist
+    def create_filedir(self):
+        """Create the export dir if it does not exist."""
         export_dir = self.get_filedir()
         if not os.path.exists(export_dir):
             os.makedirs(export_dir)
 
-        return open(self.get_filepath(), 'wb')
-
-    def get_data_generator(self):
+    def get_data_generator(self, pk_range=None, progress=None):
         """Returns a generator that yields chunks of data to export."""
         generator_class = 'exports.generators.{}Generator'.format(self.format.upper())
         Generator = import_string(generator_class)
-        generator = Generator(self.category, self.get_filters(), self.get_fields())
+        generator = Generator(
+            self.category, self.get_filters(), self.get_fields(),
+            pk_range=pk_range, progress=progress, changes=self.get_changes())
         return generator
 
     def get_data_formatter(self):
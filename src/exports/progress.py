@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+
+from django.core.cache import cache
+
+from celery import states
+
+from core.celery import app
+
+
+# Progress data is kept a day at most, if an export is never finished
+PROGRESS_TIMEOUT = 24 * 60 * 60
+
+
+class ExportProgress(object):
+    """Publishes the progress of an export, to be polled with `TaskPollView`.
+
+    An export can be split into shards, written by different workers, so
+    the number of exported rows is shared through the cache. The progress
+    is stored in the result backend, as the state of the export `job_id`.
+
+    """
+    def __init__(self, export):
+        self.job_id = export.job_id
+        self.count_key = 'export_progress_count_{}'.format(export.id)
+        self.info_key = 'export_progress_info_{}'.format(export.id)
+
+    def start(self, total):
+        cache.set(self.count_key, 0, PROGRESS_TIMEOUT)
+        cache.set(self.info_key, (total, time.time()), PROGRESS_TIMEOUT)
+        self.publish(0, None)
+
+    def add(self, nb_rows):
+        """Report that `nb_rows` more rows were exported."""
+        info = cache.get(self.info_key)
+        if info is None:
+            return
+
+        total, start_time = info
+        try:
+            count = cache.incr(self.count_key, nb_rows)
+        except ValueError:
+            return
+
+        progress = min(float(count) / total * 100, 100) if total else 100
+        elapsed = time.time() - start_time
+        eta = elapsed * (total - count) / count if count else None
+        self.publish(progress, eta)
+
+    def publish(self, progress, eta):
+        if not self.job_id:
+            return
+
+        app.backend.store_result(
+            self.job_id,
+            {'progress': progress, 'eta': eta},
+            'PROGRESS')
+
+    def finish(self):
+        cache.delete_many([self.count_key, self.info_key])
+        if self.job_id:
+            app.backend.store_result(
+                self.job_id,
+                {'progress': 100, 'eta': 0},
+                states.SUCCESS)
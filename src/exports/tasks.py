@@ -1,13 +1,21 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import logging
+
 from django.conf import settings
 
+from celery import chord
+
 from core.celery import app
 
 from accounts.models import User
 from audit_trail.models import Activity
 from audit_trail.signals import activity_log
+from exports.progress import ExportProgress
+
+
+logger = logging.getLogger(__name__)
 
 
 @app.task
@@ -15,7 +23,8 @@ def process_export(export_id, user_pk=None):
     from exports.models import Export
     export = Export.objects.select_related().get(id=export_id)
 
-    # Cleanup oldest export when there are too many
+    # Cleanup oldest export when there are too many. Their files are only
+    # removed if no other export uses them.
     owner = export.owner
     oldest_exports_qs = Export.objects \
         .filter(owner=owner) \
@@ -29,12 +38,55 @@ def process_export(export_id, user_pk=None):
             .filter(owner=owner) \
             .filter(created_on__lt=oldest_export.created_on) \
             .delete()
-    user = User.objects.get(pk=user_pk)
     export.status = 'processing'
     export.save()
-    export.write_file()
+    if export.get_reusable_export() is not None:
+        logger.info('Reusing the file of an identical export')
+        finish_export(export_id, user_pk=user_pk)
+        return
+
+    progress = ExportProgress(export)
+    progress.start(export.get_data_generator().count())
+
+    shards = export.get_shards()
+    if len(shards) == 1:
+        export.write_file(progress=progress)
+        finish_export(export_id, user_pk=user_pk)
+    else:
+        # Shards are written in parallel, then merged
+        logger.info('Splitting export {} into {} shards'.format(
+            export_id, len(shards)))
+        header = [
+            export_shard.si(export_id, shard_index, pk_range)
+            for shard_index, pk_range in enumerate(shards)]
+        callback = merge_export_shards.si(
+            export_id, len(shards), user_pk=user_pk)
+        chord(header)(callback)
+
+
+@app.task
+def export_shard(export_id, shard_index, pk_range):
+    from exports.models import Export
+    export = Export.objects.select_related().get(id=export_id)
+    export.write_shard(shard_index, pk_range, progress=ExportProgress(export))
+
+
+@app.task
+def merge_export_shards(export_id, nb_shards, user_pk=None):
+    from exports.models import Export
+    export = Export.objects.select_related().get(id=export_id)
+    export.merge_shards(nb_shards)
+    finish_export(export_id, user_pk=user_pk)
+
+
+def finish_export(export_id, user_pk=None):
+    from exports.models import Export
+    export = Export.objects.select_related().get(id=export_id)
     export.status = 'done'
     export.save()
+    ExportProgress(export).finish()
+
+    user = User.objects.get(pk=user_pk)
     activity_log.send(verb=Activity.VERB_CREATED,
                       action_object_str=export.get_pretty_filename(),
                       sender=None,
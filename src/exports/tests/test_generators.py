@@ -3,53 +3,80 @@ from __future__ import unicode_literals
 
 from collections import OrderedDict
 
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.contenttypes.models import ContentType
 
-from mock import MagicMock
-
+from accounts.factories import UserFactory
 from documents.factories import DocumentFactory
 from categories.factories import CategoryFactory
 from default_documents.factories import (
     ContractorDeliverableFactory, ContractorDeliverableRevisionFactory)
 from default_documents.models import ContractorDeliverable
+from exports.formatters import CSVFormatter
 from exports.generators import ExportGenerator, CSVGenerator
+from search.utils import (
+    create_index, delete_index, put_category_mapping, index_revisions)
 
 
 class ExportGeneratorTests(TestCase):
     def setUp(self):
         Model = ContentType.objects.get_for_model(ContractorDeliverable)
         self.category = CategoryFactory(category_template__metadata_model=Model)
-        self.docs = (
+        self.docs = [
             DocumentFactory(
                 metadata_factory_class=ContractorDeliverableFactory,
                 revision_factory_class=ContractorDeliverableRevisionFactory,
                 category=self.category)
-            for i in range(1, 20))
+            for i in range(1, 20)]
+        self.revisions = [doc.get_latest_revision() for doc in self.docs]
+        self.revisions[0].leader = UserFactory(name='Grand Schtroumpf')
+        self.revisions[0].save()
+
+        delete_index()
+        create_index()
+        put_category_mapping(self.category.pk)
+        index_revisions(self.revisions)
+
+    def tearDown(self):
+        delete_index()
+
+    def export(self, fields):
+        generator = ExportGenerator(self.category, {}, fields)
+        chunks = list(generator)[1:]
+        return [row for chunk in chunks for row in chunk]
+
+    def export_queries(self, fields):
+        """Number of queries run to load the rows.
 
-        self.es_mock = MagicMock(return_value=(
-            [doc.latest_revision.pk for doc in self.docs],
-            20
-        ))
+        Queries that do not depend on the exported fields (e.g the filter
+        form validation) are not counted.
+
+        """
+        with CaptureQueriesContext(connection) as base_queries:
+            self.export({})
+        with CaptureQueriesContext(connection) as queries:
+            self.export(fields)
+        return len(queries) - len(base_queries)
 
     @override_settings(EXPORTS_CHUNK_SIZE=5)
     def test_generator_iterator(self):
         generator = ExportGenerator(self.category, {}, {})
-        generator.get_es_results = self.es_mock
         iterator = iter(generator)
         chunk = iterator.next()  # header
 
         chunk = iterator.next()
-        self.assertEqual(chunk.count(), 5)
+        self.assertEqual(len(chunk), 5)
 
         chunk = iterator.next()
-        self.assertEqual(chunk.count(), 5)
+        self.assertEqual(len(chunk), 5)
 
         chunk = iterator.next()
-        self.assertEqual(chunk.count(), 5)
+        self.assertEqual(len(chunk), 5)
 
         chunk = iterator.next()
-        self.assertEqual(chunk.count(), 4)
+        self.assertEqual(len(chunk), 4)
 
         with self.assertRaises(StopIteration):
             chunk = iterator.next()
@@ -59,7 +86,54 @@ class ExportGeneratorTests(TestCase):
             ('Title', 'title'),
             ('Document number', 'document_key')))
         generator = CSVGenerator(self.category, {}, fields)
-        generator.get_es_results = self.es_mock
         iterator = iter(generator)
         chunk = iterator.next()
         self.assertEqual(chunk, [['Title', 'Document number']])
+
+    def assertRowsEqualRevisions(self, rows, fields):
+        """Rows are formatted like the revisions themselves."""
+        self.assertEqual(len(rows), 19)
+        formatter = CSVFormatter(fields)
+        self.assertEqual(
+            sorted(formatter.format(rows).splitlines()),
+            sorted(formatter.format(self.revisions).splitlines()))
+        self.assertIn('Grand Schtroumpf', formatter.format(rows))
+
+    def test_export_rows(self):
+        fields = ContractorDeliverable.PhaseConfig.export_fields
+        self.assertRowsEqualRevisions(self.export(fields), fields)
+
+    @override_settings(EXPORTS_FROM_INDEX=False)
+    def test_export_rows_from_db(self):
+        fields = ContractorDeliverable.PhaseConfig.export_fields
+        self.assertRowsEqualRevisions(self.export(fields), fields)
+
+    def test_indexed_fields_export(self):
+        fields = OrderedDict((
+            ('Document number', 'document_number'),
+            ('Leader', 'leader'),
+            ('Review due date', 'review_due_date')))
+        self.assertEqual(self.export_queries(fields), 0)
+        self.assertRowsEqualRevisions(self.export(fields), fields)
+
+    def test_missing_fields_are_fetched_from_db(self):
+        fields = OrderedDict((
+            ('Document number', 'document_number'),
+            ('Leader', 'leader'),
+            ('Revision date', 'revision_date'),
+            ('Originator', 'originator')))
+
+        # A single values query, and one for the originators
+        self.assertEqual(self.export_queries(fields), 2)
+        self.assertRowsEqualRevisions(self.export(fields), fields)
+
+    @override_settings(EXPORTS_FROM_INDEX=False)
+    def test_db_export(self):
+        fields = OrderedDict((
+            ('Document number', 'document_number'),
+            ('Leader', 'leader'),
+            ('Revision date', 'revision_date')))
+
+        # A single values query, and one for the leaders
+        self.assertEqual(self.export_queries(fields), 2)
+        self.assertRowsEqualRevisions(self.export(fields), fields)
@@ -2,16 +2,35 @@
 from __future__ import unicode_literals
 
 import datetime
+import os
+import shutil
+import tempfile
 from uuid import UUID
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.utils import timezone
 from django.utils.timezone import UTC
+from django.contrib.contenttypes.models import ContentType
+
+from mock import patch
+from celery.result import AsyncResult
+from openpyxl import load_workbook
 
 from categories.factories import CategoryFactory
 from accounts.factories import UserFactory
+from documents.factories import DocumentFactory
+from documents.models import Document
 from exports.factories import ExportFactory
+from exports.models import Export
 from exports.generators import ExportGenerator
 from exports.formatters import CSVFormatter
+from exports.progress import ExportProgress
+from default_documents.factories import (
+    ContractorDeliverableFactory, ContractorDeliverableRevisionFactory)
+from default_documents.models import (
+    ContractorDeliverable, ContractorDeliverableRevision)
+from search.utils import (
+    create_index, delete_index, put_category_mapping, index_revisions)
 
 
 class ExportTests(TestCase):
@@ -57,3 +76,246 @@ class ExportTests(TestCase):
         self.assertEqual(filters['toto'], 'riri')
         self.assertEqual(filters['tata'], 'fifi')
         self.assertEqual(filters['tutu'], 'loulou')
+
+
+class ExportReuseTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.settings_override = override_settings(PRIVATE_ROOT=self.tmpdir)
+        self.settings_override.enable()
+
+        self.category = CategoryFactory()
+        self.user = UserFactory(category=self.category)
+        self.other_user = UserFactory(category=self.category)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.tmpdir)
+
+    def create_export(self, **kwargs):
+        data = {
+            'owner': self.user,
+            'category': self.category,
+            'querystring': 'title=toto&status=STD'}
+        data.update(kwargs)
+        return ExportFactory(**data)
+
+    def start_export(self, export):
+        export.start_export(async=False, user_pk=export.owner.pk)
+        return Export.objects.get(pk=export.pk)
+
+    def test_same_content_same_key(self):
+        export = self.create_export()
+        same_export = self.create_export(
+            owner=self.other_user,
+            querystring='status=STD&title=toto&start=50&leader=')
+        self.assertEqual(export.compute_key(), same_export.compute_key())
+
+        other_export = self.create_export(querystring='title=tata')
+        self.assertNotEqual(export.compute_key(), other_export.compute_key())
+
+        other_export = self.create_export(format='xlsx')
+        self.assertNotEqual(export.compute_key(), other_export.compute_key())
+
+    def test_key_changes_with_data(self):
+        export = self.create_export()
+        key = export.compute_key()
+        DocumentFactory(category=self.category)
+        self.assertNotEqual(export.compute_key(), key)
+
+    def test_reuse_export_file(self):
+        export = self.start_export(self.create_export())
+        self.assertTrue(export.is_ready())
+        self.assertTrue(os.path.exists(export.get_filepath()))
+
+        same_export = self.create_export(owner=self.other_user)
+        with patch.object(Export, 'write_file') as write_file_mock:
+            same_export = self.start_export(same_export)
+        self.assertFalse(write_file_mock.called)
+        self.assertTrue(same_export.is_ready())
+        self.assertEqual(export.get_filepath(), same_export.get_filepath())
+
+    def test_files_are_reference_counted(self):
+        export = self.start_export(self.create_export())
+        same_export = self.start_export(
+            self.create_export(owner=self.other_user))
+        filepath = export.get_filepath()
+
+        Export.objects.filter(pk=export.pk).delete()
+        self.assertTrue(os.path.exists(filepath))
+
+        Export.objects.filter(pk=same_export.pk).delete()
+        self.assertFalse(os.path.exists(filepath))
+
+
+@override_settings(EXPORTS_SHARD_SIZE=5, EXPORTS_MAX_SHARDS=3)
+class ExportShardTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.settings_override = override_settings(PRIVATE_ROOT=self.tmpdir)
+        self.settings_override.enable()
+
+        Model = ContentType.objects.get_for_model(ContractorDeliverable)
+        self.category = CategoryFactory(category_template__metadata_model=Model)
+        self.user = UserFactory(category=self.category)
+        docs = [
+            DocumentFactory(
+                metadata_factory_class=ContractorDeliverableFactory,
+                revision_factory_class=ContractorDeliverableRevisionFactory,
+                category=self.category)
+            for i in range(19)]
+        self.revisions = [doc.get_latest_revision() for doc in docs]
+
+        delete_index()
+        create_index()
+        put_category_mapping(self.category.pk)
+        index_revisions(self.revisions)
+
+    def tearDown(self):
+        delete_index()
+        self.settings_override.disable()
+        shutil.rmtree(self.tmpdir)
+
+    def create_export(self, **kwargs):
+        data = {
+            'owner': self.user,
+            'category': self.category,
+            'querystring': ''}
+        data.update(kwargs)
+        return ExportFactory(**data)
+
+    def export_unsharded(self, export):
+        """Write the same export in a single file."""
+        other_export = self.create_export(format=export.format)
+        other_export.write_file()
+        return other_export.get_filepath()
+
+    def test_get_shards(self):
+        export = self.create_export()
+        shards = export.get_shards()
+        self.assertEqual(len(shards), 3)
+
+        pks = sorted(revision.pk for revision in self.revisions)
+        self.assertEqual(shards[0][0], pks[0] - 1)
+        self.assertEqual(shards[-1][1], pks[-1])
+        for (_, end), (start, _) in zip(shards, shards[1:]):
+            self.assertEqual(end, start)
+
+    @override_settings(EXPORTS_SHARD_SIZE=20)
+    def test_small_export_is_not_split(self):
+        export = self.create_export()
+        self.assertEqual(export.get_shards(), [None])
+
+    def test_sharded_csv_export(self):
+        export = self.create_export(format='csv')
+        export.start_export(async=False, user_pk=self.user.pk)
+        export = Export.objects.get(pk=export.pk)
+        self.assertTrue(export.is_ready())
+
+        with open(export.get_filepath()) as sharded_file:
+            lines = sharded_file.read().splitlines()
+        with open(self.export_unsharded(export)) as the_file:
+            expected = the_file.read().splitlines()
+
+        self.assertEqual(len(lines), 20)
+        self.assertEqual(lines[0], expected[0])
+        self.assertEqual(sorted(lines[1:]), sorted(expected[1:]))
+
+        # Shard files are removed once merged
+        self.assertFalse([
+            filename for filename in os.listdir(export.get_filedir())
+            if filename.endswith('.part')])
+
+    def test_sharded_xlsx_export(self):
+        export = self.create_export(format='xlsx')
+        export.start_export(async=False, user_pk=self.user.pk)
+        export = Export.objects.get(pk=export.pk)
+
+        def read_rows(filepath):
+            ws = load_workbook(filepath).active
+            return [[(cell.value, cell.number_format) for cell in row]
+                    for row in ws.rows]
+
+        rows = read_rows(export.get_filepath())
+        expected = read_rows(self.export_unsharded(export))
+        self.assertEqual(len(rows), 20)
+        self.assertEqual(rows[0], expected[0])
+        self.assertEqual(sorted(rows[1:]), sorted(expected[1:]))
+
+    def test_progress_is_published(self):
+        export = self.create_export()
+        export.start_export(async=False, user_pk=self.user.pk)
+        result = AsyncResult(export.job_id)
+        self.assertEqual(result.state, 'SUCCESS')
+        self.assertEqual(result.result['progress'], 100)
+
+    def test_progress_eta(self):
+        export = self.create_export(job_id='test-job')
+        progress = ExportProgress(export)
+        progress.start(10)
+        progress.add(4)
+        result = AsyncResult('test-job')
+        self.assertEqual(result.state, 'PROGRESS')
+        self.assertEqual(result.result['progress'], 40)
+        self.assertIsNotNone(result.result['eta'])
+
+
+class ExportDeltaTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.settings_override = override_settings(PRIVATE_ROOT=self.tmpdir)
+        self.settings_override.enable()
+
+        Model = ContentType.objects.get_for_model(ContractorDeliverable)
+        self.category = CategoryFactory(category_template__metadata_model=Model)
+        self.user = UserFactory(category=self.category)
+        self.docs = [
+            DocumentFactory(
+                metadata_factory_class=ContractorDeliverableFactory,
+                revision_factory_class=ContractorDeliverableRevisionFactory,
+                category=self.category)
+            for i in range(4)]
+        revisions = [doc.get_latest_revision() for doc in self.docs]
+
+        delete_index()
+        create_index()
+        put_category_mapping(self.category.pk)
+        index_revisions(revisions)
+
+        self.since = timezone.now()
+        last_week = self.since - datetime.timedelta(days=7)
+        Document.objects.update(updated_on=last_week)
+        ContractorDeliverableRevision.objects.update(updated_on=last_week)
+
+    def tearDown(self):
+        delete_index()
+        self.settings_override.disable()
+        shutil.rmtree(self.tmpdir)
+
+    @override_settings(CHANGES_SAFETY_LAG=0)
+    def test_delta_csv_export(self):
+        changed = self.docs[0].get_latest_revision()
+        changed.save()
+        deleted = self.docs[1]
+        deleted.delete()
+
+        export = ExportFactory(
+            owner=self.user,
+            category=self.category,
+            querystring='',
+            format='csv',
+            changed_since=self.since)
+        export.start_export(async=False, user_pk=self.user.pk)
+        export = Export.objects.get(pk=export.pk)
+        self.assertTrue(export.is_delta())
+        self.assertIsNotNone(export.changed_until)
+
+        with open(export.get_filepath()) as the_file:
+            lines = the_file.read().decode('utf-8').splitlines()
+
+        # Header, changed revision, deleted revision and document
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].endswith('Deleted on'))
+        self.assertIn(self.docs[0].document_number, lines[1])
+        self.assertTrue(all(deleted.document_number in line
+                            for line in lines[2:]))
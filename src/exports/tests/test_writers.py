@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+
+from django.test import TestCase
+from django.utils import timezone
+
+from openpyxl import load_workbook
+
+from exports.formatters import XLSXFormatter
+from exports.writers import write_xlsx
+
+
+class XLSXWriterTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fields = OrderedDict((
+            ('Title', 'title'),
+            ('Weight', 'weight'),
+            ('Received date', 'received_date'),
+            ('Created on', 'created_on'),
+        ))
+        self.chunks = [
+            [self.fields.keys()],
+            [{
+                'title': 'Hello',
+                'weight': 10,
+                'received_date': datetime.date(2016, 5, 4),
+                'created_on': datetime.datetime(
+                    2016, 5, 4, 10, 20, tzinfo=timezone.utc),
+            }, {
+                'title': 'World',
+                'weight': None,
+                'received_date': None,
+                'created_on': None,
+            }],
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, write_only):
+        filepath = os.path.join(self.tmpdir, 'export.xlsx')
+        write_xlsx(filepath, iter(self.chunks), XLSXFormatter(self.fields),
+                   write_only=write_only)
+        ws = load_workbook(filepath).active
+        return [[(cell.value, cell.number_format) for cell in row]
+                for row in ws.rows]
+
+    def test_write_only(self):
+        rows = self.write(write_only=True)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(
+            [value for value, _ in rows[0]],
+            ['Title', 'Weight', 'Received date', 'Created on'])
+        self.assertEqual(rows[1], [
+            ('Hello', 'General'),
+            ('10', 'General'),
+            (datetime.datetime(2016, 5, 4), 'dd-mm-yyyy'),
+            (datetime.datetime(2016, 5, 4, 12, 20), 'dd-mm-yyyy hh:mm'),
+        ])
+        self.assertEqual(rows[2][0], ('World', 'General'))
+        self.assertEqual(rows[2][1][0], '')
+
+    def test_in_memory(self):
+        rows = self.write(write_only=False)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1][2:], [
+            (datetime.datetime(2016, 5, 4), 'dd-mm-yyyy'),
+            (datetime.datetime(2016, 5, 4, 12, 20), 'dd-mm-yyyy hh:mm'),
+        ])
+
+    def test_writers_values(self):
+        self.assertEqual(self.write(True), self.write(False))
@@ -2,6 +2,7 @@
 from __future__ import unicode_literals
 
 import os
+import datetime
 
 from django.views.generic import ListView, UpdateView, View
 from django.utils.translation import ugettext_lazy as _
@@ -10,6 +11,8 @@ from django.http import HttpResponse, Http404
 from django.views.static import serve
 from django.shortcuts import get_object_or_404
 from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 
 from braces.views import LoginRequiredMixin
 
@@ -41,6 +44,7 @@ class ExportCreate(LoginRequiredMixin, DocumentListMixin, UpdateView):
         qd.pop('start', None)
         qd.pop('size', None)
         qd.pop('sort_by', None)
+        qd.pop('changed_since', None)
         kwargs = super(ExportCreate, self).get_form_kwargs()
         kwargs.update({'data': {
             'querystring': qd.urlencode()
@@ -53,9 +57,26 @@ class ExportCreate(LoginRequiredMixin, DocumentListMixin, UpdateView):
         export = Export(
             owner=self.request.user,
             category=self.category,
-            format=export_format)
+            format=export_format,
+            changed_since=self.get_changed_since())
         return export
 
+    def get_changed_since(self):
+        """Delta exports only contain the changes after this date."""
+        changed_since = self.request.POST.get('changed_since')
+        if not changed_since:
+            return None
+
+        value = parse_datetime(changed_since)
+        if value is None:
+            date = parse_date(changed_since)
+            if date is None:
+                raise Http404('Invalid "changed since" date')
+            value = datetime.datetime.combine(date, datetime.time())
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value, timezone.get_current_timezone())
+        return value
+
     def get_success_url(self):
         return self.category.get_absolute_url()
 
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime as dt
+
+from django.conf import settings
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.date_time import to_excel
+from openpyxl.writer.dump_worksheet import WriteOnlyCell
+
+XLSX_DATE_FORMAT = 'dd-mm-yyyy'
+XLSX_DATETIME_FORMAT = 'dd-mm-yyyy hh:mm'
+
+
+def get_number_format(value):
+    """Returns the number format of date values, or None."""
+    if isinstance(value, dt.datetime):
+        return XLSX_DATETIME_FORMAT
+    elif isinstance(value, dt.date):
+        return XLSX_DATE_FORMAT
+    return None
+
+
+class DateCells(object):
+    """Builds typed date cells for a write only worksheet.
+
+    Dates need a cell of their own, since the number format cannot be set
+    on the cell that is shared by all other values. Setting a number format
+    builds and looks up a new style, so the style of each format is only
+    computed once.
+
+    """
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+        self.styles = {}
+
+    def get_style(self, number_format):
+        if number_format not in self.styles:
+            cell = WriteOnlyCell(self.worksheet)
+            cell.number_format = number_format
+            self.styles[number_format] = cell._style
+        return self.styles[number_format]
+
+    def get_cell(self, value):
+        """Returns a date cell for dates, or the value itself."""
+        number_format = get_number_format(value)
+        if number_format is None:
+            return value
+
+        cell = WriteOnlyCell(self.worksheet)
+        cell._value = to_excel(value)
+        cell.data_type = cell.TYPE_NUMERIC
+        cell._style = self.get_style(number_format)
+        return cell
+
+
+def write_xlsx(filepath, data_generator, formatter, write_only=None):
+    """Writes the data chunks in a xlsx file.
+
+    In write only mode (`EXPORTS_XLSX_WRITE_ONLY`), rows are written to
+    disk as soon as they are appended, so the memory usage does not depend
+    on the number of rows. Otherwise, the whole sheet is built in memory
+    before being saved.
+
+    Dates are written with the same formats in both modes.
+
+    """
+    if write_only is None:
+        write_only = settings.EXPORTS_XLSX_WRITE_ONLY
+
+    wb = Workbook(write_only=write_only)
+    ws = wb.create_sheet() if write_only else wb.active
+    date_cells = DateCells(ws)
+    for data_chunk in data_generator:
+        formatted = formatter.format(data_chunk)
+        for row in formatted:
+            if write_only:
+                row = [date_cells.get_cell(value) for value in row]
+                ws.append(row)
+            else:
+                ws.append(row)
+                set_number_formats(ws, row)
+    wb.save(filepath)
+
+
+def set_number_formats(worksheet, row):
+    """Set the date formats of the last row of an in memory worksheet."""
+    row_idx = worksheet.get_highest_row()
+    for column_idx, value in enumerate(row, 1):
+        number_format = get_number_format(value)
+        if number_format is not None:
+            cell = worksheet.cell(row=row_idx, column=column_idx)
+            cell.number_format = number_format
+
+
+def merge_xlsx(filepath, header, filepaths):
+    """Concatenate xlsx files in a new one.
+
+    Files are read and written row by row, so the memory usage does not
+    depend on the size of the files.
+
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    date_cells = DateCells(ws)
+    for row in header:
+        ws.append(row)
+
+    for part_filepath in filepaths:
+        part = load_workbook(part_filepath, read_only=True)
+        for part_row in part.worksheets[0].iter_rows():
+            row = []
+            for part_cell in part_row:
+                value = part_cell.value
+                # Empty values are written as empty strings, but read as None
+                if value is None:
+                    value = ''
+                # Date cells are read as datetimes
+                if getattr(part_cell, 'number_format', None) == \
+                        XLSX_DATE_FORMAT and isinstance(value, dt.datetime):
+                    value = value.date()
+                row.append(date_cells.get_cell(value))
+            ws.append(row)
+    wb.save(filepath)
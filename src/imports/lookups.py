@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import defaultdict
+
+from django.apps import apps
+
+
+class ImportLookups(object):
+    """Caches the existing objects an import batch needs, for a whole batch.
+
+    Instead of querying documents, revisions and foreign keys row by row,
+    `prefetch` resolves them for a chunk of rows with a few `IN` queries.
+
+    Objects that are not prefetched are still fetched one by one, so the
+    lookups can be used on single rows.
+
+    """
+    def __init__(self, category):
+        self.category = category
+        self.Metadata = category.category_template.metadata_model.model_class()
+        self.Revision = self.Metadata.get_revision_class()
+
+        config = getattr(self.Metadata, 'PhaseConfig')
+        self.import_fields = getattr(config, 'import_fields', None)
+        self.related_models = self.get_related_models()
+
+        # document_key -> metadata (None if the document does not exist)
+        self.metadata = {}
+        # metadata pk -> {revision number -> revision}
+        self.revisions = defaultdict(dict)
+        # field name -> {value -> pk}
+        self.related = defaultdict(dict)
+
+    def get_related_models(self):
+        """Returns the `(model, lookup field)` of foreign key columns."""
+        related_models = {}
+        for field_name, field_config in (self.import_fields or {}).items():
+            if not isinstance(field_config, dict):
+                continue
+
+            model_str = field_config.get('model', False)
+            lookup_field = field_config.get('lookup_field', False)
+            if not model_str or not lookup_field:
+                continue
+
+            app_label, model_name = model_str.split('.')
+            model = apps.get_model(app_label=app_label, model_name=model_name)
+            related_models[field_name] = (model, lookup_field)
+        return related_models
+
+    def get_metadata_queryset(self):
+        return self.Metadata.objects \
+            .select_related('document', 'latest_revision')
+
+    def prefetch(self, rows):
+        """Fetch the objects the given data rows refer to."""
+        keys = set(row.get('document_key') for row in rows) - set([None])
+        keys -= set(self.metadata.keys())
+        if keys:
+            self.metadata.update(dict.fromkeys(keys))
+            metadatas = self.get_metadata_queryset() \
+                .filter(document__document_key__in=keys)
+            for metadata in metadatas:
+                self.metadata[metadata.document.document_key] = metadata
+
+        revision_rows = [
+            (self.metadata.get(row.get('document_key')), row.get('revision'))
+            for row in rows]
+        metadata_pks = set(metadata.pk for metadata, revision in revision_rows
+                           if metadata and revision not in (None, ''))
+        if metadata_pks:
+            revisions = self.Revision.objects \
+                .filter(metadata__in=metadata_pks)
+            for revision in revisions:
+                self.revisions[revision.metadata_id][revision.revision] = \
+                    revision
+
+        for field_name, (model, lookup_field) in self.related_models.items():
+            cache = self.related[field_name]
+            values = set(row.get(field_name) for row in rows) - \
+                set([None]) - set(cache.keys())
+            if not values:
+                continue
+
+            cache.update(dict.fromkeys(values))
+            objects = model.objects \
+                .filter(**{'{}__in'.format(lookup_field): values}) \
+                .values_list(lookup_field, 'pk')
+            for value, pk in objects:
+                cache['{}'.format(value)] = pk
+
+    def get_metadata(self, document_key):
+        if document_key not in self.metadata:
+            metadata = self.get_metadata_queryset() \
+                .filter(document__document_key=document_key) \
+                .first()
+            self.metadata[document_key] = metadata
+        return self.metadata[document_key]
+
+    def get_revision(self, metadata, revision_num):
+        try:
+            revision_num = int(revision_num)
+        except (TypeError, ValueError):
+            return None
+
+        revisions = self.revisions[metadata.pk]
+        if revision_num not in revisions:
+            revisions[revision_num] = self.Revision.objects \
+                .filter(metadata=metadata, revision=revision_num) \
+                .first()
+        return revisions[revision_num]
+
+    def get_related_pk(self, field_name, value):
+        """Returns the pk of the object referenced by a fk column.
+
+        Raises `KeyError` if the field is not a fk, and `ValueError` if
+        the object does not exist.
+
+        """
+        model, lookup_field = self.related_models[field_name]
+        cache = self.related[field_name]
+        if value not in cache:
+            cache[value] = model.objects \
+                .filter(**{lookup_field: value}) \
+                .values_list('pk', flat=True) \
+                .first()
+
+        pk = cache[value]
+        if pk is None:
+            raise ValueError('Unknown {} value: {}'.format(field_name, value))
+        return pk
+
+    def add(self, metadata, revision):
+        """Remember objects created or modified by the import."""
+        self.metadata[metadata.document.document_key] = metadata
+        self.revisions[metadata.pk][revision.revision] = revision
+
+    def discard(self, document_key):
+        """Forget about a document, so it will be fetched again.
+
+        Objects passed to invalid forms are modified, and must not be reused.
+
+        """
+        metadata = self.metadata.pop(document_key, None)
+        if metadata is not None:
+            self.revisions.pop(metadata.pk, None)
@@ -2,28 +2,32 @@
 
 from __future__ import unicode_literals
 
+import copy
 import csv
 import datetime as dt
 import json
-from itertools import izip_longest
+import math
+import uuid
+from itertools import izip_longest, islice
 
-from django.apps import apps
+from django.conf import settings
 from django.db import models
-from django.core.exceptions import ObjectDoesNotExist
 from django.core.urlresolvers import reverse
 from django.utils.encoding import python_2_unicode_compatible
+from django.utils.functional import cached_property
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 from django_extensions.db.fields import UUIDField
 from model_utils import Choices
-from annoying.functions import get_object_or_None
 from openpyxl import load_workbook
 
 from categories.models import Category
 from documents.models import Document
 from documents.forms.models import documentform_factory
 from documents.utils import save_document_forms
+from search.outbox import suspended_indexing
+from imports.lookups import ImportLookups
 
 
 class normal_dialect(csv.Dialect):
@@ -94,6 +98,11 @@ class ImportBatch(models.Model):
         _('Created on'),
         default=timezone.now
     )
+    job_id = models.CharField(
+        _('Job id'),
+        max_length=50,
+        blank=True, default='',
+        help_text=_('Used to poll the import progress'))
 
     class Meta:
         verbose_name = _('Import batch')
@@ -110,13 +119,41 @@ class ImportBatch(models.Model):
     def get_absolute_url(self):
         return reverse('import_status', args=[self.uid])
 
+    def get_poll_url(self):
+        """Where the import progress can be polled (see `TaskPollView`)."""
+        if not self.job_id:
+            return None
+        return reverse('task_poll', args=[self.job_id])
+
+    def is_running(self):
+        return self.status in (self.STATUSES.new, self.STATUSES.started)
+
+    def can_be_started(self):
+        """Was the file only uploaded to be checked?"""
+        return self.status == self.STATUSES.new and not self.job_id
+
+    @cached_property
+    def form_class(self):
+        return self.get_form_class()
+
+    @cached_property
+    def revisionform_class(self):
+        return self.get_revisionform_class()
+
     def get_form_class(self):
         form_class = documentform_factory(self.imported_type.model_class())
         return form_class
 
+    @cached_property
+    def choices_cache(self):
+        """Values lists choices, shared by the forms of all lines."""
+        return {}
+
     def get_form(self, data=None, **kwargs):
-        kwargs.update({'category': self.category})
-        return self.get_form_class()(data, **kwargs)
+        kwargs.update({
+            'category': self.category,
+            'choices_cache': self.choices_cache})
+        return self.form_class(data, **kwargs)
 
     def get_revisionform_class(self):
         obj_class = self.imported_type.model_class()
@@ -125,10 +162,12 @@ class ImportBatch(models.Model):
         return form_class
 
     def get_revisionform(self, data=None, **kwargs):
-        kwargs.update({'category': self.category})
+        kwargs.update({
+            'category': self.category,
+            'choices_cache': self.choices_cache})
         # We update `created_on` field with current date.
         data.update({'created_on': timezone.now()})
-        return self.get_revisionform_class()(data, **kwargs)
+        return self.revisionform_class(data, **kwargs)
 
     def __iter__(self):
         """Loop over csv data."""
@@ -151,17 +190,115 @@ class ImportBatch(models.Model):
                 imp = Import(batch=self, data=row)
                 yield imp
 
-    def do_import(self):
-        line = 1
+    def iter_lines(self, lines=None):
+        """Loop over the imports of the given lines (all by default)."""
+        if lines is not None:
+            lines = set(lines)
+        for line, imp in enumerate(self, 1):
+            if lines is None or line in lines:
+                imp.line = line
+                yield imp
+
+    def iter_chunks(self, chunk_size=None, lines=None):
+        """Loop over lists of `chunk_size` imports."""
+        chunk_size = chunk_size or settings.IMPORTS_CHUNK_SIZE
+        imports = self.iter_lines(lines)
+        while True:
+            chunk = list(islice(imports, chunk_size))
+            if not chunk:
+                break
+            yield chunk
+
+    def get_document_keys(self):
+        """Returns the document key of every line."""
+        return [imp.data.get('document_key') for imp in self]
+
+    def get_shards(self, document_keys=None):
+        """Split the file into chunks that can be imported in parallel.
+
+        Lines are split into ranges, except that lines of the same document
+        must be imported in order, so they all go in the chunk of the first
+        one.
+
+        Returns a list of line lists, or `[None]` if the file is too small
+        to be split.
+
+        """
+        if document_keys is None:
+            document_keys = self.get_document_keys()
+
+        nb_lines = len(document_keys)
+        nb_shards = int(math.ceil(
+            float(nb_lines) / settings.IMPORTS_SHARD_SIZE))
+        nb_shards = min(nb_shards, settings.IMPORTS_MAX_SHARDS)
+        if nb_shards <= 1:
+            return [None]
+
+        shards = [[] for _ in range(nb_shards)]
+        key_shards = {}
+        for index, key in enumerate(document_keys):
+            shard = index * nb_shards // nb_lines
+            if key:
+                shard = key_shards.setdefault(key, shard)
+            shards[shard].append(index + 1)
+        return shards
+
+    def start_import(self, async=True):
+        """Asynchronously starts the import."""
+        from imports.tasks import do_import
+        self.job_id = unicode(uuid.uuid4())
+        self.status = self.STATUSES.started
+        self.save()
+
+        if async:
+            do_import.delay(unicode(self.uid))
+        else:
+            do_import(unicode(self.uid))
+
+    def import_lines(self, lines=None, progress=None):
+        """Import the given lines (all by default), chunk by chunk.
+
+        The existing documents, revisions and related objects of a chunk are
+        fetched at once, and import statuses are saved at once.
+
+        Returns the number of imported lines and the number of errors.
+
+        """
+        line_count = 0
         error_count = 0
-        for imp in self:
-            imp.do_import(line)
-            imp.save()
-            if imp.status == Import.STATUSES.error:
-                error_count += 1
-            line += 1
-
-        if error_count == line - 1:
+        lookups = ImportLookups(self.category)
+        for chunk in self.iter_chunks(lines=lines):
+            lookups.prefetch([imp.data for imp in chunk])
+            for imp in chunk:
+                imp.do_import(imp.line, lookups=lookups)
+                if imp.status == Import.STATUSES.error:
+                    error_count += 1
+            Import.objects.bulk_create(chunk)
+
+            line_count += len(chunk)
+            if progress:
+                progress.add(len(chunk))
+        return line_count, error_count
+
+    def dry_run(self):
+        """Validate every line, without importing anything.
+
+        Lines are checked like they would be imported: with the same forms,
+        lookups and foreign key denormalization. Lines of documents created
+        earlier in the file are checked as creations.
+
+        Yields the unsaved `Import` of every line, with its status and errors.
+
+        """
+        lookups = ImportLookups(self.category)
+        for chunk in self.iter_chunks():
+            lookups.prefetch([imp.data for imp in chunk])
+            for imp in chunk:
+                imp.dry_run(imp.line, lookups=lookups)
+                yield imp
+
+    def set_status(self, line_count, error_count):
+        if error_count == line_count:
             self.status = self.STATUSES.error
         elif error_count > 0:
             self.status = self.STATUSES.partial_success
@@ -169,6 +306,13 @@ class ImportBatch(models.Model):
             self.status = self.STATUSES.success
         self.save()
 
+    def do_import(self):
+        """Import the whole file in the current process."""
+        # Imported documents are indexed all at once at the end
+        with suspended_indexing():
+            line_count, error_count = self.import_lines()
+        self.set_status(line_count, error_count)
+
 
 class Import(models.Model):
     STATUSES = Choices(
@@ -202,80 +346,73 @@ class Import(models.Model):
         self.denormalized = {}
         super(Import, self).__init__(*args, **kwargs)
 
-    def get_denormalized_value(self, import_fields, field_name, value):
+    def get_denormalized_value(self, lookups, field_name, value):
         """" Returns the related object pk if the field is a foreign key.
         The PhaseConfig `import_fields` must be configured."""
-
-        field_config = import_fields.get(field_name, None)
-
-        if not field_config:
-            return value
-
-        model_str = field_config.get('model', False)
-        lookup_field = field_config.get('lookup_field', False)
-
-        if not model_str or not lookup_field:
-            return value
-
-        app_label, model_name = model_str.split('.')
-        model = apps.get_model(app_label=app_label, model_name=model_name)
-        params = {lookup_field: value}
         try:
-            obj = model.objects.get(**params).pk
-            return obj
-
-        except ObjectDoesNotExist:
-            self.errors = json.dumps({
+            return lookups.get_related_pk(field_name, value)
+        except KeyError:
+            return value
+        except ValueError:
+            self.set_errors({
                 'An error occurred': ["Unable to retrieve {} field".format(field_name)]
             })
-            self.status = self.STATUSES.error
 
-    def denormalize_data(self, category):
+    def denormalize_data(self, lookups):
         """This method processes data to get foreign key objects."""
 
-        # Check the `PhaseConfig` attribute
-        model_class = category.category_template.metadata_model.model_class()
-        config = getattr(model_class, 'PhaseConfig')
-
         # If `import_fields`is not set, we simply use the initial data
-        if not hasattr(config, 'import_fields'):
+        if lookups.import_fields is None:
             self.denormalized = self.data
             return
 
-        import_fields = config.import_fields
-
         # Process each field_name/value to get the fk pk if any
         for field_name, value in self.data.items():
-            val = self.get_denormalized_value(import_fields, field_name, value)
+            val = self.get_denormalized_value(lookups, field_name, value)
             # We fill the dict
             self.denormalized[field_name] = val
 
+    def set_errors(self, errors):
+        self.errors = json.dumps(errors)
+        self.status = self.STATUSES.error
+
+    def get_instances(self, lookups):
+        """Returns the existing metadata and revision of the row."""
+        key = self.data.get('document_key', None)
+        metadata = lookups.get_metadata(key) if key else None
+
+        revision_num = self.data.get('revision', None)
+        revision = lookups.get_revision(metadata, revision_num) if metadata and revision_num else None
+        return metadata, revision
+
     def get_forms(self, metadata_instance=None, revision_instance=None):
         return (
             self.batch.get_form(self.denormalized, instance=metadata_instance),
             self.batch.get_revisionform(self.denormalized, instance=revision_instance)
         )
 
-    def do_import(self, line):
+    def do_import(self, line, lookups=None):
+        """Import the row, without saving the import status.
+
+        `lookups` are the `ImportLookups` shared by the batch rows.
+
+        """
         assert hasattr(self, 'data')
 
         self.line = line
+        if lookups is None:
+            lookups = ImportLookups(self.batch.category)
 
-        # Checking if the document already exists
+        # Checking if the document and revision already exist
         key = self.data.get('document_key', None)
-        doc = get_object_or_None(Document, document_key=key)
-        metadata = doc.metadata if doc else None
+        metadata, revision = self.get_instances(lookups)
 
         # Processing csv data to denormalize foreign keys
-        self.denormalize_data(self.batch.category)
+        self.denormalize_data(lookups)
         # In case of denormalization error, we exit
         if self.status == self.STATUSES.error:
             return
 
-        # Checking if the revision already exists
-        revision_num = self.data.get('revision', None)
-        revision = metadata.get_revision(revision_num) if metadata and revision_num else None
-
         form, revision_form = self.get_forms(metadata, revision)
         try:
             if form.is_valid() and revision_form.is_valid():
@@ -289,12 +426,46 @@ class Import(models.Model):
                     rewrite_schedule=False)
                 self.document = doc
                 self.status = self.STATUSES.success
+
+                # The document key may have been modified
+                if key != doc.document_key:
+                    lookups.discard(key)
+                lookups.add(metadata, revision)
             else:
                 errors = dict(form.errors.items() + revision_form.errors.items())
-                self.errors = json.dumps(errors)
-                self.status = self.STATUSES.error
+                self.set_errors(errors)
         except Exception as e:
-            self.errors = json.dumps({
+            self.set_errors({
+                'An error occurred': [str(e)]
+            })
+
+        # Form validation modifies the instances
+        if self.status == self.STATUSES.error and key:
+            lookups.discard(key)
+
+    def dry_run(self, line, lookups=None):
+        """Validate the row like `do_import` would, without saving anything."""
+        assert hasattr(self, 'data')
+
+        self.line = line
+        if lookups is None:
+            lookups = ImportLookups(self.batch.category)
+
+        metadata, revision = self.get_instances(lookups)
+        self.denormalize_data(lookups)
+        if self.status == self.STATUSES.error:
+            return
+
+        # Form validation modifies the instances, that are kept by the lookups
+        form, revision_form = self.get_forms(
+            copy.copy(metadata), copy.copy(revision))
+        try:
+            if form.is_valid() and revision_form.is_valid():
+                self.status = self.STATUSES.success
+            else:
+                errors = dict(form.errors.items() + revision_form.errors.items())
+                self.set_errors(errors)
+        except Exception as e:
+            self.set_errors({
                 'An error occurred': [str(e)]
             })
-            self.status = self.STATUSES.error
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from exports.progress import ExportProgress
+
+
+class ImportProgress(ExportProgress):
+    """Publishes the progress of an import batch.
+
+    Like exports, batches are split into chunks imported by different
+    workers.
+
+    """
+    def __init__(self, batch):
+        self.job_id = batch.job_id
+        self.count_key = 'import_progress_count_{}'.format(batch.uid)
+        self.info_key = 'import_progress_info_{}'.format(batch.uid)
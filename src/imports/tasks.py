@@ -1,8 +1,79 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import logging
+
+from celery import chord
+from elasticsearch.exceptions import ConnectionError
+
 from core.celery import app
 from imports.models import ImportBatch
+from imports.progress import ImportProgress
+from search.outbox import suspended_indexing, flush_outbox
+
+
+logger = logging.getLogger(__name__)
 
 
 @app.task
 def do_import(batch_uid):
     batch = ImportBatch.objects.get(uid=batch_uid)
-    batch.do_import()
+    document_keys = batch.get_document_keys()
+    ImportProgress(batch).start(len(document_keys))
+
+    shards = batch.get_shards(document_keys)
+    if len(shards) == 1:
+        result = import_shard(batch_uid, None)
+        finish_import([result], batch_uid)
+    else:
+        # Chunks are imported in parallel, then indexed at once
+        logger.info('Splitting import {} into {} chunks'.format(
+            batch_uid, len(shards)))
+        header = [import_shard.si(batch_uid, lines) for lines in shards]
+        chord(header)(finish_import.s(batch_uid))
+
+
+@app.task
+def import_shard(batch_uid, lines):
+    """Import some lines of the batch.
+
+    Returns the number of imported lines and the number of errors, or None
+    if the import failed. Errors are not raised, so `finish_import` always
+    runs.
+
+    """
+    batch = ImportBatch.objects.select_related().get(uid=batch_uid)
+    progress = ImportProgress(batch)
+
+    # Documents are indexed by `finish_import`
+    try:
+        with suspended_indexing(flush=False):
+            return batch.import_lines(lines, progress=progress)
+    except Exception:
+        logger.exception('Error importing a chunk of import {}'.format(
+            batch_uid))
+        return None
+
+
+@app.task
+def finish_import(results, batch_uid):
+    """Set the batch status, and index all imported documents.
+
+    Documents imported before a chunk failed are indexed too.
+
+    """
+    batch = ImportBatch.objects.get(uid=batch_uid)
+    if None in results:
+        batch.status = batch.STATUSES.error
+        batch.save()
+    else:
+        line_count = sum(result[0] for result in results)
+        error_count = sum(result[1] for result in results)
+        batch.set_status(line_count, error_count)
+
+    try:
+        flush_outbox()
+    except ConnectionError:
+        logger.error('Error connecting to ES. Documents are kept in the '
+                     'indexing outbox.')
+    ImportProgress(batch).finish()
@@ -1,11 +1,27 @@
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.core.files.uploadedfile import SimpleUploadedFile
 
+from mock import patch
+from celery.result import AsyncResult
+
 from documents.models import Document
+from documents.factories import DocumentFactory
 from accounts.factories import UserFactory
-from default_documents.models import DemoMetadataRevision
+from default_documents.models import DemoMetadata, DemoMetadataRevision
 from categories.factories import CategoryFactory
 from imports.models import ImportBatch, Import
+from imports.lookups import ImportLookups
+from search.outbox import is_indexing_suspended
+
+
+def create_batch(category, lines):
+    """An import batch of the given csv lines."""
+    header = 'document_key;title;status;docclass;received_date'
+    content = '\r\n'.join([header] + lines)
+    csv_file = SimpleUploadedFile('import.csv', content.encode('utf-8'))
+    return ImportBatch.objects.create(category=category, file=csv_file)
 
 
 class ImportTests(TestCase):
@@ -208,3 +224,216 @@ class ExcelTests(TestCase):
         self.batch.do_import()
         self.assertEqual(Document.objects.all().count(), 1)
         self.assertEqual(DemoMetadataRevision.objects.all().count(), 2)
+
+
+class BatchImportTests(TestCase):
+
+    def setUp(self):
+        self.category = CategoryFactory()
+        self.user = UserFactory(
+            email='testadmin@phase.fr',
+            password='pass',
+            is_superuser=True,
+            category=self.category
+        )
+
+    def test_import_status_are_saved(self):
+        batch = create_batch(self.category, [
+            'toto;doc-toto;STD;1;2015-10-10',
+            'tata;doc-tata;FIN;;2015-10-10',
+        ])
+        batch.do_import()
+        self.assertEqual(batch.status, 'partial_success')
+        self.assertEqual(
+            list(Import.objects
+                 .filter(batch=batch)
+                 .order_by('line')
+                 .values_list('line', 'status')),
+            [(1, 'success'), (2, 'error')])
+
+    @override_settings(IMPORTS_CHUNK_SIZE=2)
+    def test_revisions_in_the_same_chunk(self):
+        batch = create_batch(self.category, [
+            'toto;doc-toto;STD;1;2015-10-10',
+            'toto;doc-toto;IDC;2;2015-10-10',
+            'toto;doc-toto;IFA;3;2015-10-10',
+        ])
+        batch.do_import()
+        self.assertEqual(batch.status, 'success')
+        doc = Document.objects.get(document_key='toto')
+        self.assertEqual(doc.current_revision, 2)
+        self.assertEqual(doc.latest_revision.docclass, 3)
+
+    def test_invalid_rows_do_not_modify_the_document(self):
+        batch = create_batch(self.category, [
+            'toto;doc-toto;STD;1;2015-10-10',
+            'toto;doc-tata;IDC;;2015-10-10',
+            'toto;doc-titi;IFA;3;2015-10-10',
+        ])
+        batch.do_import()
+        self.assertEqual(batch.status, 'partial_success')
+        doc = Document.objects.get(document_key='toto')
+        self.assertEqual(doc.title, 'doc-titi')
+        self.assertEqual(doc.current_revision, 1)
+
+    def test_queries_do_not_depend_on_rows(self):
+        batch = create_batch(self.category, [
+            'doc-{};title;STD;1;2015-10-10'.format(i) for i in range(10)])
+        batch.do_import()
+
+        # A new revision of all existing documents
+        batch = create_batch(self.category, [
+            'doc-{};title;IDC;2;2015-10-10'.format(i) for i in range(10)])
+        with CaptureQueriesContext(connection) as queries:
+            batch.do_import()
+
+        # All documents are fetched at once
+        lookups = [
+            query for query in queries.captured_queries
+            if 'SELECT "default_documents_demometadata"."id"' in query['sql']]
+        self.assertEqual(len(lookups), 1)
+        self.assertEqual(
+            DemoMetadataRevision.objects.filter(revision=1).count(), 10)
+
+    def test_foreign_key_lookups(self):
+        import_fields = {
+            'document_key': None,
+            'leader': {'model': 'accounts.User', 'lookup_field': 'email'},
+        }
+        batch = create_batch(self.category, [])
+        with patch.object(DemoMetadata.PhaseConfig, 'import_fields',
+                          import_fields, create=True):
+            lookups = ImportLookups(self.category)
+            lookups.prefetch([
+                {'leader': 'testadmin@phase.fr'},
+                {'leader': 'unknown@phase.fr'}])
+
+            with self.assertNumQueries(0):
+                imp = Import(batch=batch, data={
+                    'document_key': 'toto',
+                    'leader': 'testadmin@phase.fr'})
+                imp.denormalize_data(lookups)
+                self.assertEqual(imp.denormalized['leader'], self.user.pk)
+                self.assertEqual(imp.denormalized['document_key'], 'toto')
+
+                imp = Import(batch=batch, data={'leader': 'unknown@phase.fr'})
+                imp.denormalize_data(lookups)
+                self.assertEqual(imp.status, 'error')
+
+
+@override_settings(IMPORTS_SHARD_SIZE=2, IMPORTS_MAX_SHARDS=3)
+class ParallelImportTests(TestCase):
+
+    def setUp(self):
+        self.category = CategoryFactory()
+        self.user = UserFactory(
+            email='testadmin@phase.fr',
+            password='pass',
+            is_superuser=True,
+            category=self.category
+        )
+        lines = [
+            'toto;doc-toto;STD;1;2015-10-10',
+            'tata;doc-tata;STD;1;2015-10-10',
+            'titi;doc-titi;STD;1;2015-10-10',
+            'toto;doc-toto;IDC;2;2015-10-10',
+            'tutu;doc-tutu;STD;;2015-10-10',
+            'toto;doc-toto;IFA;3;2015-10-10',
+        ]
+        self.batch = create_batch(self.category, lines)
+
+    def test_get_shards(self):
+        shards = self.batch.get_shards()
+        self.assertEqual(shards, [[1, 2, 4, 6], [3], [5]])
+
+    @override_settings(IMPORTS_SHARD_SIZE=10)
+    def test_small_import_is_not_split(self):
+        self.assertEqual(self.batch.get_shards(), [None])
+
+    def test_parallel_import(self):
+        suspended = []
+        do_import = Import.do_import
+
+        def check_indexing(imp, *args, **kwargs):
+            suspended.append(is_indexing_suspended())
+            return do_import(imp, *args, **kwargs)
+
+        with patch.object(Import, 'do_import', check_indexing):
+            with patch('imports.tasks.flush_outbox') as flush_outbox:
+                self.batch.start_import(async=False)
+
+        batch = ImportBatch.objects.get(pk=self.batch.pk)
+        self.assertEqual(batch.status, 'partial_success')
+        self.assertEqual(
+            list(Import.objects
+                 .filter(batch=batch)
+                 .order_by('line')
+                 .values_list('line', 'status')),
+            [(1, 'success'), (2, 'success'), (3, 'success'),
+             (4, 'success'), (5, 'error'), (6, 'success')])
+
+        doc = Document.objects.get(document_key='toto')
+        self.assertEqual(doc.current_revision, 2)
+        self.assertEqual(doc.latest_revision.docclass, 3)
+
+        # Documents are indexed once, when the whole batch is imported
+        self.assertEqual(suspended, [True] * 6)
+        self.assertEqual(flush_outbox.call_count, 1)
+
+    def test_failed_chunk(self):
+        import_lines = ImportBatch.import_lines
+
+        def failing_import_lines(batch, lines=None, **kwargs):
+            if lines == [3]:
+                raise RuntimeError('Failure')
+            return import_lines(batch, lines=lines, **kwargs)
+
+        with patch.object(ImportBatch, 'import_lines', failing_import_lines):
+            with patch('imports.tasks.flush_outbox') as flush_outbox:
+                self.batch.start_import(async=False)
+
+        batch = ImportBatch.objects.get(pk=self.batch.pk)
+        self.assertEqual(batch.status, 'error')
+        self.assertEqual(Import.objects.filter(batch=batch).count(), 5)
+
+        # Documents of the other chunks are indexed anyway
+        self.assertEqual(flush_outbox.call_count, 1)
+
+    def test_progress_is_published(self):
+        self.batch.start_import(async=False)
+        result = AsyncResult(self.batch.job_id)
+        self.assertEqual(result.state, 'SUCCESS')
+        self.assertEqual(result.result['progress'], 100)
+
+
+class DryRunTests(TestCase):
+
+    def setUp(self):
+        self.category = CategoryFactory()
+        self.user = UserFactory(
+            email='testadmin@phase.fr',
+            password='pass',
+            is_superuser=True,
+            category=self.category
+        )
+        self.doc = DocumentFactory(
+            document_key='toto',
+            category=self.category,
+            metadata={'title': 'doc-toto'})
+
+    def test_dry_run_does_not_write_anything(self):
+        batch = create_batch(self.category, [
+            'toto;doc-tata;IDC;2;2015-10-10',
+            'toto;doc-titi;IDC;;2015-10-10',
+            'tata;doc-tata;STD;1;2015-10-10',
+        ])
+        results = [(imp.line, imp.status) for imp in batch.dry_run()]
+        self.assertEqual(results, [
+            (1, 'success'), (2, 'error'), (3, 'success')])
+
+        self.assertEqual(Document.objects.count(), 1)
+        doc = Document.objects.get(document_key='toto')
+        self.assertEqual(doc.title, self.doc.title)
+        self.assertEqual(doc.current_revision, self.doc.current_revision)
+        self.assertEqual(doc.get_all_revisions().count(), 1)
+        self.assertEqual(Import.objects.count(), 0)
@@ -0,0 +1,71 @@
+from django.test import TestCase
+from django.core.urlresolvers import reverse
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from documents.models import Document
+from accounts.factories import UserFactory
+from categories.factories import CategoryFactory
+from imports.models import ImportBatch, Import
+
+
+class DryRunTests(TestCase):
+
+    def setUp(self):
+        self.category = CategoryFactory()
+        self.user = UserFactory(
+            email='testadmin@phase.fr',
+            password='pass',
+            is_superuser=True,
+            category=self.category
+        )
+        self.client.login(email=self.user.email, password='pass')
+        lines = [
+            'toto;doc-toto;STD;1;2015-10-10',
+            'tata;doc-tata;FIN;;2015-10-10',
+            'toto;doc-toto;IDC;2;toto',
+        ]
+        header = 'document_key;title;status;docclass;received_date'
+        self.content = '\r\n'.join([header] + lines).encode('utf-8')
+
+    def upload(self, **data):
+        data.update({
+            'category': self.category.pk,
+            'file': SimpleUploadedFile('import.csv', self.content),
+        })
+        self.client.post(reverse('import_file'), data)
+        return ImportBatch.objects.get()
+
+    def test_dry_run(self):
+        batch = self.upload(dry_run='Check')
+        self.assertTrue(batch.can_be_started())
+
+        res = self.client.get(reverse('import_report', args=[batch.uid]))
+        self.assertEqual(res.status_code, 200)
+        lines = b''.join(res.streaming_content).splitlines()
+        self.assertEqual(lines[0], b'line;document_key;status;errors')
+        self.assertEqual(lines[1], b'1;toto;success;')
+        self.assertTrue(lines[2].startswith(b'2;tata;error;docclass: '))
+        self.assertTrue(lines[3].startswith(b'3;toto;error;received_date: '))
+
+        # Nothing was written
+        self.assertEqual(Document.objects.count(), 0)
+        self.assertEqual(Import.objects.count(), 0)
+
+    def test_start_checked_import(self):
+        batch = self.upload(dry_run='Check')
+        start_url = reverse('import_start', args=[batch.uid])
+        res = self.client.post(start_url)
+        self.assertRedirects(res, batch.get_absolute_url())
+
+        batch = ImportBatch.objects.get(pk=batch.pk)
+        self.assertEqual(batch.status, 'partial_success')
+        self.assertEqual(Document.objects.count(), 1)
+
+        # An import cannot be started twice
+        res = self.client.post(start_url)
+        self.assertEqual(res.status_code, 403)
+
+    def test_upload_starts_import(self):
+        batch = self.upload()
+        self.assertFalse(batch.can_be_started())
+        self.assertEqual(Document.objects.count(), 1)
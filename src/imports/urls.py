@@ -1,6 +1,8 @@
 from django.conf.urls import patterns, url
 
-from imports.views import ImportList, FileUpload, ImportStatus, ImportTemplate
+from imports.views import (
+    ImportList, FileUpload, ImportStatus, ImportTemplate, ImportReport,
+    ImportStart)
 
 
 urlpatterns = patterns(
@@ -17,5 +19,11 @@ urlpatterns = patterns(
         name='import_file'),
     url(r'^(?P<uid>[\w-]+)/$',
         ImportStatus.as_view(),
-        name='import_status')
+        name='import_status'),
+    url(r'^(?P<uid>[\w-]+)/report/$',
+        ImportReport.as_view(),
+        name='import_report'),
+    url(r'^(?P<uid>[\w-]+)/start/$',
+        ImportStart.as_view(),
+        name='import_start'),
 )
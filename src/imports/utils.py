@@ -2,8 +2,9 @@
 from __future__ import unicode_literals
 
 import csv
+import json
 
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from openpyxl import Workbook
 from .models import normal_dialect
 
@@ -32,3 +33,42 @@ def make_xlsx_template(import_fields, filename):
     ws.append(fields)
     wb.save(response)
     return response
+
+
+class Echo(object):
+    """A file-like object that returns what is written.
+
+    Allows to stream a csv file as it's written.
+
+    """
+    def write(self, value):
+        return value
+
+
+def format_errors(json_data):
+    """Flattens json encoded form errors."""
+    if not json_data:
+        return ''
+    errors = json.loads(json_data)
+    return ' / '.join(
+        '{}: {}'.format(field, ' '.join(messages))
+        for field, messages in sorted(errors.items()))
+
+
+def stream_csv_report(imports, filename):
+    """Streams a csv report of the given import lines, as they are checked."""
+    writer = csv.writer(Echo(), delimiter=b';')
+
+    def rows():
+        yield writer.writerow(['line', 'document_key', 'status', 'errors'])
+        for imp in imports:
+            yield writer.writerow([
+                imp.line,
+                imp.data.get('document_key') or '',
+                imp.status,
+                format_errors(imp.errors).encode('utf-8')])
+
+    response = StreamingHttpResponse(rows(), content_type='text/csv')
+    cd = 'attachment; filename="{}_report.csv"'.format(filename)
+    response['Content-Disposition'] = cd
+    return response
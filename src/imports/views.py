@@ -1,6 +1,9 @@
 from __future__ import unicode_literals
 
-from django.views.generic import CreateView, DetailView, ListView, FormView
+from django.views.generic import (
+    CreateView, DetailView, ListView, FormView, View)
+from django.views.generic.detail import SingleObjectMixin
+from django.http import HttpResponseRedirect, HttpResponseForbidden
 from django.utils.translation import ugettext_lazy as _
 from django.core.urlresolvers import reverse
 from braces.views import LoginRequiredMixin
@@ -9,8 +12,7 @@ from categories.models import Category
 from notifications.models import notify
 from imports.models import ImportBatch
 from imports.forms import FileUploadForm, ImportTemplateGenerationForm
-from imports.tasks import do_import
-from utils import make_csv_template, make_xlsx_template
+from utils import make_csv_template, make_xlsx_template, stream_csv_report
 
 
 class ImportMixin(object):
@@ -40,7 +42,12 @@ class FileUpload(ImportMixin, LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         response = super(FileUpload, self).form_valid(form)
-        do_import.delay(self.object.uid)
+
+        # The file will only be imported once it's checked
+        if 'dry_run' in self.request.POST:
+            return response
+
+        self.object.start_import()
 
         message_text = '''You required the import of a new file. Results
                        <a href="%(url)s">should be available in a few
@@ -66,6 +73,36 @@ class ImportStatus(ImportMixin, LoginRequiredMixin, DetailView):
         return context
 
 
+class ImportReport(LoginRequiredMixin, SingleObjectMixin, View):
+    """Check all the lines of a file, without importing them.
+
+    The report is streamed while lines are checked.
+
+    """
+    model = ImportBatch
+    pk_url_kwarg = 'uid'
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        return stream_csv_report(
+            self.object.dry_run(),
+            filename='import_{}'.format(self.object.uid))
+
+
+class ImportStart(LoginRequiredMixin, SingleObjectMixin, View):
+    """Import a file that was only checked."""
+    model = ImportBatch
+    pk_url_kwarg = 'uid'
+
+    def post(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        if not self.object.can_be_started():
+            return HttpResponseForbidden('This file was already imported')
+
+        self.object.start_import()
+        return HttpResponseRedirect(self.object.get_absolute_url())
+
+
 class ImportTemplate(ImportMixin, LoginRequiredMixin, FormView):
     """Renders a csv template which header is populated with PhaseConfig
     import fields """
@@ -48,6 +48,24 @@ def serve_model_file_field(model, field_name):
         return serve(request, field.name, document_root=root)
 
 
+def serve_private_file(url, filename):
+    """Serves a file of the private root, under the given name.
+
+    `url` is the file path, relative to `PRIVATE_ROOT`.
+
+    """
+    if settings.USE_X_SENDFILE:
+        xaccel_url = join(settings.PRIVATE_X_ACCEL_PREFIX, url)
+        response = HttpResponse(content_type='application/force-download')
+        response['Content-Type'] = ''
+        response['X-Accel-Redirect'] = xaccel_url
+    else:
+        request = HttpRequest()
+        response = serve(request, url, document_root=settings.PRIVATE_ROOT)
+    response['Content-Disposition'] = 'attachment; filename=%s' % filename
+    return response
+
+
 class ProtectedDownload(LoginRequiredMixin, View):
     """Serve files with a web server after an ACL control.
 
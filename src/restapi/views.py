@@ -37,6 +37,9 @@ class TaskPollView(View):
     ...     # do things
     ...     return 'done'
 
+    An estimated remaining time (in seconds) can also be given in the `eta`
+    meta key.
+
     """
     def get(self, request, job_id):
         """Return json data to describe the task."""
@@ -45,15 +48,18 @@ class TaskPollView(View):
         done = job.ready()
         success = job.successful()
         result = job.result
+        eta = None
         if isinstance(result, dict):
             progress = result.get('progress', 0)
+            eta = result.get('eta')
         else:
             progress = 100.0 if done else 0.0
 
         data = {
             'done': done,
             'success': success,
-            'progress': progress
+            'progress': progress,
+            'eta': eta,
         }
 
         # in case of error
@@ -845,3 +845,19 @@ class ReviewCommentsDownloadTests(TestCase):
         self.client.login(email=self.other_user.email, password='pass')
         res = self.client.get(self.url)
         self.assertEqual(res.status_code, 404)
+
+    def test_download_comments_archive(self):
+        self.review.comments = self.sample_pdf
+        self.review.save()
+        url = reverse('download_review_comments_archive', args=[
+            self.review.document.document_key, self.review.revision])
+
+        res = self.client.get(url)
+        self.assertEqual(res.status_code, 302)
+
+        # The archive is served by the web server
+        res = self.client.get(res['Location'])
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res['X-Accel-Redirect'].startswith('/xprivate/archives/'))
+        self.assertEqual(
+            res['Content-Disposition'], 'attachment; filename=comments.zip')
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import os
 import datetime
 import json
 
@@ -17,12 +18,12 @@ from django.forms.models import modelform_factory
 from django.utils import timezone
 
 from braces.views import LoginRequiredMixin, PermissionRequiredMixin
-from zipview.views import BaseZipView
 
 from audit_trail.models import Activity
 from audit_trail.signals import activity_log
 from documents.models import Document
-from documents.views import DocumentListMixin, BaseDocumentBatchActionView
+from documents.views import (
+    DocumentListMixin, BaseDocumentBatchActionView, ArchiveDownloadMixin)
 from discussion.models import Note
 from notifications.models import notify
 from reviews.models import Review
@@ -608,12 +609,16 @@ class CommentsDownload(LoginRequiredMixin, DetailView):
         return serve_model_file_field(review, 'comments')
 
 
-class CommentsArchiveDownload(LoginRequiredMixin, BaseZipView):
+class CommentsArchiveDownload(LoginRequiredMixin, ArchiveDownloadMixin, View):
     """Download at once all comments for a review."""
 
-    zipfile_name = 'comments.zip'
+    archive_name = 'comments.zip'
+    http_method_names = ['get']
+
+    def get(self, request, *args, **kwargs):
+        return self.archive_response(self.get_archive())
 
-    def get_files(self):
+    def get_archive_files(self):
         revision = self.kwargs.get('revision')
         document_key = self.kwargs.get('document_key')
         reviews = Review.objects \
@@ -621,4 +626,5 @@ class CommentsArchiveDownload(LoginRequiredMixin, BaseZipView):
             .filter(document__document_key=document_key) \
             .exclude(comments__isnull=True)
 
-        return [review.comments.file for review in reviews if review.comments.name]
+        return [(review.comments.path, os.path.basename(review.comments.name))
+                for review in reviews if review.comments.name]
@@ -7,43 +7,17 @@ from django.conf import settings
 from elasticsearch import Elasticsearch, RequestsHttpConnection
 
 
-elastic = Elasticsearch(
-    settings.ELASTIC_HOSTS,
-    connection_class=RequestsHttpConnection)
-
-
-INDEX_SETTINGS = {
-    "settings": {
-        "analysis": {
-            "filter": {
-                "nGram_filter": {
-                    "type": "nGram",
-                    "min_gram": 2,
-                    "max_gram": 256,  # Is this value reasonable? I don't know
-                }
-            },
-            "analyzer": {
-                "nGram_analyzer": {
-                    "type": "custom",
-                    "tokenizer": "keyword",
-                    "filter": [
-                        "lowercase",
-                        "asciifolding",
-                        "nGram_filter"
-                    ]
-                },
-                "whitespace_analyzer": {
-                    "type": "custom",
-                    "tokenizer": "keyword",
-                    "filter": [
-                        "lowercase",
-                        "asciifolding"
-                    ]
-                }
-            }
-        }
-    }
-}
+def get_client():
+    """Returns a new Elasticsearch client.
+
+    Use the shared backend of `search.backends.get_backend()` instead,
+    except in forked processes that must not reuse the parent's
+    connections.
+
+    """
+    return Elasticsearch(
+        settings.ELASTIC_HOSTS,
+        connection_class=RequestsHttpConnection)
 
 
 # TODO On migration to Django 1.7, see
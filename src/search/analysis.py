@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""Analyzer profiles.
+
+The analysis of indexed values and of full text queries is defined by a
+profile, selected with `settings.ELASTIC_ANALYZER_PROFILE`.
+
+ * `ngram`: every column value is indexed in the `_all` field as nGrams
+   (2 to 256 chars). Any substring of any column value can be searched,
+   but values are exploded into a huge number of terms, so the index is
+   big and slow to build.
+
+ * `compact`: column values are split into words, and only word prefixes
+   are indexed (edge nGrams). Document numbers are also indexed as short
+   nGrams (2 to `DOCNUMBER_MAX_GRAM` chars) in a `substrings` subfield.
+   Queries are split into nGrams too, and all of them must match, so any
+   substring of a document number (e.g `09001` or `HSE-RE` in
+   `FAC09001-HSE-REP-0004`) can still be searched.
+
+Changing the profile requires a full reindex.
+
+"""
+
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+NGRAM = 'ngram'
+COMPACT = 'compact'
+
+# Fields that hold document numbers
+DOCUMENT_NUMBER_FIELDS = ('document_key', 'document_number')
+
+# Longer grams make queries more selective, but the index bigger
+DOCNUMBER_MAX_GRAM = 6
+
+NGRAM_ANALYSIS = {
+    "filter": {
+        "nGram_filter": {
+            "type": "nGram",
+            "min_gram": 2,
+            "max_gram": 256,  # Is this value reasonable? I don't know
+        }
+    },
+    "analyzer": {
+        "nGram_analyzer": {
+            "type": "custom",
+            "tokenizer": "keyword",
+            "filter": [
+                "lowercase",
+                "asciifolding",
+                "nGram_filter"
+            ]
+        },
+        "whitespace_analyzer": {
+            "type": "custom",
+            "tokenizer": "keyword",
+            "filter": [
+                "lowercase",
+                "asciifolding"
+            ]
+        }
+    }
+}
+
+COMPACT_ANALYSIS = {
+    "char_filter": {
+        # All separators are handled as dashes
+        "docnumber_separators": {
+            "type": "mapping",
+            "mappings": ["_=>-", ".=>-", "/=>-", "\\u0020=>-"],
+        }
+    },
+    "filter": {
+        "docnumber_nGram_filter": {
+            "type": "nGram",
+            "min_gram": 2,
+            "max_gram": DOCNUMBER_MAX_GRAM,
+        },
+        "word_edge_nGram_filter": {
+            "type": "edgeNGram",
+            "min_gram": 1,
+            "max_gram": 20,
+        }
+    },
+    "analyzer": {
+        # Used for both indexing and searching
+        "docnumber_analyzer": {
+            "type": "custom",
+            "char_filter": ["docnumber_separators"],
+            "tokenizer": "keyword",
+            "filter": [
+                "lowercase",
+                "asciifolding",
+                "docnumber_nGram_filter"
+            ]
+        },
+        "text_analyzer": {
+            "type": "custom",
+            "tokenizer": "standard",
+            "filter": [
+                "lowercase",
+                "asciifolding",
+                "word_edge_nGram_filter"
+            ]
+        },
+        "text_search_analyzer": {
+            "type": "custom",
+            "tokenizer": "standard",
+            "filter": [
+                "lowercase",
+                "asciifolding"
+            ]
+        }
+    }
+}
+
+PROFILES = {
+    NGRAM: {
+        'analysis': NGRAM_ANALYSIS,
+        'all_field': {
+            'index_analyzer': 'nGram_analyzer',
+            'search_analyzer': 'whitespace_analyzer',
+            'index': 'not_analyzed',
+        },
+    },
+    COMPACT: {
+        'analysis': COMPACT_ANALYSIS,
+        'all_field': {
+            'index_analyzer': 'text_analyzer',
+            'search_analyzer': 'text_search_analyzer',
+        },
+    },
+}
+
+
+def get_profile(profile=None):
+    profile = profile or settings.ELASTIC_ANALYZER_PROFILE
+    if profile not in PROFILES:
+        raise ImproperlyConfigured(
+            'Unknown analyzer profile "{}"'.format(profile))
+    return profile
+
+
+def get_index_settings(profile=None):
+    """The index creation body."""
+    profile = get_profile(profile)
+    return {
+        "settings": {
+            "analysis": PROFILES[profile]['analysis'],
+        }
+    }
+
+
+def get_all_field_mapping(profile=None):
+    """The mapping of the `_all` field, where column values are searched."""
+    profile = get_profile(profile)
+    return dict(PROFILES[profile]['all_field'])
+
+
+def get_field_mapping(field_name, es_type, include_in_all, profile=None):
+    """The mapping of a single indexed field.
+
+    Values are also indexed "as is" in the `raw` subfield, for sorting and
+    filtering.
+
+    """
+    profile = get_profile(profile)
+    fields = {
+        'raw': {
+            'type': es_type,
+            'index': 'not_analyzed',
+            'include_in_all': False
+        }
+    }
+    if profile == COMPACT and field_name in DOCUMENT_NUMBER_FIELDS:
+        fields['substrings'] = {
+            'type': 'string',
+            'analyzer': 'docnumber_analyzer',
+            'include_in_all': False
+        }
+
+    return {
+        'type': es_type,
+        'include_in_all': include_in_all,
+        'fields': fields,
+    }
+
+
+def get_search_query(search_terms, profile=None):
+    """The full text query for the given search terms."""
+    profile = get_profile(profile)
+    query = {
+        'multi_match': {
+            'query': search_terms,
+            'fields': ['_all'],
+            'operator': 'and'
+        }
+    }
+    if profile == COMPACT:
+        query = {
+            'bool': {
+                'should': [query] + [
+                    {'match': {'{}.substrings'.format(field): {
+                        'query': search_terms,
+                        'operator': 'and'
+                    }}}
+                    for field in DOCUMENT_NUMBER_FIELDS
+                ]
+            }
+        }
+    return query
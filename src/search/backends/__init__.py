@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""Search backends.
+
+Every read or write to the search index goes through a backend. The
+backend to use is configured with `settings.SEARCH_BACKEND`.
+
+Queries are built with elasticsearch-dsl `Search` objects (see
+`search.builder.SearchBuilder`), and write operations use the same
+actions format as elasticsearch's `bulk` helper, whatever the backend.
+
+"""
+
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+class BaseSearchBackend(object):
+    """The search backend interface."""
+
+    # Can several processes write in the same index?
+    supports_multiprocessing = True
+
+    def execute(self, search):
+        """Run the search and returns an elasticsearch-dsl `Response`."""
+        raise NotImplementedError()
+
+    def scan(self, search):
+        """Iterates over all the search results, regardless of pagination."""
+        raise NotImplementedError()
+
+    def bulk(self, actions, **kwargs):
+        """Run index and delete actions, like elasticsearch `bulk` helper."""
+        raise NotImplementedError()
+
+    def delete_by_terms(self, index, field, values):
+        """Delete all documents whose `field` value is in `values`."""
+        raise NotImplementedError()
+
+    def refresh(self, index):
+        """Make latest writes available for search."""
+        raise NotImplementedError()
+
+    def index_exists(self, index):
+        """Does an index or alias with this name exist?"""
+        raise NotImplementedError()
+
+    def create_index(self, index, body):
+        raise NotImplementedError()
+
+    def delete_indexes(self, indexes):
+        """Delete the given indexes. Missing indexes are ignored."""
+        raise NotImplementedError()
+
+    def get_alias_indexes(self, alias):
+        """Returns the list of the indexes behind the alias."""
+        raise NotImplementedError()
+
+    def set_alias(self, alias, index, remove=()):
+        """Add the alias to `index`, and remove it from `remove` indexes.
+
+        This must be an atomic operation.
+
+        """
+        raise NotImplementedError()
+
+    def put_mapping(self, index, doc_type, mapping):
+        raise NotImplementedError()
+
+    def index_size(self, index):
+        """Returns the size of the index, in bytes."""
+        raise NotImplementedError()
+
+
+def load_backend(path=None):
+    """Returns a new instance of the configured backend."""
+    backend_class = import_string(path or settings.SEARCH_BACKEND)
+    return backend_class()
+
+
+_backend = None
+
+
+def get_backend():
+    """Returns the shared instance of the configured backend."""
+    global _backend
+    if _backend is None:
+        _backend = load_backend()
+    return _backend
+
+
+@receiver(setting_changed)
+def reset_backend(setting, **kwargs):
+    global _backend
+    if setting == 'SEARCH_BACKEND':
+        _backend = None
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from elasticsearch.helpers import bulk
+
+from search import get_client
+from search.backends import BaseSearchBackend
+
+
+class ElasticBackend(BaseSearchBackend):
+    """The Elasticsearch backend.
+
+    Every backend instance has it's own client, so a new instance must be
+    created in forked processes.
+
+    """
+    def __init__(self, client=None):
+        self.client = client or get_client()
+
+    def execute(self, search):
+        return search.using(self.client).execute()
+
+    def scan(self, search):
+        return search.using(self.client).scan()
+
+    def bulk(self, actions, **kwargs):
+        return bulk(self.client, actions, **kwargs)
+
+    def delete_by_terms(self, index, field, values):
+        self.client.delete_by_query(
+            index=index,
+            body={'query': {'terms': {field: list(values)}}})
+
+    def refresh(self, index):
+        self.client.indices.refresh(index=index)
+
+    def index_exists(self, index):
+        return self.client.indices.exists(index=index)
+
+    def create_index(self, index, body):
+        self.client.indices.create(index=index, body=body)
+
+    def delete_indexes(self, indexes):
+        self.client.indices.delete(index=','.join(indexes), ignore=404)
+
+    def get_alias_indexes(self, alias):
+        if not self.client.indices.exists_alias(name=alias):
+            return []
+        return sorted(self.client.indices.get_alias(name=alias).keys())
+
+    def set_alias(self, alias, index, remove=()):
+        actions = [
+            {'remove': {'index': old_index, 'alias': alias}}
+            for old_index in remove]
+        actions.append({'add': {'index': index, 'alias': alias}})
+        self.client.indices.update_aliases(body={'actions': actions})
+
+    def put_mapping(self, index, doc_type, mapping):
+        self.client.indices.put_mapping(
+            index=index,
+            doc_type=doc_type,
+            body=mapping,
+            ignore_conflicts=True)
+
+    def index_size(self, index):
+        stats = self.client.indices.stats(index=index, metric='store')
+        return stats['_all']['primaries']['store']['size_in_bytes']
@@ -0,0 +1,537 @@
+# -*- coding: utf-8 -*-
+"""An in-process search backend.
+
+Documents are kept in memory, and full text search relies on a bigram
+inverted index. This backend is meant for tests, CI and small setups that
+run in a single process (e.g the development server), where running an
+Elasticsearch node is not worth it.
+
+Only the subset of the query dsl that is used by Phase is supported:
+
+ * `filtered`, `bool`, `and`, `or`, `not`, `term`, `terms`, `range`,
+   `exists` and `missing` clauses;
+ * `multi_match` and `match` queries, which mimic the `ngram` analyzer
+   profile: the query must be a substring of a single indexed value, case
+   and accents being ignored, whatever the analyzer profile;
+ * sorting, pagination, `fields`, `_source` filtering (without wildcards)
+   and `terms` aggregations.
+
+Searching a missing index returns no results, instead of raising an
+error.
+
+"""
+
+from __future__ import unicode_literals
+
+import json
+import operator
+import threading
+import unicodedata
+from collections import OrderedDict, defaultdict
+
+from elasticsearch.exceptions import RequestError
+from elasticsearch.helpers import BulkIndexError
+from elasticsearch_dsl.result import Response, Result
+
+from core.celery import my_dumps
+from search.backends import BaseSearchBackend
+
+
+# See the nGram filter min and max values in `search.analysis`
+MIN_GRAM = 2
+MAX_GRAM = 256
+RANGE_OPERATORS = {
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'lt': operator.lt,
+    'lte': operator.le,
+}
+
+
+def normalize_text(value):
+    """Mimics the `lowercase` and `asciifolding` token filters."""
+    value = unicodedata.normalize('NFKD', unicode(value))
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return value.lower()
+
+
+def get_bigrams(text):
+    return set(text[i:i + 2] for i in range(len(text) - 1))
+
+
+def term_value(value):
+    """Normalize a value so it can be compared with a term filter value."""
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return unicode(value)
+
+
+def sort_key(value):
+    if isinstance(value, (int, long, float)):
+        return (0, value)
+    return (1, unicode(value))
+
+
+def field_name(field):
+    """Subfields (e.g `.raw`) hold the same values, analyzed differently."""
+    return field.split('.', 1)[0]
+
+
+def as_list(value):
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+
+def field_values(source, field):
+    """Returns the list of non null values of a field."""
+    value = source.get(field_name(field))
+    return [val for val in as_list(value) if val is not None]
+
+
+def split_names(names):
+    if not names:
+        return []
+    if isinstance(names, basestring):
+        names = names.split(',')
+    return [name for name in names if name]
+
+
+class LocalIndex(object):
+    def __init__(self, body=None):
+        self.body = body or {}
+        self.documents = OrderedDict()  # (doc_type, id) -> source
+        self.mappings = {}  # doc_type -> mapping
+        self.texts = {}  # (doc_type, id) -> `_all` values
+        self.postings = defaultdict(set)  # bigram -> (doc_type, id)
+
+    def in_all(self, doc_type, field):
+        """Is the field value added to the `_all` field?"""
+        properties = self.mappings.get(doc_type, {}).get('properties', {})
+        return properties.get(field, {}).get('include_in_all', True)
+
+    def add(self, doc_type, doc_id, source):
+        key = (doc_type, doc_id)
+        self.remove(key)
+
+        # Store what ES would return, i.e json data
+        source = json.loads(my_dumps(source))
+        texts = set()
+        for field, value in source.items():
+            if not self.in_all(doc_type, field):
+                continue
+
+            for val in as_list(value):
+                if val is not None and not isinstance(val, bool):
+                    texts.add(normalize_text(val))
+
+        self.documents[key] = source
+        self.texts[key] = texts
+        for text in texts:
+            for bigram in get_bigrams(text):
+                self.postings[bigram].add(key)
+
+    def remove(self, key):
+        if key not in self.documents:
+            return False
+
+        del self.documents[key]
+        for text in self.texts.pop(key):
+            for bigram in get_bigrams(text):
+                self.postings[bigram].discard(key)
+        return True
+
+    def match_text(self, query):
+        """Returns the keys of documents matching a full text query."""
+        text = normalize_text(query)
+        if not MIN_GRAM <= len(text) <= MAX_GRAM:
+            return set()
+
+        bigrams = sorted(get_bigrams(text), key=lambda b: len(self.postings[b]))
+        candidates = set(self.postings[bigrams[0]])
+        for bigram in bigrams[1:]:
+            candidates &= self.postings[bigram]
+
+        return set(
+            key for key in candidates
+            if any(text in value for value in self.texts[key]))
+
+
+class LocalBackend(BaseSearchBackend):
+    """Stores documents in memory."""
+
+    supports_multiprocessing = False
+
+    def __init__(self):
+        self.indexes = {}
+        self.aliases = {}
+        self.lock = threading.RLock()
+
+    def execute(self, search):
+        response = self.search(search._index, search._doc_type, search.to_dict())
+        return Response(response, callbacks=search._doc_type_map)
+
+    def scan(self, search):
+        body = search.to_dict()
+        body.pop('from', None)
+        body['size'] = None
+        response = self.search(search._index, search._doc_type, body)
+        for hit in response['hits']['hits']:
+            yield search._doc_type_map.get(hit['_type'], Result)(hit)
+
+    def search(self, index, doc_type, body):
+        """Returns the raw search response, like elasticsearch's `search`."""
+        with self.lock:
+            doc_types = set(split_names(doc_type))
+            hits = []
+            for index_name in self.resolve(index):
+                local_index = self.indexes[index_name]
+                match = self.compile(body.get('query', {'match_all': {}}), local_index)
+                for key, source in local_index.documents.items():
+                    if doc_types and key[0] not in doc_types:
+                        continue
+                    if match(key, source):
+                        hits.append((index_name, key, source))
+
+            sorts = self.get_sorts(body.get('sort', []))
+            hits = self.sort(hits, sorts)
+
+            start = body.get('from', 0)
+            size = body.get('size', 10)
+            end = None if size is None else start + size
+            response = {
+                'took': 0,
+                'timed_out': False,
+                '_shards': {'total': 1, 'successful': 1, 'failed': 0},
+                'hits': {
+                    'total': len(hits),
+                    'max_score': None if sorts else 1.0,
+                    'hits': [
+                        self.format_hit(
+                            hit, body.get('fields'), sorts,
+                            body.get('_source', True))
+                        for hit in hits[start:end]],
+                }
+            }
+            if 'aggs' in body:
+                response['aggregations'] = self.aggregate(hits, body['aggs'])
+        return response
+
+    def compile(self, clause, local_index):
+        """Converts a query or filter clause into a `f(key, source)` test."""
+        (clause_type, params), = clause.items()
+
+        if clause_type == 'match_all':
+            return lambda key, source: True
+
+        if clause_type == 'filtered':
+            tests = [
+                self.compile(params[part], local_index)
+                for part in ('query', 'filter') if part in params]
+            return lambda key, source: all(test(key, source) for test in tests)
+
+        if clause_type == 'bool':
+            must = [self.compile(c, local_index) for c in as_list(params.get('must', []))]
+            should = [self.compile(c, local_index) for c in as_list(params.get('should', []))]
+            must_not = [self.compile(c, local_index) for c in as_list(params.get('must_not', []))]
+            return lambda key, source: (
+                all(test(key, source) for test in must) and
+                (not should or any(test(key, source) for test in should)) and
+                not any(test(key, source) for test in must_not))
+
+        if clause_type in ('and', 'or'):
+            if isinstance(params, dict):
+                params = params['filters']
+            tests = [self.compile(c, local_index) for c in params]
+            combine = all if clause_type == 'and' else any
+            return lambda key, source: combine(test(key, source) for test in tests)
+
+        if clause_type == 'not':
+            test = self.compile(params.get('filter', params), local_index)
+            return lambda key, source: not test(key, source)
+
+        if clause_type in ('term', 'terms'):
+            params = dict(
+                (field, value) for field, value in params.items()
+                if field not in ('execution', '_cache', '_name'))
+            (field, value), = params.items()
+            if isinstance(value, dict):
+                value = value['value']
+            terms = set(term_value(val) for val in as_list(value))
+            return lambda key, source: any(
+                term_value(val) in terms for val in field_values(source, field))
+
+        if clause_type == 'range':
+            (field, bounds), = params.items()
+            bounds = dict(
+                (op, sort_key(value)) for op, value in bounds.items()
+                if op in RANGE_OPERATORS)
+
+            def in_range(val):
+                val = sort_key(val)
+                return all(
+                    RANGE_OPERATORS[op](val, bound)
+                    for op, bound in bounds.items())
+            return lambda key, source: any(
+                in_range(val) for val in field_values(source, field))
+
+        if clause_type in ('exists', 'missing'):
+            field = params['field']
+            exists = clause_type == 'exists'
+            return lambda key, source: bool(field_values(source, field)) == exists
+
+        if clause_type == 'match':
+            (field, query), = params.items()
+            if isinstance(query, dict):
+                query = query['query']
+            clause_type, params = 'multi_match', {
+                'query': query, 'fields': [field]}
+
+        if clause_type == 'multi_match':
+            if params.get('fields', ['_all']) == ['_all']:
+                keys = local_index.match_text(params['query'])
+                return lambda key, source: key in keys
+
+            text = normalize_text(params['query'])
+            fields = params['fields']
+            return lambda key, source: any(
+                text in normalize_text(val)
+                for field in fields for val in field_values(source, field))
+
+        raise NotImplementedError('Unsupported clause {}'.format(clause_type))
+
+    def get_sorts(self, sort):
+        sorts = []
+        for spec in as_list(sort):
+            if isinstance(spec, dict):
+                (field, params), = spec.items()
+                if not isinstance(params, dict):
+                    params = {'order': params}
+            else:
+                field, params = spec, {}
+
+            if field.startswith('-'):
+                field, params = field[1:], {'order': 'desc'}
+            if field == '_score':
+                continue
+            sorts.append((field_name(field), params.get('order', 'asc')))
+        return sorts
+
+    def sort(self, hits, sorts):
+        """Sort hits, missing values always come last, like in ES."""
+        def get_value(hit, field):
+            if field in ('_id', '_uid'):
+                return hit[1][1]
+            values = field_values(hit[2], field)
+            return values[0] if values else None
+
+        for field, order in reversed(sorts):
+            present = [hit for hit in hits if get_value(hit, field) is not None]
+            missing = [hit for hit in hits if get_value(hit, field) is None]
+            present.sort(
+                key=lambda hit: sort_key(get_value(hit, field)),
+                reverse=order == 'desc')
+            hits = present + missing
+        return hits
+
+    def format_hit(self, hit, fields, sorts, source_filter=True):
+        index_name, (doc_type, doc_id), source = hit
+        data = {
+            '_index': index_name,
+            '_type': doc_type,
+            '_id': doc_id,
+            '_score': None if sorts else 1.0,
+        }
+        if fields is None:
+            data['_source'] = self.filter_source(source, source_filter)
+        else:
+            data['fields'] = dict(
+                (field, field_values(source, field)) for field in fields
+                if field_values(source, field))
+        if sorts:
+            data['sort'] = [
+                doc_id if field in ('_id', '_uid') else
+                (field_values(source, field) or [None])[0]
+                for field, _ in sorts]
+        return data
+
+    def filter_source(self, source, source_filter):
+        """Only keeps the `_source` keys that were explicitly requested."""
+        if source_filter is True:
+            return source
+        if isinstance(source_filter, dict):
+            source_filter = source_filter.get('include', [])
+        includes = set(as_list(source_filter))
+        return dict(
+            (key, value) for key, value in source.items() if key in includes)
+
+    def aggregate(self, hits, aggs):
+        results = {}
+        for name, agg in aggs.items():
+            (agg_type, params), = agg.items()
+            if agg_type != 'terms':
+                raise NotImplementedError('Unsupported aggregation {}'.format(agg_type))
+
+            counts = OrderedDict()
+            for _, _, source in hits:
+                for value in field_values(source, params['field']):
+                    term = term_value(value)
+                    if term not in counts:
+                        counts[term] = [value, 0]
+                    counts[term][1] += 1
+
+            buckets = sorted(
+                counts.values(),
+                key=lambda bucket: (-bucket[1], sort_key(bucket[0])))
+            size = params.get('size', 10)
+            shown = buckets[:size] if size else buckets
+            results[name] = {
+                'doc_count_error_upper_bound': 0,
+                'sum_other_doc_count': sum(count for _, count in buckets[len(shown):]),
+                'buckets': [
+                    {'key': value, 'doc_count': count} for value, count in shown],
+            }
+        return results
+
+    def resolve(self, names):
+        """Returns the names of the indexes matching index or alias names."""
+        resolved = []
+        for name in split_names(names):
+            if name in self.aliases:
+                resolved += sorted(self.aliases[name])
+            elif name in self.indexes:
+                resolved.append(name)
+        return sorted(set(resolved))
+
+    def get_write_index(self, name):
+        if name in self.aliases:
+            if len(self.aliases[name]) != 1:
+                raise RequestError(
+                    400, 'ElasticsearchIllegalArgumentException',
+                    'Alias {} has more than one index'.format(name))
+            name, = self.aliases[name]
+        elif name not in self.indexes:
+            # Indexes are created on the fly, like in ES
+            self.indexes[name] = LocalIndex()
+        return name, self.indexes[name]
+
+    def bulk(self, actions, **kwargs):
+        raise_on_error = kwargs.get('raise_on_error', True)
+        success = 0
+        errors = []
+        with self.lock:
+            for action in actions:
+                action = dict(action)
+                op_type = action.pop('_op_type', 'index')
+                index_name, local_index = self.get_write_index(action.pop('_index'))
+                doc_type = action.pop('_type')
+                key = (doc_type, unicode(action.pop('_id')))
+                result = {
+                    '_index': index_name,
+                    '_type': doc_type,
+                    '_id': key[1],
+                }
+
+                if op_type == 'delete':
+                    if local_index.remove(key):
+                        success += 1
+                    else:
+                        result.update({'status': 404, 'found': False})
+                        errors.append({op_type: result})
+
+                elif op_type == 'update':
+                    if key in local_index.documents:
+                        source = dict(local_index.documents[key])
+                        source.update(action['doc'])
+                        local_index.add(doc_type, key[1], source)
+                        success += 1
+                    else:
+                        result.update({'status': 404, 'error': 'DocumentMissingException'})
+                        errors.append({op_type: result})
+
+                elif op_type in ('index', 'create'):
+                    if op_type == 'create' and key in local_index.documents:
+                        result.update({'status': 409, 'error': 'DocumentAlreadyExistsException'})
+                        errors.append({op_type: result})
+                        continue
+
+                    source = action.pop('_source', action)
+                    local_index.add(doc_type, key[1], source)
+                    success += 1
+
+                else:
+                    raise ValueError('Unknown bulk operation {}'.format(op_type))
+
+        if errors and raise_on_error:
+            raise BulkIndexError(
+                '%i document(s) failed to index.' % len(errors), errors)
+        return success, errors
+
+    def delete_by_terms(self, index, field, values):
+        terms = set(term_value(value) for value in values)
+        with self.lock:
+            for index_name in self.resolve(index):
+                local_index = self.indexes[index_name]
+                keys = [
+                    key for key, source in local_index.documents.items()
+                    if any(term_value(val) in terms
+                           for val in field_values(source, field))]
+                for key in keys:
+                    local_index.remove(key)
+
+    def refresh(self, index):
+        """Writes are immediately searchable."""
+        pass
+
+    def index_exists(self, index):
+        return index in self.indexes or index in self.aliases
+
+    def create_index(self, index, body):
+        with self.lock:
+            if self.index_exists(index):
+                raise RequestError(
+                    400, 'IndexAlreadyExistsException',
+                    'Index {} already exists'.format(index))
+            self.indexes[index] = LocalIndex(body)
+
+    def delete_indexes(self, indexes):
+        with self.lock:
+            for index_name in self.resolve(indexes):
+                del self.indexes[index_name]
+                for alias, alias_indexes in self.aliases.items():
+                    alias_indexes.discard(index_name)
+                    if not alias_indexes:
+                        del self.aliases[alias]
+
+    def get_alias_indexes(self, alias):
+        with self.lock:
+            return sorted(self.aliases.get(alias, []))
+
+    def set_alias(self, alias, index, remove=()):
+        with self.lock:
+            if alias in self.indexes:
+                raise RequestError(
+                    400, 'InvalidAliasNameException',
+                    'An index exists with the same name as the alias')
+
+            alias_indexes = self.aliases.get(alias, set()) - set(remove)
+            alias_indexes.add(index)
+            self.aliases[alias] = alias_indexes
+
+    def put_mapping(self, index, doc_type, mapping):
+        with self.lock:
+            for index_name in self.resolve(index):
+                self.indexes[index_name].mappings[doc_type] = mapping
+
+    def index_size(self, index):
+        """A rough estimate: the stored json, plus the indexed values."""
+        size = 0
+        with self.lock:
+            for index_name in self.resolve(index):
+                local_index = self.indexes[index_name]
+                for key, source in local_index.documents.items():
+                    size += len(json.dumps(source))
+                    size += sum(len(text) for text in local_index.texts[key])
+        return size
@@ -5,10 +5,34 @@ from django.conf import settings
 from django.forms import ModelChoiceField
 from django.db import models
 
-from elasticsearch_dsl import Search
+import base64
+import binascii
+import json
+
+from elasticsearch_dsl import Search, F
 
 from documents.forms.filters import filterform_factory
-from search import elastic
+from search.analysis import get_search_query
+from search.backends import get_backend
+
+
+# Sort tiebreaker, so every hit has a unique position in the results
+TIEBREAKER_FIELD = 'document_key.raw'
+
+
+def encode_cursor(sort_values):
+    """Builds an opaque pagination cursor from the last hit sort values."""
+    return base64.urlsafe_b64encode(json.dumps(sort_values))
+
+
+def decode_cursor(cursor):
+    try:
+        sort_values = json.loads(base64.urlsafe_b64decode(str(cursor)))
+    except (TypeError, ValueError, binascii.Error, UnicodeEncodeError):
+        raise RuntimeError('Search cursor is invalid')
+    if not isinstance(sort_values, list):
+        raise RuntimeError('Search cursor is invalid')
+    return sort_values
 
 
 class SearchBuilder(object):
@@ -18,9 +42,12 @@ class SearchBuilder(object):
     document list form filter, builds a search query using the python
     ES api.
 
+    Queries are run by the configured search backend.
+
     """
 
-    def __init__(self, category, filters=None, filter_on_entities=None):
+    def __init__(self, category, filters=None, filter_on_entities=None,
+                 search_after=None):
         if filters is None:
             filters = {}
         self.category = category
@@ -30,12 +57,20 @@ class SearchBuilder(object):
         Config = DocumentModel.PhaseConfig
         self.filter_fields = Config.filter_fields
         self.custom_filters = getattr(Config, 'custom_filters', {})
+        self.facet_sizes = getattr(Config, 'facet_sizes', {})
 
         # filter_on_entities parameters is used for OutgoingTransmittals and
         # indicates to restrict items to those whose recipient id is in
         # the list
         self.filter_on_entities = filter_on_entities
 
+        # Pagination cursor, as returned by `get_cursor`. When set, results
+        # start after the hit the cursor was built from, instead of using
+        # the `start` filter. Elasticsearch does not need to sort all the
+        # preceding hits, so deep pages are as fast as the first ones.
+        self.search_after = search_after
+        self.init_search_after(search_after)
+
     def init_filters(self, filters):
         DocumentModel = self.category.document_class()
         FilterForm = filterform_factory(DocumentModel)
@@ -46,18 +81,45 @@ class SearchBuilder(object):
         self.filter_form = form
         self.filters = form.cleaned_data
 
+    def init_search_after(self, search_after):
+        self.sort_after = None
+        if search_after:
+            sort_values = decode_cursor(search_after)
+            sort_field, _ = self.get_sort()
+            nb_sort_fields = 1 if sort_field == TIEBREAKER_FIELD else 2
+            if len(sort_values) != nb_sort_fields:
+                raise RuntimeError('Search cursor is invalid')
+            self.sort_after = sort_values
+
     def get_results(self, *args, **kwargs):
-        return self.build_query(*args, **kwargs).execute()
+        return self.execute(self.build_query(*args, **kwargs))
 
     def scan_results(self, *args, **kwargs):
-        return self.build_query(*args, **kwargs).scan()
+        return get_backend().scan(self.build_query(*args, **kwargs))
+
+    def execute(self, s):
+        return get_backend().execute(s)
 
-    def build_query(self, fields=None, only_latest_revisions=True):
+    def build_query(self, fields=None, only_latest_revisions=True,
+                    source=None):
         if fields is None:
             fields = []
+
+        s = self.build_filtered_query(only_latest_revisions)
+        s = self._add_sort(s)
+        s = self._add_search_after(s)
+        s = self._add_pagination(s)
+        if fields:
+            s = self._limit_fields(s, fields)
+        if source:
+            s = self._limit_source(s, source)
+        return s
+
+    def build_filtered_query(self, only_latest_revisions=True):
+        """The query of the whole result set, with no sort or pagination."""
         document_type = self.category.document_type()
 
-        s = Search(using=elastic, doc_type=document_type) \
+        s = Search(doc_type=document_type) \
             .index(settings.ELASTIC_INDEX)
 
         if only_latest_revisions:
@@ -67,12 +129,17 @@ class SearchBuilder(object):
         s = self._add_custom_filters(s)
         s = self._add_search_query(s)
         s = self._add_filter_on_entities(s)
-        s = self._add_sort(s)
-        s = self._add_pagination(s)
-        if fields:
-            s = self._limit_fields(s, fields)
         return s
 
+    def build_facets_query(self):
+        """Query the total and aggregations of the whole result set.
+
+        The pagination cursor is ignored, and no hits are returned.
+
+        """
+        s = self.build_filtered_query().extra(size=0)
+        return self.add_aggregations(s)
+
     def _add_filter_fields(self, s):
         for field in self.filter_fields:
             value = self.filters.get(field, None)
@@ -105,12 +172,16 @@ class SearchBuilder(object):
         For foreign key fields, we need to organize buckets by primary keys
         For every other field, the ".raw" field is what we want
 
+        Buckets are unbounded, unless a size is set in the `facet_sizes`
+        config for high cardinality fields.
+
         """
         for field in self.filter_fields:
+            size = self.facet_sizes.get(field, 0)
             if isinstance(self.filter_form.fields[field], ModelChoiceField):
-                s.aggs.bucket(field, 'terms', field='%s_id' % field, size=0)
+                s.aggs.bucket(field, 'terms', field='%s_id' % field, size=size)
             else:
-                s.aggs.bucket(field, 'terms', field='%s.raw' % field, size=0)
+                s.aggs.bucket(field, 'terms', field='%s.raw' % field, size=size)
 
         return s
 
@@ -118,17 +189,12 @@ class SearchBuilder(object):
         """Add the full text search to the query."""
         search_terms = self.filters.get('search_terms', None)
         if search_terms:
-            s = s.query({
-                'multi_match': {
-                    'query': search_terms,
-                    'fields': ['_all'],
-                    'operator': 'and'
-                }
-            })
+            s = s.query(get_search_query(search_terms))
 
         return s
 
-    def _add_sort(self, s):
+    def get_sort(self):
+        """Returns the sort field and direction."""
         sort_field = self.filters.get('sort_by', 'document_key') or 'document_key'
         sort_field = '%s.raw' % sort_field
         if sort_field.startswith('-'):
@@ -136,15 +202,63 @@ class SearchBuilder(object):
             sort_direction = 'desc'
         else:
             sort_direction = 'asc'
-        s = s.sort({sort_field: {
+        return sort_field, sort_direction
+
+    def _add_sort(self, s):
+        sort_field, sort_direction = self.get_sort()
+        sort = [{sort_field: {
             'order': sort_direction,
-            'unmapped_type': "String"}})
+            'unmapped_type': "String"}}]
+        if sort_field != TIEBREAKER_FIELD:
+            sort.append({TIEBREAKER_FIELD: {
+                'order': 'asc',
+                'unmapped_type': "String"}})
+        s = s.sort(*sort)
         return s
 
+    def get_cursor(self, hit):
+        """Returns the cursor to fetch the results following this hit."""
+        return encode_cursor(list(hit.meta.sort))
+
+    def _add_search_after(self, s):
+        """Only return hits that are sorted after the cursor's hit.
+
+        Missing values are sorted last, whatever the sort direction.
+
+        """
+        if self.sort_after is None:
+            return s
+
+        sort_field, sort_direction = self.get_sort()
+        sort_values = self.sort_after
+        after_key = F('range', **{TIEBREAKER_FIELD: {'gt': sort_values[-1]}})
+        if sort_field == TIEBREAKER_FIELD:
+            if sort_direction == 'desc':
+                after_key = F(
+                    'range', **{TIEBREAKER_FIELD: {'lt': sort_values[-1]}})
+            return s.filter(after_key)
+
+        value = sort_values[0]
+        if value is None:
+            return s.filter(F('and', [
+                F('missing', field=sort_field),
+                after_key]))
+
+        operator = 'gt' if sort_direction == 'asc' else 'lt'
+        return s.filter(F('or', [
+            F('range', **{sort_field: {operator: value}}),
+            F('and', [F('term', **{sort_field: value}), after_key]),
+            F('missing', field=sort_field),
+        ]))
+
     def _add_pagination(self, s):
+        if self.sort_after is None:
+            start = self.filters.get('start') or 0
+        else:
+            start = 0
         s = s.extra(
-            from_=self.filters.get('start', 0),
-            size=self.filters.get('size', settings.PAGINATE_BY)
+            from_=start,
+            size=self.filters.get('size') or settings.PAGINATE_BY
         )
         return s
 
@@ -152,3 +266,8 @@ class SearchBuilder(object):
         """Set the list of returned fields."""
         s = s.fields(fields)
         return s
+
+    def _limit_source(self, s, source):
+        """Only return the given keys of the indexed documents."""
+        s = s.extra(_source=list(source))
+        return s
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""Reliable bulk indexing.
+
+Actions are sent to the backend by chunks that are limited both in number
+of actions (`ELASTIC_BULK_SIZE`) and in payload bytes
+(`ELASTIC_BULK_MAX_BYTES`). A chunk that is rejected for being too large is
+split in two.
+
+Failed actions are retried with an exponential backoff when the error is
+transient (connection errors, rejected executions, unavailable shards…).
+Actions that still fail are written in the `IndexDeadLetter` table, to be
+replayed later with the `replay_dead_letters` command.
+
+"""
+
+from __future__ import unicode_literals
+
+import logging
+import time
+
+from django.conf import settings
+
+from elasticsearch.exceptions import TransportError
+
+from core.celery import my_dumps
+from search.backends import get_backend
+from search.models import IndexDeadLetter
+
+
+logger = logging.getLogger(__name__)
+
+# Item errors that are worth retrying
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+# Payload too large
+TOO_LARGE_STATUS = 413
+
+
+def action_key(action):
+    return (action['_type'], unicode(action['_id']))
+
+
+def chunk_actions(actions, max_bytes=None, max_count=None):
+    """Split actions into chunks of limited payload size and length.
+
+    An action that is larger than `max_bytes` is sent in a chunk of its own.
+
+    """
+    max_bytes = max_bytes or settings.ELASTIC_BULK_MAX_BYTES
+    max_count = max_count or settings.ELASTIC_BULK_SIZE
+    chunk = []
+    chunk_bytes = 0
+    for action in actions:
+        size = len(my_dumps(action))
+        if chunk and (chunk_bytes + size > max_bytes or len(chunk) >= max_count):
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+
+        chunk.append(action)
+        chunk_bytes += size
+
+    if chunk:
+        yield chunk
+
+
+def get_errors(errors):
+    """Returns a {action key: (status, error)} dict from bulk errors."""
+    errors_by_key = {}
+    for error in errors:
+        (op_type, item), = error.items()
+        key = (item['_type'], unicode(item['_id']))
+        errors_by_key[key] = (item.get('status'), item.get('error', ''))
+    return errors_by_key
+
+
+def send_chunk(backend, actions, request_timeout, attempt=0):
+    """Send a single chunk, retrying transient failures.
+
+    Returns the list of `(action, status, error)` for actions that could
+    not be written.
+
+    """
+    try:
+        _, errors = backend.bulk(
+            actions,
+            chunk_size=len(actions),
+            raise_on_error=False,
+            request_timeout=request_timeout)
+        errors = get_errors(errors)
+    except TransportError as e:
+        if e.status_code == TOO_LARGE_STATUS and len(actions) > 1:
+            half = len(actions) // 2
+            return \
+                send_chunk(backend, actions[:half], request_timeout, attempt) + \
+                send_chunk(backend, actions[half:], request_timeout, attempt)
+
+        # Connection errors have no http status
+        status = e.status_code if isinstance(e.status_code, int) else 503
+        errors = dict(
+            (action_key(action), (status, unicode(e))) for action in actions)
+
+    failed = []
+    retry = []
+    for action in actions:
+        error = errors.get(action_key(action))
+        if error is None:
+            continue
+
+        status, message = error
+        if action.get('_op_type') == 'delete' and status == 404:
+            # Already deleted, so nothing to do
+            continue
+        elif status in RETRYABLE_STATUSES:
+            retry.append((action, status, message))
+        else:
+            failed.append((action, status, message))
+
+    if retry:
+        if attempt < settings.ELASTIC_BULK_MAX_RETRIES:
+            time.sleep(settings.ELASTIC_BULK_RETRY_DELAY * 2 ** attempt)
+            retry_actions = [failure[0] for failure in retry]
+            failed += send_chunk(
+                backend, retry_actions, request_timeout, attempt + 1)
+        else:
+            failed += retry
+
+    return failed
+
+
+def save_dead_letters(failures):
+    """Keep track of actions that failed for good."""
+    letters = []
+    for action, status, error in failures:
+        source = action.get('_source') or {}
+        letters.append(IndexDeadLetter(
+            op_type=action.get('_op_type', 'index'),
+            doc_type=action['_type'],
+            doc_id=unicode(action['_id']),
+            document_id=source.get('document_pk'),
+            status=unicode(status),
+            error=unicode(error)))
+    IndexDeadLetter.objects.bulk_create(letters)
+
+
+def bulk_index(actions, backend=None, request_timeout=60):
+    """Run index and delete actions.
+
+    Never raises on indexing errors. Returns the number of actions that
+    failed and were moved to the dead letter table.
+
+    """
+    backend = backend or get_backend()
+    failures = []
+    for chunk in chunk_actions(actions):
+        failures += send_chunk(backend, chunk, request_timeout)
+
+    if failures:
+        logger.error('{} index actions failed, see the dead letter table'.format(
+            len(failures)))
+        save_dead_letters(failures)
+    return len(failures)
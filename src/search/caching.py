@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""Search results caching.
+
+Search responses are cached with a key that contains an "index generation"
+number for the searched document type. Every time documents are written in
+the index, the generation of their types is incremented, so cached
+responses are never served again after a write. Old entries simply expire.
+
+Written documents are only searchable after the next index refresh, that
+may happen in another process, or automatically. Responses cached during
+the `SEARCH_CACHE_WRITE_DELAY` seconds following a write are only kept for
+that delay.
+
+"""
+
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+
+GLOBAL_GENERATION_KEY = 'search_generation'
+GENERATION_KEY = 'search_generation_{}'
+WRITTEN_KEY = 'search_written_{}'
+FACETS_IGNORED_FILTERS = ('start', 'size', 'sort_by')
+
+_local = threading.local()
+
+
+def get_generation(key):
+    generation = cache.get(key)
+    if generation is None:
+        # If the generation is evicted from the cache, it must not be reset
+        # to a value that was already used, so we start from a timestamp.
+        cache.add(key, int(time.time() * 1000), None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generation(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        get_generation(key)
+
+
+def get_index_generation(document_type):
+    """Returns the current generation for a document type."""
+    return (
+        get_generation(GLOBAL_GENERATION_KEY),
+        get_generation(GENERATION_KEY.format(document_type)))
+
+
+def bump_index_generation(document_types=None):
+    """Invalidate cached search results for the given document types.
+
+    If no types are given, all cached results are invalidated.
+
+    """
+    if document_types is None:
+        bump_generation(GLOBAL_GENERATION_KEY)
+    else:
+        for document_type in set(document_types):
+            bump_generation(GENERATION_KEY.format(document_type))
+
+
+def mark_written(document_types):
+    """Must be called every time documents are written in the index.
+
+    Since written documents are only searchable after the next index
+    refresh, the generation is incremented now and again on the next
+    `mark_refreshed` call in this thread, if it happens within the write
+    delay.
+
+    """
+    document_types = set(document_types)
+    bump_index_generation(document_types)
+
+    now = time.time()
+    delay = settings.SEARCH_CACHE_WRITE_DELAY
+    cache.set_many(dict(
+        (WRITTEN_KEY.format(document_type), now)
+        for document_type in document_types), delay)
+
+    pending = getattr(_local, 'pending', {})
+    pending.update(dict.fromkeys(document_types, now))
+    _local.pending = pending
+
+
+def mark_refreshed():
+    """Invalidate the results cached since the last writes.
+
+    Older writes (e.g made by a previous task of a celery worker) were
+    already made searchable by an automatic refresh.
+
+    """
+    pending = getattr(_local, 'pending', {})
+    _local.pending = {}
+    since = time.time() - settings.SEARCH_CACHE_WRITE_DELAY
+    bump_index_generation(
+        document_type for document_type, written_on in pending.items()
+        if written_on >= since)
+
+
+def is_write_pending(document_type):
+    """Were documents of this type written within the write delay?"""
+    return cache.get(WRITTEN_KEY.format(document_type)) is not None
+
+
+def normalize_filters(filters):
+    """Converts filters into a stable, hashable representation.
+
+    Empty values are ignored, and model instances are replaced with their
+    primary keys.
+
+    """
+    normalized = {}
+    for key, value in filters.items():
+        if value in (None, ''):
+            continue
+        if isinstance(value, models.Model):
+            value = value.pk
+        normalized[key] = value
+    return json.dumps(normalized, sort_keys=True, cls=DjangoJSONEncoder)
+
+
+def get_cache_key(prefix, builder, filters):
+    document_type = builder.category.document_type()
+    key_data = json.dumps([
+        builder.category.pk,
+        get_index_generation(document_type),
+        normalize_filters(filters),
+        sorted(builder.filter_on_entities or []),
+    ])
+    return '{}_{}'.format(prefix, hashlib.md5(key_data).hexdigest())
+
+
+def get_results_cache_key(builder):
+    """Cache key of the search results for a `SearchBuilder`."""
+    filters = dict(builder.filters, search_after=builder.search_after)
+    return get_cache_key('search_results', builder, filters)
+
+
+def get_facets_cache_key(builder):
+    """Cache key of the search aggregations and total for a `SearchBuilder`.
+
+    Pagination and sorting do not change the aggregations, so they are
+    not part of the key.
+
+    """
+    filters = dict(
+        (key, value) for key, value in builder.filters.items()
+        if key not in FACETS_IGNORED_FILTERS)
+    return get_cache_key('search_facets_total', builder, filters)
+
+
+def set_cached_results(cache_key, results, document_type):
+    """Cache search results for the given document type.
+
+    Results may not contain the latest writes yet, and are only cached
+    for a short time.
+
+    """
+    if is_write_pending(document_type):
+        timeout = settings.SEARCH_CACHE_WRITE_DELAY
+    else:
+        timeout = settings.SEARCH_CACHE_TIMEOUT
+    cache.set(cache_key, results, timeout)
+
+
+def get_cached_results(cache_key, callback, document_type):
+    """Returns the cached results, or compute and cache them."""
+    results = cache.get(cache_key)
+    if results is None:
+        results = callback()
+        set_cached_results(cache_key, results, document_type)
+    return results
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""Search index ↔ database consistency checks.
+
+For every revision class, `(pk, updated_on)` pairs are streamed from the
+database and from the index, both sorted by pk. Walking both streams side by
+side (like a merge sort) finds the revisions that are missing from the
+index, out of date, or that should not be indexed anymore.
+
+Both streams are read by chunks using keyset pagination, so the check runs
+in bounded memory whatever the number of revisions.
+
+"""
+
+from __future__ import unicode_literals
+
+import datetime
+import logging
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from elasticsearch_dsl import Search, F
+
+from categories.models import Category
+from documents.utils import get_all_revision_classes
+from search.backends import get_backend
+from search.utils import (
+    get_indexable_revisions, build_index_actions, bulk_actions,
+    refresh_index)
+
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Diff results
+MISSING = 'missing'  # In the db, not in the index
+STALE = 'stale'  # In both, but the indexed version is out of date
+ORPHANED = 'orphaned'  # In the index, not in the db
+
+
+def normalize_timestamp(value):
+    """Converts db and index timestamps to comparable values.
+
+    Depending on the backend, indexed dates can be returned as iso strings
+    or as milliseconds since the epoch. ES only keeps milliseconds.
+
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, long, float)):
+        value = EPOCH + datetime.timedelta(milliseconds=value)
+    elif isinstance(value, basestring):
+        value = parse_datetime(value)
+        if value is None:
+            return None
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, timezone.utc)
+    value = value.astimezone(timezone.utc)
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+
+def get_revision_document_types(revision_class):
+    """Returns the index doc types where revisions of this class are found."""
+    metadata_class = revision_class._meta.get_field('metadata').rel.to
+    metadata_type = ContentType.objects.get_for_model(metadata_class)
+    categories = Category.objects \
+        .filter(category_template__metadata_model=metadata_type) \
+        .select_related('organisation', 'category_template')
+    return sorted(set(category.document_type() for category in categories))
+
+
+def iter_db_timestamps(revision_class, chunk_size):
+    """Yields the `(pk, updated_on)` of indexable revisions, sorted by pk."""
+    qs = get_indexable_revisions(revision_class) \
+        .order_by('pk') \
+        .values_list('pk', 'updated_on')
+    last_pk = 0
+    while True:
+        chunk = list(qs.filter(pk__gt=last_pk)[:chunk_size])
+        if not chunk:
+            break
+
+        for pk, updated_on in chunk:
+            yield pk, normalize_timestamp(updated_on)
+        last_pk = chunk[-1][0]
+
+
+def iter_index_timestamps(document_types, chunk_size, backend=None):
+    """Yields the `(pk, doc_type, updated_on)` of indexed revisions.
+
+    Results are sorted by pk. Since scan queries cannot be sorted, we use
+    regular searches filtered on `pk > last_pk`.
+
+    """
+    if not document_types:
+        return
+
+    backend = backend or get_backend()
+    last_pk = 0
+    while True:
+        s = Search(doc_type=document_types) \
+            .index(settings.ELASTIC_INDEX) \
+            .filter(F('range', pk={'gt': last_pk})) \
+            .sort({'pk': {'order': 'asc', 'unmapped_type': 'long'}}) \
+            .fields(['pk', 'updated_on']) \
+            .extra(size=chunk_size)
+        hits = backend.execute(s).hits
+        if not hits:
+            break
+
+        for hit in hits:
+            pk = int(hit.pk[0])
+            updated_on = getattr(hit, 'updated_on', [None])[0]
+            yield pk, hit.meta.doc_type, normalize_timestamp(updated_on)
+            last_pk = pk
+
+
+def diff_timestamps(db_timestamps, index_timestamps):
+    """Compares both sorted streams.
+
+    Yields `(status, pk, doc_type)` tuples for every mismatch. `doc_type`
+    is None for revisions that are missing from the index.
+
+    """
+    db_iter = iter(db_timestamps)
+    index_iter = iter(index_timestamps)
+    db_item = next(db_iter, None)
+    index_item = next(index_iter, None)
+
+    while db_item is not None or index_item is not None:
+        if index_item is None or (db_item is not None and db_item[0] < index_item[0]):
+            yield MISSING, db_item[0], None
+            db_item = next(db_iter, None)
+        elif db_item is None or index_item[0] < db_item[0]:
+            yield ORPHANED, index_item[0], index_item[1]
+            index_item = next(index_iter, None)
+        else:
+            if db_item[1] != index_item[2]:
+                yield STALE, db_item[0], index_item[1]
+            db_item = next(db_iter, None)
+            index_item = next(index_iter, None)
+
+
+def repair_revisions(revision_class, to_index, to_delete):
+    """Reindex and unindex the given revisions."""
+    actions = []
+    if to_index:
+        revisions = get_indexable_revisions(revision_class) \
+            .filter(pk__in=to_index) \
+            .order_by('pk')
+        actions += build_index_actions(revisions)
+
+    actions += [{
+        '_op_type': 'delete',
+        '_index': settings.ELASTIC_INDEX,
+        '_type': doc_type,
+        '_id': pk,
+    } for pk, doc_type in to_delete]
+
+    if actions:
+        bulk_actions(actions)
+
+
+def check_revision_class(revision_class, repair=True, chunk_size=None):
+    """Compares the db and the index for a single revision class.
+
+    Returns the count of checked revisions, and of every kind of mismatch.
+
+    """
+    chunk_size = chunk_size or settings.ELASTIC_REINDEX_CHUNK_SIZE
+    document_types = get_revision_document_types(revision_class)
+    db_timestamps = iter_db_timestamps(revision_class, chunk_size)
+    index_timestamps = iter_index_timestamps(document_types, chunk_size)
+
+    counts = Counter()
+    to_index = []
+    to_delete = []
+
+    def count_db_items(items):
+        for item in items:
+            counts['checked'] += 1
+            yield item
+
+    diff = diff_timestamps(count_db_items(db_timestamps), index_timestamps)
+    for status, pk, doc_type in diff:
+        counts[status] += 1
+        if not repair:
+            continue
+
+        if status == ORPHANED:
+            to_delete.append((pk, doc_type))
+        else:
+            to_index.append(pk)
+
+        if len(to_index) + len(to_delete) >= chunk_size:
+            repair_revisions(revision_class, to_index, to_delete)
+            to_index, to_delete = [], []
+
+    if repair:
+        repair_revisions(revision_class, to_index, to_delete)
+    return counts
+
+
+def check_index(revision_classes=None, repair=True, chunk_size=None):
+    """Compares the db and the index for all revision classes.
+
+    Mismatching revisions are reindexed or unindexed, unless `repair` is
+    False.
+
+    """
+    revision_classes = revision_classes or get_all_revision_classes()
+    counts = Counter()
+    for revision_class in revision_classes:
+        class_counts = check_revision_class(
+            revision_class, repair=repair, chunk_size=chunk_size)
+        logger.info('{}: {} revisions checked, {} missing, {} stale, '
+                    '{} orphaned'.format(
+                        revision_class.__name__,
+                        class_counts['checked'],
+                        class_counts[MISSING],
+                        class_counts[STALE],
+                        class_counts[ORPHANED]))
+        counts.update(class_counts)
+
+    if repair:
+        refresh_index()
+    return counts
@@ -0,0 +1,186 @@
+# -*- coding: utf8 -*-
+
+from __future__ import unicode_literals
+
+import logging
+import random
+from timeit import default_timer as timer
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from elasticsearch_dsl import Search
+
+from search.analysis import (
+    PROFILES, get_index_settings, get_all_field_mapping, get_field_mapping,
+    get_search_query)
+from search.backends import get_backend
+from search.bulk import bulk_index
+
+
+logger = logging.getLogger(__name__)
+
+DOC_TYPE = 'benchmark'
+FIELDS = ('document_key', 'document_number', 'title', 'status', 'discipline')
+
+WORDS = (
+    'pump', 'valve', 'pipeline', 'design', 'report', 'schedule', 'process',
+    'safety', 'flow', 'scheme', 'electrical', 'instrument', 'index', 'layout',
+    'piping', 'isometric', 'datasheet', 'specification', 'calculation',
+    'hazop', 'study', 'procedure', 'manual', 'drawing', 'diagram', 'control',
+    'system', 'architecture', 'foundation', 'structural', 'steel', 'civil',
+)
+UNITS = ('000', '100', '200', '300', '400', '500')
+DISCIPLINES = ('HSE', 'PRO', 'PIP', 'ELE', 'INS', 'CIV', 'MEC', 'STR')
+DOC_TYPES = ('REP', 'SPC', 'DWG', 'LST', 'CAL', 'PRC', 'DTS')
+STATUSES = ('STD', 'IDC', 'IFR', 'IFA', 'IFD', 'IFC', 'ASB')
+
+
+class Command(BaseCommand):
+    """Compare the analyzer profiles on a generated corpus.
+
+    For every profile, a temporary index is created and filled with the
+    same documents, then the same full text queries are run.
+
+    """
+    help = 'Benchmark the search analyzer profiles.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--profiles',
+            default=','.join(sorted(PROFILES.keys())),
+            help='Comma separated list of profiles to benchmark')
+        parser.add_argument(
+            '--count', type=int, default=10000,
+            help='Number of documents to index')
+        parser.add_argument(
+            '--queries', type=int, default=200,
+            help='Number of queries to run')
+        parser.add_argument(
+            '--seed', type=int, default=42,
+            help='Random seed used to generate the corpus')
+
+    def handle(self, *args, **options):
+        profiles = [p for p in options['profiles'].split(',') if p]
+        for profile in profiles:
+            if profile not in PROFILES:
+                raise CommandError('Unknown profile {}'.format(profile))
+
+        rand = random.Random(options['seed'])
+        documents = [self.generate_document(rand, i)
+                     for i in range(options['count'])]
+        queries = [self.generate_query(rand, rand.choice(documents))
+                   for i in range(options['queries'])]
+
+        backend = get_backend()
+        self.stdout.write('{} documents, {} queries'.format(
+            len(documents), len(queries)))
+        for profile in profiles:
+            index = '{}_benchmark_{}'.format(settings.ELASTIC_INDEX, profile)
+            backend.delete_indexes([index])
+            try:
+                results = self.benchmark(
+                    backend, index, profile, documents, queries)
+            finally:
+                backend.delete_indexes([index])
+
+            self.stdout.write(
+                '{profile}: index {size:.1f} MiB, {throughput:.0f} docs/s, '
+                'query avg {avg:.1f} ms, p95 {p95:.1f} ms, '
+                '{hits:.1f} hits / query'.format(profile=profile, **results))
+
+    def benchmark(self, backend, index, profile, documents, queries):
+        backend.create_index(index, get_index_settings(profile))
+        backend.put_mapping(index, DOC_TYPE, {
+            '_all': get_all_field_mapping(profile),
+            'properties': dict(
+                (field, get_field_mapping(field, 'string', True, profile))
+                for field in FIELDS),
+        })
+
+        actions = [{
+            '_index': index,
+            '_type': DOC_TYPE,
+            '_id': i,
+            '_source': document,
+        } for i, document in enumerate(documents)]
+        start = timer()
+        failed = bulk_index(actions, backend=backend, request_timeout=600)
+        backend.refresh(index)
+        indexing_time = timer() - start
+        if failed:
+            raise CommandError('{} documents could not be indexed'.format(
+                failed))
+
+        times = []
+        hits = 0
+        for query in queries:
+            s = Search(doc_type=DOC_TYPE) \
+                .index(index) \
+                .query(get_search_query(query, profile)) \
+                .extra(size=10)
+            start = timer()
+            response = backend.execute(s)
+            times.append(timer() - start)
+            hits += response.hits.total
+
+        times.sort()
+        return {
+            'size': backend.index_size(index) / 1024.0 / 1024.0,
+            'throughput': len(documents) / indexing_time,
+            'avg': sum(times) / len(times) * 1000,
+            'p95': times[int(len(times) * 0.95)] * 1000,
+            'hits': hits / float(len(queries)),
+        }
+
+    def generate_document(self, rand, i):
+        number = 'FAC{:05d}-{}-{}-{}-{}-{:04d}'.format(
+            rand.randint(1, 99999),
+            rand.choice(('FWF', 'CTR', 'DAE')),
+            rand.choice(UNITS),
+            rand.choice(DISCIPLINES),
+            rand.choice(DOC_TYPES),
+            i % 10000)
+        title = ' '.join(
+            rand.choice(WORDS).capitalize()
+            for _ in range(rand.randint(3, 8)))
+        return {
+            'document_key': number,
+            'document_number': number,
+            'title': title,
+            'status': rand.choice(STATUSES),
+            'discipline': number.split('-')[3],
+        }
+
+    def generate_query(self, rand, document):
+        """Search a part of the document number, or the beginning of words.
+
+        Document number parts either start on a segment, and may end in the
+        middle of one (e.g "HSE-REP-00"), or are any substring of the number
+        (e.g "09001" or "1-HSE-RE").
+
+        """
+        number = document['document_number']
+        kind = rand.random()
+        if kind < 0.3:
+            segments = number.split('-')
+            start = rand.randint(0, len(segments) - 1)
+            end = rand.randint(start + 1, len(segments))
+            query = '-'.join(segments[start:end])
+            return query[:rand.randint(max(len(query) - 3, 1), len(query))]
+
+        if kind < 0.6:
+            return get_substring(rand, number)
+
+        words = document['title'].split(' ')
+        start = rand.randint(0, len(words) - 1)
+        words = words[start:start + rand.randint(1, 2)]
+        words[-1] = words[-1][:rand.randint(3, len(words[-1]))]
+        return ' '.join(words)
+
+
+def get_substring(rand, value, min_length=3, max_length=10):
+    """A random substring, that may start and end in the middle of words."""
+    length = rand.randint(min_length, min(max_length, len(value)))
+    start = rand.randint(0, len(value) - length)
+    return value[start:start + length]
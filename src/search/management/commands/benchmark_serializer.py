@@ -0,0 +1,80 @@
+# -*- coding: utf8 -*-
+
+from __future__ import unicode_literals
+
+import logging
+from timeit import default_timer as timer
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.serializers import RevisionSerializer, legacy_to_json
+from search.utils import get_indexable_revisions
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """Compare the compiled revision serializer with the legacy `to_json`.
+
+    Revisions are loaded from the db beforehand, so only the serialization
+    time is measured.
+
+    """
+    help = 'Benchmark the revisions json serialization.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--revision-class',
+            default='default_documents.ContractorDeliverableRevision',
+            help='The revision model to benchmark (app_label.ModelName)')
+        parser.add_argument(
+            '--count', type=int, default=1000,
+            help='Number of revisions to serialize')
+        parser.add_argument(
+            '--repeat', type=int, default=3,
+            help='Number of runs, the best one is kept')
+
+    def handle(self, *args, **options):
+        try:
+            revision_class = apps.get_model(options['revision_class'])
+        except (LookupError, ValueError):
+            raise CommandError('Unknown revision class {}'.format(
+                options['revision_class']))
+
+        revisions = list(
+            get_indexable_revisions(revision_class)[:options['count']])
+        if not revisions:
+            raise CommandError('There is no revision to serialize.')
+
+        metadata_class = type(revisions[0].metadata)
+        repeat = max(options['repeat'], 1)
+
+        start = timer()
+        serializer = RevisionSerializer(metadata_class)
+        compile_time = timer() - start
+
+        legacy_time = self.best_of(
+            repeat, lambda: [legacy_to_json(rev) for rev in revisions])
+        compiled_time = self.best_of(
+            repeat, lambda: serializer.serialize_many(revisions))
+
+        nb = len(revisions)
+        self.stdout.write('{} revisions of type {}'.format(
+            nb, revision_class.__name__))
+        self.stdout.write('Serializer compilation: {:.2f} ms'.format(
+            compile_time * 1000))
+        self.stdout.write('Legacy to_json: {:.3f} s ({:.1f} us / revision)'.format(
+            legacy_time, legacy_time / nb * 1000000))
+        self.stdout.write('Compiled serializer: {:.3f} s ({:.1f} us / revision)'.format(
+            compiled_time, compiled_time / nb * 1000000))
+        self.stdout.write('Speedup: x{:.1f}'.format(legacy_time / compiled_time))
+
+    def best_of(self, repeat, func):
+        times = []
+        for _ in range(repeat):
+            start = timer()
+            func()
+            times.append(timer() - start)
+        return min(times)
@@ -0,0 +1,46 @@
+# -*- coding: utf8 -*-
+
+from __future__ import unicode_literals
+
+import logging
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+
+from elasticsearch.exceptions import ConnectionError
+
+from search.consistency import check_index, MISSING, STALE, ORPHANED
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Compare the search index with the db, and fix the differences.'
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--dry-run',
+            action='store_false', dest='repair', default=True,
+            help='Only report the differences, do not fix them.'),
+        make_option(
+            '--chunk-size',
+            action='store', type='int', dest='chunk_size',
+            default=settings.ELASTIC_REINDEX_CHUNK_SIZE,
+            help='Number of revisions fetched at once.'),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            counts = check_index(
+                repair=options.get('repair'),
+                chunk_size=options.get('chunk_size'))
+        except ConnectionError:
+            raise CommandError('Elasticsearch cannot be found')
+
+        logger.info(
+            '{} revisions checked: {} missing, {} stale, {} orphaned'.format(
+                counts['checked'],
+                counts[MISSING],
+                counts[STALE],
+                counts[ORPHANED]))
@@ -0,0 +1,26 @@
+# -*- coding: utf8 -*-
+
+from __future__ import unicode_literals
+
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from elasticsearch.exceptions import ConnectionError
+
+from search.outbox import flush_outbox
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Index all the documents pending in the indexing outbox.'
+
+    def handle(self, *args, **options):
+        try:
+            count = flush_outbox()
+        except ConnectionError:
+            raise CommandError('Elasticsearch cannot be found')
+
+        logger.info('{} documents were indexed'.format(count))
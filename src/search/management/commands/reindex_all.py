@@ -25,36 +25,72 @@ from __future__ import unicode_literals
 import logging
 import datetime
 import sys
+from multiprocessing import Pool
 from optparse import make_option
 
-from elasticsearch.helpers import bulk
-
-from django.core.management.base import BaseCommand
-from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
 from django.utils.six.moves import input
+from django.conf import settings
 
 from documents.utils import get_all_revision_classes
-from search import elastic
-from search.utils import build_index_data
-from django.conf import settings
+from search.backends import get_backend, load_backend
+from search.models import ReindexCheckpoint
+from search.utils import (
+    start_reindex, finish_reindex, get_building_index, index_checkpoint)
 
 logger = logging.getLogger(__name__)
 
 
+# Every worker process gets its own backend, thus its own ES connection
+worker_backend = None
+
+
+def init_worker():
+    global worker_backend
+    worker_backend = load_backend()
+
+
+def reindex_worker(args):
+    checkpoint_id, chunk_size = args
+    try:
+        return index_checkpoint(
+            checkpoint_id,
+            chunk_size=chunk_size,
+            backend=worker_backend)
+    finally:
+        connections.close_all()
+
+
 class Command(BaseCommand):
     option_list = BaseCommand.option_list + (
         make_option(
             '--noinput',
             action='store_false', dest='interactive', default=True,
             help='Tells Django to NOT prompt the user for input of any kind.'),
+        make_option(
+            '--resume',
+            action='store_true', dest='resume', default=False,
+            help='Resume an interrupted reindex from the last checkpoints.'),
+        make_option(
+            '--workers',
+            action='store', type='int', dest='workers',
+            default=settings.ELASTIC_REINDEX_WORKERS,
+            help='Number of indexing processes.'),
+        make_option(
+            '--chunk-size',
+            action='store', type='int', dest='chunk_size',
+            default=settings.ELASTIC_REINDEX_CHUNK_SIZE,
+            help='Number of revisions fetched from the db at once.'),
     )
 
     def handle(self, *args, **options):
         interactive = options.get('interactive')
-        if interactive:
+        resume = options.get('resume')
+        if interactive and not resume:
             confirm = input("""
-You have requested a flush of the search index.
-This will IRREVERSIBLY DESTROY all data currently indexed by Elasticsearch.
+You have requested a rebuild of the search index.
+A new index will be built from scratch, then replace the current one.
 Are you sure you want to do this?
 
 Type 'yes' to continue, or 'no' to cancel: """)
@@ -64,31 +100,48 @@ Type 'yes' to continue, or 'no' to cancel: """)
         if confirm != 'yes':
             sys.exit(1)
 
-        start_reindex = datetime.datetime.now()
-        logger.info('Reindex starting at %s' % start_reindex)
-
-        call_command('delete_index', **options)
-        call_command('create_index', **options)
-        call_command('set_mappings', **options)
+        start_time = datetime.datetime.now()
+        logger.info('Reindex starting at %s' % start_time)
 
-        logger.info('Preparing index data')
+        workers = max(options.get('workers'), 1)
+        if not get_backend().supports_multiprocessing:
+            workers = 1
+        chunk_size = options.get('chunk_size')
 
-        classes = get_all_revision_classes()
-        for class_ in classes:
-            revisions = class_.objects \
-                .filter(metadata__document__is_indexable=True) \
-                .select_related()
+        if resume:
+            index = get_building_index()
+            if index is None:
+                raise CommandError('There is no reindex to resume.')
 
-            actions = []
-            logger.info('Starting gathering data for documents of type {}'.format(class_.__name__))
-            for revision in revisions:
-                actions.append(build_index_data(revision))
-
-            bulk(
-                elastic,
-                actions,
-                chunk_size=settings.ELASTIC_BULK_SIZE,
-                request_timeout=600)
-
-        end_reindex = datetime.datetime.now()
-        logger.info('Reindex ending at %s' % end_reindex)
+            checkpoints = ReindexCheckpoint.objects.filter(is_done=False)
+            logger.info('Resuming reindex in {}, {} units left'.format(
+                index, checkpoints.count()))
+        else:
+            logger.info('Preparing index data')
+            classes = get_all_revision_classes()
+            index, checkpoints = start_reindex(classes, workers)
+            logger.info('Building index {}'.format(index))
+
+        jobs = [(checkpoint.pk, chunk_size) for checkpoint in checkpoints]
+        if workers == 1:
+            count = sum(index_checkpoint(*job) for job in jobs)
+        else:
+            # Forked processes must not share the parent's db connection
+            connections.close_all()
+            pool = Pool(workers, initializer=init_worker)
+            try:
+                count = sum(pool.imap_unordered(reindex_worker, jobs))
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+
+        # The live index was updated during the build
+        replayed = finish_reindex(index)
+        logger.info('{} updated documents replayed'.format(replayed))
+
+        end_time = datetime.datetime.now()
+        logger.info('{} revisions indexed'.format(count))
+        logger.info('Reindex ending at %s' % end_time)
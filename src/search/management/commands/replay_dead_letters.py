@@ -0,0 +1,28 @@
+# -*- coding: utf8 -*-
+
+from __future__ import unicode_literals
+
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from elasticsearch.exceptions import ConnectionError
+
+from search.models import IndexDeadLetter
+from search.utils import replay_dead_letters
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Run again the index actions that failed.'
+
+    def handle(self, *args, **options):
+        try:
+            count = replay_dead_letters()
+        except ConnectionError:
+            raise CommandError('Elasticsearch cannot be found')
+
+        logger.info('{} failed actions were replayed, {} failed again'.format(
+            count, IndexDeadLetter.objects.count()))
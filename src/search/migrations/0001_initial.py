@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReindexCheckpoint',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('start_pk', models.PositiveIntegerField(help_text='Revisions with a pk strictly greater are indexed', verbose_name='Start pk')),
+                ('end_pk', models.PositiveIntegerField(help_text='Revisions with a lower or equal pk are indexed', verbose_name='End pk')),
+                ('last_pk', models.PositiveIntegerField(verbose_name='Last indexed pk')),
+                ('is_done', models.BooleanField(default=False, verbose_name='Done')),
+                ('updated_on', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Updated on')),
+                ('revision_type', models.ForeignKey(verbose_name='Revision type', to='contenttypes.ContentType')),
+            ],
+            options={
+                'ordering': ('revision_type', 'start_pk'),
+                'verbose_name': 'Reindex checkpoint',
+                'verbose_name_plural': 'Reindex checkpoints',
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexOutboxEntry',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('document_id', models.PositiveIntegerField(verbose_name='Document id')),
+                ('created_on', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created on')),
+            ],
+            options={
+                'verbose_name': 'Index outbox entry',
+                'verbose_name_plural': 'Index outbox entries',
+            },
+        ),
+    ]
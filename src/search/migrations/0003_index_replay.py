@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0002_index_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexReplayEntry',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('document_id', models.PositiveIntegerField(verbose_name='Document id')),
+                ('created_on', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created on')),
+            ],
+            options={
+                'verbose_name': 'Index replay entry',
+                'verbose_name_plural': 'Index replay entries',
+            },
+        ),
+        migrations.AddField(
+            model_name='reindexcheckpoint',
+            name='index_name',
+            field=models.CharField(help_text='The new index being built', max_length=255, verbose_name='Index name', blank=True),
+        ),
+    ]
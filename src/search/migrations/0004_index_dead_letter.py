@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0003_index_replay'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexDeadLetter',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('op_type', models.CharField(max_length=16, verbose_name='Operation')),
+                ('doc_type', models.CharField(max_length=255, verbose_name='Document type')),
+                ('doc_id', models.CharField(max_length=255, verbose_name='Index document id')),
+                ('document_id', models.PositiveIntegerField(null=True, verbose_name='Document id', blank=True)),
+                ('status', models.CharField(max_length=16, verbose_name='Status', blank=True)),
+                ('error', models.TextField(verbose_name='Error', blank=True)),
+                ('created_on', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created on')),
+            ],
+            options={
+                'verbose_name': 'Index dead letter',
+                'verbose_name_plural': 'Index dead letters',
+            },
+        ),
+    ]
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+
+class ReindexCheckpoint(models.Model):
+    """Progress of a single reindex work unit.
+
+    A full reindex is split into work units, one per revision class and pk
+    range. After each indexed chunk, the unit's `last_pk` is updated, so an
+    interrupted reindex can be resumed where it stopped.
+
+    Checkpoints only exist while a reindex is in progress.
+
+    """
+    revision_type = models.ForeignKey(
+        ContentType,
+        verbose_name=_('Revision type'))
+    index_name = models.CharField(
+        _('Index name'),
+        max_length=255,
+        blank=True,
+        help_text=_('The new index being built'))
+    start_pk = models.PositiveIntegerField(
+        _('Start pk'),
+        help_text=_('Revisions with a pk strictly greater are indexed'))
+    end_pk = models.PositiveIntegerField(
+        _('End pk'),
+        help_text=_('Revisions with a lower or equal pk are indexed'))
+    last_pk = models.PositiveIntegerField(
+        _('Last indexed pk'))
+    is_done = models.BooleanField(
+        _('Done'),
+        default=False)
+    updated_on = models.DateTimeField(
+        _('Updated on'),
+        default=timezone.now)
+
+    class Meta:
+        verbose_name = _('Reindex checkpoint')
+        verbose_name_plural = _('Reindex checkpoints')
+        ordering = ('revision_type', 'start_pk')
+
+    def __unicode__(self):
+        return '{} ]{}, {}]'.format(
+            self.revision_type, self.start_pk, self.end_pk)
+
+    def get_queryset(self):
+        """Indexable revisions that belong to this work unit."""
+        from search.utils import get_indexable_revisions
+        revision_class = self.revision_type.model_class()
+        return get_indexable_revisions(revision_class) \
+            .filter(pk__lte=self.end_pk)
+
+    def mark_progress(self, last_pk):
+        self.last_pk = last_pk
+        self.updated_on = timezone.now()
+        self.save(update_fields=['last_pk', 'updated_on'])
+
+    def mark_done(self):
+        self.is_done = True
+        self.updated_on = timezone.now()
+        self.save(update_fields=['is_done', 'updated_on'])
+
+
+class IndexOutboxEntry(models.Model):
+    """A document that must be (re)indexed.
+
+    Entries are written in the same transaction as the document itself,
+    and consumed asynchronously by the outbox drainer. The same document
+    can be present several times, entries are deduplicated when drained.
+
+    """
+    document_id = models.PositiveIntegerField(
+        _('Document id'))
+    created_on = models.DateTimeField(
+        _('Created on'),
+        default=timezone.now)
+
+    class Meta:
+        verbose_name = _('Index outbox entry')
+        verbose_name_plural = _('Index outbox entries')
+
+    def __unicode__(self):
+        return '{}'.format(self.document_id)
+
+
+class IndexReplayEntry(models.Model):
+    """A document written in the live index during a reindex.
+
+    The new index is built from the db while the live index keeps being
+    updated. Those updates must be replayed on the new index before it
+    replaces the live one.
+
+    """
+    document_id = models.PositiveIntegerField(
+        _('Document id'))
+    created_on = models.DateTimeField(
+        _('Created on'),
+        default=timezone.now)
+
+    class Meta:
+        verbose_name = _('Index replay entry')
+        verbose_name_plural = _('Index replay entries')
+
+    def __unicode__(self):
+        return '{}'.format(self.document_id)
+
+
+class IndexDeadLetter(models.Model):
+    """An index action that could not be run, even after retries.
+
+    Dead letters are replayed with the `replay_dead_letters` command. Index
+    actions are rebuilt from the db, so the latest data is indexed.
+
+    """
+    op_type = models.CharField(
+        _('Operation'),
+        max_length=16)
+    doc_type = models.CharField(
+        _('Document type'),
+        max_length=255)
+    doc_id = models.CharField(
+        _('Index document id'),
+        max_length=255)
+    document_id = models.PositiveIntegerField(
+        _('Document id'),
+        null=True, blank=True)
+    status = models.CharField(
+        _('Status'),
+        max_length=16,
+        blank=True)
+    error = models.TextField(
+        _('Error'),
+        blank=True)
+    created_on = models.DateTimeField(
+        _('Created on'),
+        default=timezone.now)
+
+    class Meta:
+        verbose_name = _('Index dead letter')
+        verbose_name_plural = _('Index dead letters')
+
+    def __unicode__(self):
+        return '{} {}/{}'.format(self.op_type, self.doc_type, self.doc_id)
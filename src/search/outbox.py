@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""Deferred document indexing.
+
+Instead of indexing documents synchronously on every save, dirty documents
+are written in an outbox table, in the same transaction as the document
+itself. The outbox is then drained asynchronously: document ids are
+deduplicated, revisions are sent to ES by batches and the index is
+refreshed once per batch.
+
+Importers can wrap their work in `suspended_indexing` to defer indexing
+until the whole batch is done.
+
+"""
+
+from __future__ import unicode_literals
+
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+from elasticsearch.exceptions import ConnectionError
+
+from core.celery import app
+from search.models import IndexOutboxEntry
+from search.utils import (
+    get_documents_revisions, build_index_actions, bulk_actions, refresh_index)
+
+
+logger = logging.getLogger(__name__)
+
+DRAIN_SCHEDULED_CACHE_KEY = 'search_outbox_drain_scheduled'
+
+_local = threading.local()
+
+
+def is_indexing_suspended():
+    return getattr(_local, 'suspended', 0) > 0
+
+
+def enqueue_document(document_id):
+    """Mark a document as needing to be reindexed."""
+    IndexOutboxEntry.objects.create(document_id=document_id)
+    if not is_indexing_suspended():
+        schedule_drain()
+
+
+def schedule_drain():
+    """Start a drainer, unless one is already waiting to start.
+
+    The drainer is delayed a bit, so it runs once the current transaction
+    is committed, and so it can handle the saves of the next few seconds
+    at once.
+
+    """
+    delay = settings.ELASTIC_OUTBOX_DRAIN_DELAY
+    if cache.add(DRAIN_SCHEDULED_CACHE_KEY, True, delay * 10):
+        drain_outbox.apply_async(countdown=delay)
+
+
+def flush_outbox(batch_size=None):
+    """Index all the pending documents, in the current process.
+
+    Returns the number of indexed documents.
+
+    """
+    batch_size = batch_size or settings.ELASTIC_OUTBOX_BATCH_SIZE
+    count = 0
+    while True:
+        entries = list(IndexOutboxEntry.objects
+                       .order_by('pk')
+                       .values_list('pk', 'document_id')[:batch_size])
+        if not entries:
+            break
+
+        document_ids = set(document_id for _, document_id in entries)
+        revisions = get_documents_revisions(document_ids)
+        if revisions:
+            bulk_actions(build_index_actions(revisions))
+            refresh_index()
+
+        # Entries added during the indexing must be kept
+        entry_ids = [entry_id for entry_id, _ in entries]
+        IndexOutboxEntry.objects.filter(pk__in=entry_ids).delete()
+        count += len(document_ids)
+
+    logger.info('{} documents indexed from the outbox'.format(count))
+    return count
+
+
+@app.task
+def drain_outbox():
+    """Index all the pending documents."""
+    # Saves that happen from now on must start a new drainer
+    cache.delete(DRAIN_SCHEDULED_CACHE_KEY)
+    return flush_outbox()
+
+
+@contextmanager
+def suspended_indexing(flush=True):
+    """Defer documents indexing until the end of the block.
+
+    Dirty documents are still written in the outbox, but no drainer is
+    started. When the block is left, all pending documents are indexed at
+    once, unless `flush` is False. In that case, they will be indexed by
+    the next drainer.
+
+    Nested blocks are allowed, only the outermost one flushes the outbox.
+
+    If ES cannot be reached, documents are kept in the outbox.
+
+    """
+    depth = getattr(_local, 'suspended', 0)
+    _local.suspended = depth + 1
+    try:
+        yield
+    finally:
+        _local.suspended = depth
+
+    if flush and depth == 0:
+        try:
+            flush_outbox()
+        except ConnectionError:
+            logger.error('Error connecting to ES. Documents are kept in the '
+                         'indexing outbox.')
@@ -8,7 +8,8 @@ from django.conf import settings
 
 from categories.models import Category
 from search.utils import (
-    index_document, unindex_document, put_category_mapping, refresh_index)
+    unindex_document, put_category_mapping, refresh_index)
+from search.outbox import enqueue_document
 from documents.models import Document
 from documents.signals import document_form_saved
 
@@ -24,10 +25,12 @@ def update_index(**kwargs):
     # Then, the Document is saved again
     # Thus, we MUST not index the document on the first save, since the
     # metadata and revision does not exist yet
+    #
+    # The document is not indexed right away, but written in the indexing
+    # outbox, so many saves can be indexed at once.
     created = kwargs.pop('created', False)
     if not created and doc.is_indexable:
-        index_document(doc.pk)
-    refresh_index()
+        enqueue_document(doc.pk)
 
 
 def remove_from_index(sender, instance, **kwargs):
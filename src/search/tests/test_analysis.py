@@ -0,0 +1,130 @@
+# -*- coding: utf8 -*-
+
+from __future__ import unicode_literals
+
+import unicodedata
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils.six import StringIO
+
+from default_documents.models import ContractorDeliverable
+from search.analysis import (
+    get_profile, get_index_settings, get_search_query, COMPACT, NGRAM)
+from search.utils import get_mapping
+
+
+def analyze(value, analyzer_name, analysis):
+    """Emulate the configured analyzers used on document numbers.
+
+    Only the keyword tokenizer, mapping char filters, and the lowercase,
+    asciifolding and nGram token filters are supported.
+
+    """
+    analyzer = analysis['analyzer'][analyzer_name]
+    assert analyzer['tokenizer'] == 'keyword'
+    for char_filter in analyzer.get('char_filter', []):
+        for mapping in analysis['char_filter'][char_filter]['mappings']:
+            source, target = mapping.split('=>')
+            source = source.encode('ascii').decode('unicode_escape')
+            value = value.replace(source, target)
+
+    tokens = [value]
+    for token_filter in analyzer['filter']:
+        if token_filter == 'lowercase':
+            tokens = [token.lower() for token in tokens]
+        elif token_filter == 'asciifolding':
+            tokens = [
+                unicodedata.normalize('NFKD', token).encode('ascii', 'ignore')
+                .decode('ascii') for token in tokens]
+        else:
+            config = analysis['filter'][token_filter]
+            assert config['type'] == 'nGram'
+            tokens = [
+                token[start:start + length]
+                for token in tokens
+                for length in range(
+                    config['min_gram'], config['max_gram'] + 1)
+                for start in range(len(token) - length + 1)]
+    return tokens
+
+
+class ProfileTests(TestCase):
+    def test_default_profile(self):
+        self.assertEqual(get_profile(), NGRAM)
+        analysis = get_index_settings()['settings']['analysis']
+        self.assertIn('nGram_analyzer', analysis['analyzer'])
+
+    @override_settings(ELASTIC_ANALYZER_PROFILE='unknown')
+    def test_unknown_profile(self):
+        with self.assertRaises(ImproperlyConfigured):
+            get_index_settings()
+
+    def test_ngram_mapping(self):
+        mapping = get_mapping(ContractorDeliverable, NGRAM)
+        self.assertEqual(mapping['_all']['index_analyzer'], 'nGram_analyzer')
+        self.assertNotIn(
+            'substrings', mapping['properties']['document_number']['fields'])
+
+    def test_compact_mapping(self):
+        mapping = get_mapping(ContractorDeliverable, COMPACT)
+        self.assertEqual(mapping['_all']['index_analyzer'], 'text_analyzer')
+
+        fields = mapping['properties']['document_key']['fields']
+        self.assertEqual(
+            fields['substrings']['analyzer'], 'docnumber_analyzer')
+        self.assertIn(
+            'substrings', mapping['properties']['document_number']['fields'])
+
+    def test_search_query(self):
+        query = get_search_query('HSE-REP', NGRAM)
+        self.assertEqual(query['multi_match']['fields'], ['_all'])
+
+        query = get_search_query('HSE-REP', COMPACT)
+        should = query['bool']['should']
+        self.assertEqual(should[0]['multi_match']['fields'], ['_all'])
+        self.assertEqual(should[1], {'match': {'document_key.substrings': {
+            'query': 'HSE-REP',
+            'operator': 'and'
+        }}})
+
+
+class DocumentNumberSubstringTests(TestCase):
+    """Any part of a document number must be found, whatever the profile."""
+    document_number = 'FAC09001-HSE-REP-0004'
+    queries = (
+        '09001', 'HSE-RE', '1-HSE', 'SE-REP-00', 'REP-0004', 'C0900',
+        'fac09001-hse', 'FAC09001-HSE-REP-0004')
+
+    def get_analysis(self, profile):
+        return get_index_settings(profile)['settings']['analysis']
+
+    def test_ngram_profile(self):
+        analysis = self.get_analysis(NGRAM)
+        terms = analyze(self.document_number, 'nGram_analyzer', analysis)
+        for query in self.queries:
+            tokens = analyze(query, 'whitespace_analyzer', analysis)
+            self.assertTrue(set(tokens) <= set(terms), query)
+
+    def test_compact_profile(self):
+        analysis = self.get_analysis(COMPACT)
+        terms = analyze(self.document_number, 'docnumber_analyzer', analysis)
+        for query in self.queries:
+            tokens = analyze(query, 'docnumber_analyzer', analysis)
+            self.assertTrue(tokens, query)
+            self.assertTrue(set(tokens) <= set(terms), query)
+
+        tokens = analyze('HSE-DAE', 'docnumber_analyzer', analysis)
+        self.assertFalse(set(tokens) <= set(terms))
+
+
+class BenchmarkTests(TestCase):
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command(
+            'benchmark_analyzers', count=50, queries=10, stdout=out)
+        output = out.getvalue()
+        self.assertIn('ngram: index', output)
+        self.assertIn('compact: index', output)
@@ -0,0 +1,220 @@
+# -*- coding: utf8 -*-
+
+from __future__ import unicode_literals
+
+from unittest import SkipTest
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from elasticsearch_dsl import F
+
+from categories.factories import CategoryFactory
+from documents.factories import DocumentFactory
+from search import get_client
+from search.builder import SearchBuilder
+from search.utils import (
+    create_index, delete_index, put_category_mapping, index_revisions,
+    unindex_document, refresh_index)
+
+
+class BackendConformanceTests(object):
+    """Tests that must pass whatever the search backend.
+
+    Documents are indexed and searched through the `search.utils` and
+    `SearchBuilder` apis, so those tests do not rely on any backend
+    implementation detail.
+
+    """
+    def setUp(self):
+        delete_index()
+        create_index()
+        self.category = CategoryFactory()
+        put_category_mapping(self.category.pk)
+
+        docs = (
+            ('Pump maintenance', 'STD'),
+            ('Électrical pumps', 'IFR'),
+            ('Pipeline design', 'IFR'),
+            ('Valve schedule', 'IFA'),
+            ('Instrument index', 'IFR'),
+        )
+        self.docs = [
+            DocumentFactory(
+                category=self.category,
+                document_key='DOC-{}'.format(i),
+                title=title,
+                metadata={'title': title},
+                revision={'status': status})
+            for i, (title, status) in enumerate(docs)]
+        index_revisions([doc.get_latest_revision() for doc in self.docs])
+
+    def tearDown(self):
+        delete_index()
+
+    def search(self, filters=None, **kwargs):
+        builder = SearchBuilder(self.category, filters or {})
+        for key, value in kwargs.items():
+            setattr(builder, key, value)
+        query = builder.build_query()
+        query = builder.add_aggregations(query)
+        return builder.execute(query)
+
+    def keys(self, response):
+        return [hit.document_key for hit in response.hits]
+
+    def test_all_documents(self):
+        response = self.search({'sort_by': 'document_number'})
+        self.assertEqual(response.hits.total, 5)
+        self.assertEqual(self.keys(response), [
+            'DOC-0', 'DOC-1', 'DOC-2', 'DOC-3', 'DOC-4'])
+
+    def test_term_filter(self):
+        response = self.search({'status': 'IFR', 'sort_by': 'document_number'})
+        self.assertEqual(response.hits.total, 3)
+        self.assertEqual(self.keys(response), ['DOC-1', 'DOC-2', 'DOC-4'])
+
+    def test_custom_filters(self):
+        custom_filters = {
+            'only_started': {'filters': {None: F('term', status='STD')}}}
+        response = self.search(custom_filters=custom_filters)
+        self.assertEqual(self.keys(response), ['DOC-0'])
+
+    def test_full_text_search(self):
+        response = self.search({
+            'search_terms': 'pump', 'sort_by': 'document_number'})
+        self.assertEqual(self.keys(response), ['DOC-0', 'DOC-1'])
+
+    def test_full_text_search_ignores_accents(self):
+        response = self.search({'search_terms': 'electrical'})
+        self.assertEqual(self.keys(response), ['DOC-1'])
+
+    def test_full_text_search_with_spaces(self):
+        response = self.search({'search_terms': 'pipeline des'})
+        self.assertEqual(self.keys(response), ['DOC-2'])
+
+        response = self.search({'search_terms': 'pipeline schedule'})
+        self.assertEqual(response.hits.total, 0)
+
+    def test_sort(self):
+        response = self.search({'sort_by': 'title'})
+        self.assertEqual(self.keys(response), [
+            'DOC-4', 'DOC-2', 'DOC-0', 'DOC-3', 'DOC-1'])
+
+        response = self.search({'sort_by': '-document_number'})
+        self.assertEqual(self.keys(response), [
+            'DOC-4', 'DOC-3', 'DOC-2', 'DOC-1', 'DOC-0'])
+
+    def test_pagination(self):
+        response = self.search({
+            'sort_by': 'document_number', 'start': 1, 'size': 2})
+        self.assertEqual(response.hits.total, 5)
+        self.assertEqual(self.keys(response), ['DOC-1', 'DOC-2'])
+
+    def paginate(self, filters, size=2):
+        """Fetch all results, page by page, using cursors."""
+        keys = []
+        cursor = None
+        while True:
+            builder = SearchBuilder(
+                self.category, dict(filters, size=size), search_after=cursor)
+            response = builder.execute(builder.build_query())
+            keys += self.keys(response)
+            if len(response.hits) < size:
+                return keys
+            cursor = builder.get_cursor(response.hits[-1])
+
+    def test_cursor_pagination(self):
+        for sort_by in ('document_number', '-document_number', 'title',
+                        '-title', 'status', '-status', 'document_key',
+                        '-document_key', 'unknown_field'):
+            response = self.search({'sort_by': sort_by, 'size': 10})
+            self.assertEqual(
+                self.paginate({'sort_by': sort_by}), self.keys(response))
+
+    def test_cursor_pagination_with_missing_values(self):
+        revisions = [doc.get_latest_revision() for doc in self.docs]
+        for revision in revisions:
+            revision.status = None if revision.status == 'IFR' else 'IFR'
+            revision.save()
+        index_revisions(revisions)
+
+        for sort_by in ('status', '-status'):
+            response = self.search({'sort_by': sort_by, 'size': 10})
+            self.assertEqual(
+                self.paginate({'sort_by': sort_by}), self.keys(response))
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(RuntimeError):
+            SearchBuilder(self.category, {}, search_after='not a cursor')
+
+    def test_terms_aggregations(self):
+        response = self.search()
+        buckets = response.aggregations.to_dict()['status']['buckets']
+        self.assertEqual(buckets, [
+            {'key': 'IFR', 'doc_count': 3},
+            {'key': 'IFA', 'doc_count': 1},
+            {'key': 'STD', 'doc_count': 1},
+        ])
+
+    def test_aggregations_are_filtered(self):
+        response = self.search({'search_terms': 'pump'})
+        buckets = response.aggregations.to_dict()['status']['buckets']
+        self.assertEqual(buckets, [
+            {'key': 'IFR', 'doc_count': 1},
+            {'key': 'STD', 'doc_count': 1},
+        ])
+
+    def test_bounded_aggregations(self):
+        response = self.search(facet_sizes={'status': 1})
+        buckets = response.aggregations.to_dict()['status']['buckets']
+        self.assertEqual(buckets, [{'key': 'IFR', 'doc_count': 3}])
+
+    def test_scan_fields(self):
+        builder = SearchBuilder(self.category, {'status': 'IFR'})
+        results = builder.scan_results(['pk'])
+        pks = sorted(doc['pk'][0] for doc in results)
+        expected = sorted(
+            self.docs[i].get_latest_revision().pk for i in (1, 2, 4))
+        self.assertEqual(pks, expected)
+
+    def test_source_filtering(self):
+        builder = SearchBuilder(self.category, {'sort_by': 'document_number'})
+        query = builder.build_query(source=['document_key', 'title'])
+        response = builder.execute(query)
+        self.assertEqual(response.hits[0]._d_, {
+            'document_key': 'DOC-0',
+            'title': 'Pump maintenance'})
+
+    def test_only_latest_revisions(self):
+        doc = self.docs[0]
+        revision = doc.get_latest_revision()
+        revision.pk = None
+        revision.revision = 2
+        revision.save()
+        doc.current_revision = 2
+        doc.save()
+        index_revisions(doc.get_all_revisions())
+
+        response = self.search({'search_terms': 'maintenance'})
+        self.assertEqual(response.hits.total, 1)
+        self.assertEqual(response.hits[0].revision, 2)
+
+    def test_unindex_document(self):
+        unindex_document(self.docs[0].pk)
+        refresh_index()
+        response = self.search()
+        self.assertEqual(response.hits.total, 4)
+
+
+@override_settings(SEARCH_BACKEND='search.backends.local.LocalBackend')
+class LocalBackendTests(BackendConformanceTests, TestCase):
+    pass
+
+
+@override_settings(SEARCH_BACKEND='search.backends.elastic.ElasticBackend')
+class ElasticBackendTests(BackendConformanceTests, TestCase):
+    def setUp(self):
+        if not get_client().ping():
+            raise SkipTest('Elasticsearch cannot be found')
+        super(ElasticBackendTests, self).setUp()
@@ -0,0 +1,163 @@
+# -*- coding: utf8 -*-
+
+from __future__ import unicode_literals
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from elasticsearch.exceptions import ConnectionError, TransportError
+from mock import MagicMock, patch
+
+from categories.factories import CategoryFactory
+from documents.factories import DocumentFactory
+from search.backends import get_backend
+from search.bulk import bulk_index, chunk_actions
+from search.models import IndexDeadLetter
+from search.utils import (
+    create_index, delete_index, put_category_mapping, replay_dead_letters)
+
+
+def action(doc_id, op_type='index', size=0):
+    return {
+        '_op_type': op_type,
+        '_index': 'test_documents',
+        '_type': 'doc',
+        '_id': doc_id,
+        '_source': {'document_pk': doc_id, 'data': 'x' * size},
+    }
+
+
+def error(doc_id, status, op_type='index'):
+    return {op_type: {
+        '_index': 'test_documents',
+        '_type': 'doc',
+        '_id': '{}'.format(doc_id),
+        'status': status,
+        'error': 'Error {}'.format(status),
+    }}
+
+
+class ChunkTests(TestCase):
+    def test_chunks_are_limited_by_size(self):
+        actions = [action(i, size=100) for i in range(5)]
+        chunks = list(chunk_actions(actions, max_bytes=500, max_count=10))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+
+    def test_chunks_are_limited_by_count(self):
+        actions = [action(i) for i in range(5)]
+        chunks = list(chunk_actions(actions, max_bytes=10000, max_count=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+
+    def test_large_actions_are_sent_alone(self):
+        actions = [action(1, size=1000), action(2)]
+        chunks = list(chunk_actions(actions, max_bytes=500, max_count=10))
+        self.assertEqual([len(chunk) for chunk in chunks], [1, 1])
+
+
+@override_settings(ELASTIC_BULK_MAX_RETRIES=2)
+class RetryTests(TestCase):
+    def setUp(self):
+        self.backend = MagicMock()
+        self.backend.bulk.return_value = (0, [])
+
+    def sent_ids(self):
+        return [
+            [action['_id'] for action in call[0][0]]
+            for call in self.backend.bulk.call_args_list]
+
+    def test_successful_bulk(self):
+        failed = bulk_index([action(1), action(2)], backend=self.backend)
+        self.assertEqual(failed, 0)
+        self.assertEqual(self.sent_ids(), [[1, 2]])
+
+    def test_failed_items_are_retried(self):
+        self.backend.bulk.side_effect = [
+            (1, [error(2, 429)]),
+            (1, []),
+        ]
+        failed = bulk_index([action(1), action(2)], backend=self.backend)
+        self.assertEqual(failed, 0)
+        self.assertEqual(self.sent_ids(), [[1, 2], [2]])
+        self.assertEqual(IndexDeadLetter.objects.count(), 0)
+
+    def test_connection_errors_are_retried(self):
+        self.backend.bulk.side_effect = ConnectionError('N/A', 'Timeout', None)
+        failed = bulk_index([action(1), action(2)], backend=self.backend)
+        self.assertEqual(failed, 2)
+        self.assertEqual(self.sent_ids(), [[1, 2], [1, 2], [1, 2]])
+
+        letters = IndexDeadLetter.objects.order_by('doc_id')
+        self.assertEqual(
+            [(letter.doc_id, letter.document_id) for letter in letters],
+            [('1', 1), ('2', 2)])
+
+    def test_invalid_items_are_not_retried(self):
+        self.backend.bulk.side_effect = [(1, [error(2, 400)])]
+        failed = bulk_index([action(1), action(2)], backend=self.backend)
+        self.assertEqual(failed, 1)
+        self.assertEqual(self.sent_ids(), [[1, 2]])
+
+        letter = IndexDeadLetter.objects.get()
+        self.assertEqual(letter.status, '400')
+        self.assertEqual(letter.error, 'Error 400')
+
+    def test_missing_deleted_items_are_ignored(self):
+        self.backend.bulk.side_effect = [(0, [error(1, 404, 'delete')])]
+        failed = bulk_index([action(1, 'delete')], backend=self.backend)
+        self.assertEqual(failed, 0)
+
+    def test_large_chunks_are_split(self):
+        def bulk(actions, **kwargs):
+            if len(actions) > 1:
+                raise TransportError(413, 'Request entity too large')
+            return 1, []
+        self.backend.bulk.side_effect = bulk
+
+        failed = bulk_index(
+            [action(1), action(2), action(3)], backend=self.backend)
+        self.assertEqual(failed, 0)
+        self.assertEqual(
+            self.sent_ids(), [[1, 2, 3], [1], [2, 3], [2], [3]])
+
+
+class ReplayTests(TestCase):
+    def setUp(self):
+        delete_index()
+        create_index()
+        self.category = CategoryFactory()
+        put_category_mapping(self.category.pk)
+
+    def tearDown(self):
+        delete_index()
+
+    def count(self):
+        return get_backend().search('test_documents', None, {})['hits']['total']
+
+    def test_replay(self):
+        doc = DocumentFactory(category=self.category)
+        revision = doc.get_latest_revision()
+        IndexDeadLetter.objects.create(
+            op_type='index',
+            doc_type=self.category.document_type(),
+            doc_id=revision.pk,
+            document_id=doc.pk)
+        self.assertEqual(self.count(), 0)
+
+        count = replay_dead_letters()
+        self.assertEqual(count, 1)
+        self.assertEqual(self.count(), 1)
+        self.assertEqual(IndexDeadLetter.objects.count(), 0)
+
+    def test_letters_are_kept_if_es_cannot_be_reached(self):
+        doc = DocumentFactory(category=self.category)
+        IndexDeadLetter.objects.create(
+            op_type='index',
+            doc_type=self.category.document_type(),
+            doc_id=doc.get_latest_revision().pk,
+            document_id=doc.pk)
+
+        with patch('search.utils.bulk_actions') as bulk_actions:
+            bulk_actions.side_effect = ConnectionError('Connection refused')
+            with self.assertRaises(ConnectionError):
+                replay_dead_letters()
+        self.assertEqual(IndexDeadLetter.objects.count(), 1)
@@ -0,0 +1,89 @@
+# -*- coding: utf8 -*-
+
+from __future__ import unicode_literals
+
+import datetime
+
+from django.conf import settings
+from django.test import TestCase
+from django.utils import timezone
+
+from categories.factories import CategoryFactory
+from documents.factories import DocumentFactory
+from documents.models import Document
+from search.consistency import (
+    check_index, diff_timestamps, normalize_timestamp, MISSING, STALE,
+    ORPHANED)
+from search.utils import (
+    create_index, delete_index, put_category_mapping, index_revisions,
+    bulk_actions, refresh_index)
+
+
+class DiffTests(TestCase):
+    def test_diff(self):
+        db = [(1, 'a'), (2, 'b'), (4, 'd'), (6, 'f')]
+        index = [(2, 'type', 'b'), (3, 'type', 'c'), (4, 'type', 'x'),
+                 (7, 'type', 'g')]
+        self.assertEqual(list(diff_timestamps(db, index)), [
+            (MISSING, 1, None),
+            (ORPHANED, 3, 'type'),
+            (STALE, 4, 'type'),
+            (MISSING, 6, None),
+            (ORPHANED, 7, 'type'),
+        ])
+
+    def test_normalize_timestamps(self):
+        date = datetime.datetime(2016, 5, 4, 10, 20, 30, 123456,
+                                 tzinfo=timezone.utc)
+        expected = date.replace(microsecond=123000)
+        self.assertEqual(normalize_timestamp(date), expected)
+        self.assertEqual(normalize_timestamp(date.isoformat()), expected)
+        self.assertEqual(
+            normalize_timestamp('2016-05-04T12:20:30.123+02:00'), expected)
+        self.assertEqual(normalize_timestamp(1462357230123), expected)
+
+
+class CheckIndexTests(TestCase):
+    def setUp(self):
+        delete_index()
+        create_index()
+        self.category = CategoryFactory()
+        put_category_mapping(self.category.pk)
+        self.docs = [
+            DocumentFactory(category=self.category) for i in range(4)]
+        self.revisions = [doc.get_latest_revision() for doc in self.docs]
+        self.revision_class = type(self.revisions[0])
+        index_revisions(self.revisions)
+
+    def tearDown(self):
+        delete_index()
+
+    def check(self, **kwargs):
+        counts = check_index([self.revision_class], chunk_size=2, **kwargs)
+        return (counts['checked'], counts[MISSING], counts[STALE],
+                counts[ORPHANED])
+
+    def test_consistent_index(self):
+        self.assertEqual(self.check(), (4, 0, 0, 0))
+
+    def test_repair(self):
+        bulk_actions([{
+            '_op_type': 'delete',
+            '_index': settings.ELASTIC_INDEX,
+            '_type': self.category.document_type(),
+            '_id': self.revisions[0].pk,
+        }])
+        refresh_index()
+
+        self.revisions[1].save()
+        Document.objects \
+            .filter(pk=self.docs[2].pk) \
+            .update(is_indexable=False)
+
+        self.assertEqual(self.check(), (3, 1, 1, 1))
+        self.assertEqual(self.check(), (3, 0, 0, 0))
+
+    def test_dry_run(self):
+        self.revisions[1].save()
+        self.assertEqual(self.check(repair=False), (4, 0, 1, 0))
+        self.assertEqual(self.check(repair=False), (4, 0, 1, 0))
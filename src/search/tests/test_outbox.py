@@ -0,0 +1,76 @@
+# -*- coding: utf8 -*-
+
+from __future__ import unicode_literals
+
+from django.test import TestCase
+from django.core.cache import cache
+
+from mock import patch
+
+from categories.factories import CategoryFactory
+from documents.factories import DocumentFactory
+from search.models import IndexOutboxEntry
+from search.outbox import (
+    enqueue_document, flush_outbox, suspended_indexing,
+    DRAIN_SCHEDULED_CACHE_KEY)
+
+
+@patch('search.outbox.refresh_index')
+@patch('search.outbox.bulk_actions')
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.category = CategoryFactory()
+        self.docs = [
+            DocumentFactory(category=self.category) for i in range(3)]
+        cache.delete(DRAIN_SCHEDULED_CACHE_KEY)
+
+    def test_enqueue_drains_the_outbox(self, bulk_mock, refresh_mock):
+        enqueue_document(self.docs[0].pk)
+        self.assertEqual(bulk_mock.call_count, 1)
+        self.assertEqual(refresh_mock.call_count, 1)
+        self.assertEqual(IndexOutboxEntry.objects.count(), 0)
+
+    def test_flush_deduplicates_documents(self, bulk_mock, refresh_mock):
+        with suspended_indexing(flush=False):
+            for doc in self.docs:
+                enqueue_document(doc.pk)
+                enqueue_document(doc.pk)
+        self.assertEqual(IndexOutboxEntry.objects.count(), 6)
+        self.assertEqual(bulk_mock.call_count, 0)
+
+        count = flush_outbox()
+        self.assertEqual(count, 3)
+        self.assertEqual(bulk_mock.call_count, 1)
+        self.assertEqual(refresh_mock.call_count, 1)
+        self.assertEqual(IndexOutboxEntry.objects.count(), 0)
+
+        actions = bulk_mock.call_args[0][0]
+        self.assertEqual(len(actions), 3)
+
+    def test_flush_by_batches(self, bulk_mock, refresh_mock):
+        with suspended_indexing(flush=False):
+            for doc in self.docs:
+                enqueue_document(doc.pk)
+
+        flush_outbox(batch_size=2)
+        self.assertEqual(bulk_mock.call_count, 2)
+        self.assertEqual(refresh_mock.call_count, 2)
+
+    def test_suspended_indexing_flushes_once(self, bulk_mock, refresh_mock):
+        with suspended_indexing():
+            with suspended_indexing():
+                for doc in self.docs:
+                    enqueue_document(doc.pk)
+            self.assertEqual(bulk_mock.call_count, 0)
+
+        self.assertEqual(bulk_mock.call_count, 1)
+        self.assertEqual(IndexOutboxEntry.objects.count(), 0)
+
+    def test_deleted_documents_are_skipped(self, bulk_mock, refresh_mock):
+        with suspended_indexing(flush=False):
+            enqueue_document(self.docs[0].pk)
+        self.docs[0].delete()
+
+        flush_outbox()
+        self.assertEqual(bulk_mock.call_count, 0)
+        self.assertEqual(IndexOutboxEntry.objects.count(), 0)
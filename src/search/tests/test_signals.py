@@ -39,7 +39,7 @@ class SignalTests(TestCase):
         CategoryFactory()
         self.assertEqual(index_mock.call_count, 1)
 
-    @patch('search.signals.index_document')
+    @patch('search.signals.enqueue_document')
     def test_created_document_is_indexed(self, index_mock):
         form = DemoMetadataForm({
             'title': 'Title',
@@ -52,7 +52,7 @@ class SignalTests(TestCase):
         save_document_forms(form, rev_form, self.category)
         self.assertEqual(index_mock.call_count, 1)
 
-    @patch('search.signals.index_document')
+    @patch('search.signals.enqueue_document')
     @patch('search.signals.unindex_document')
     def test_deleted_document_is_unindexed(self, index_mock, unindex_mock):
         form = DemoMetadataForm({
@@ -67,7 +67,7 @@ class SignalTests(TestCase):
         doc.delete()
         self.assertEqual(unindex_mock.call_count, 1)
 
-    @patch('search.signals.index_document')
+    @patch('search.signals.enqueue_document')
     def test_updated_document_is_indexed(self, index_mock):
         form = DemoMetadataForm({
             'title': 'Title',
@@ -82,7 +82,7 @@ class SignalTests(TestCase):
         doc.save()
         self.assertEqual(index_mock.call_count, 2)
 
-    @patch('search.signals.index_document')
+    @patch('search.signals.enqueue_document')
     def test_revised_document_is_indexed(self, index_mock):
         form = DemoMetadataForm({
             'title': 'Title',
@@ -0,0 +1,147 @@
+# -*- coding: utf8 -*-
+
+from __future__ import unicode_literals
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from mock import patch
+
+from categories.factories import CategoryFactory
+from documents.factories import DocumentFactory
+from default_documents.models import DemoMetadataRevision
+from search.models import ReindexCheckpoint, IndexReplayEntry
+from search.backends import get_backend
+from search.utils import (
+    iter_chunks, create_reindex_checkpoints, index_checkpoint,
+    log_index_writes, replay_index_writes, swap_index, finish_reindex,
+    create_index, create_index_version, get_index_versions, start_reindex,
+    delete_index)
+
+
+class ReindexTests(TestCase):
+    def setUp(self):
+        self.category = CategoryFactory()
+        self.docs = [
+            DocumentFactory(category=self.category) for i in range(10)]
+        self.pks = sorted(
+            DemoMetadataRevision.objects.values_list('pk', flat=True))
+
+    def test_iter_chunks(self):
+        qs = DemoMetadataRevision.objects.all()
+        chunks = list(iter_chunks(qs, 4))
+        self.assertEqual([len(chunk) for chunk in chunks], [4, 4, 2])
+        pks = [rev.pk for chunk in chunks for rev in chunk]
+        self.assertEqual(pks, self.pks)
+
+    def test_iter_chunks_from_pk(self):
+        qs = DemoMetadataRevision.objects.all()
+        chunks = list(iter_chunks(qs, 4, start_pk=self.pks[5]))
+        pks = [rev.pk for chunk in chunks for rev in chunk]
+        self.assertEqual(pks, self.pks[6:])
+
+    def test_checkpoints_cover_all_revisions(self):
+        checkpoints = create_reindex_checkpoints([DemoMetadataRevision], 3)
+        self.assertEqual(checkpoints.count(), 3)
+
+        pks = []
+        for checkpoint in checkpoints:
+            pks += checkpoint.get_queryset() \
+                .filter(pk__gt=checkpoint.start_pk) \
+                .values_list('pk', flat=True)
+        self.assertEqual(sorted(pks), self.pks)
+
+    @patch('search.utils.get_backend')
+    def test_index_checkpoint(self, backend_mock):
+        backend_mock.return_value.bulk.return_value = (0, [])
+        checkpoint = create_reindex_checkpoints([DemoMetadataRevision])[0]
+        count = index_checkpoint(checkpoint.pk, chunk_size=3)
+        self.assertEqual(count, 10)
+        self.assertEqual(backend_mock.return_value.bulk.call_count, 4)
+
+        checkpoint = ReindexCheckpoint.objects.get(pk=checkpoint.pk)
+        self.assertTrue(checkpoint.is_done)
+        self.assertEqual(checkpoint.last_pk, self.pks[-1])
+
+    @patch('search.utils.get_backend')
+    def test_resume_checkpoint(self, backend_mock):
+        backend_mock.return_value.bulk.return_value = (0, [])
+        checkpoint = create_reindex_checkpoints([DemoMetadataRevision])[0]
+        checkpoint.mark_progress(self.pks[6])
+
+        count = index_checkpoint(checkpoint.pk, chunk_size=3)
+        self.assertEqual(count, 3)
+        self.assertEqual(backend_mock.return_value.bulk.call_count, 1)
+
+        # A finished unit is never indexed twice
+        count = index_checkpoint(checkpoint.pk, chunk_size=3)
+        self.assertEqual(count, 0)
+
+
+@override_settings(SEARCH_BACKEND='search.backends.local.LocalBackend')
+class BlueGreenReindexTests(TestCase):
+    def setUp(self):
+        self.category = CategoryFactory()
+        self.docs = [
+            DocumentFactory(category=self.category) for i in range(3)]
+        self.backend = get_backend()
+        delete_index()
+
+    def count(self, index):
+        response = self.backend.search(index, None, {})
+        return response['hits']['total']
+
+    def test_writes_are_only_logged_during_a_build(self):
+        log_index_writes([self.docs[0].pk])
+        self.assertEqual(IndexReplayEntry.objects.count(), 0)
+
+        create_reindex_checkpoints(
+            [DemoMetadataRevision], index_name='test_documents_new')
+        log_index_writes([self.docs[0].pk, self.docs[0].pk, self.docs[1].pk])
+        self.assertEqual(IndexReplayEntry.objects.count(), 2)
+
+    def test_checkpoint_builds_new_index(self):
+        create_index()
+        index, checkpoints = start_reindex([DemoMetadataRevision])
+        index_checkpoint(checkpoints[0].pk)
+        self.assertEqual(self.count(index), 3)
+        self.assertEqual(self.count('test_documents'), 0)
+
+    def test_replay_writes(self):
+        create_index()
+        index, checkpoints = start_reindex([DemoMetadataRevision])
+        log_index_writes([doc.pk for doc in self.docs])
+
+        count = replay_index_writes(index)
+        self.assertEqual(count, 3)
+        self.assertEqual(self.count(index), 3)
+        self.assertEqual(IndexReplayEntry.objects.count(), 0)
+
+    def test_swap_index(self):
+        create_index()
+        old_index, = get_index_versions()
+        new_index = create_index_version()
+
+        swap_index(new_index)
+        self.assertEqual(get_index_versions(), [new_index])
+        self.assertFalse(self.backend.index_exists(old_index))
+
+    def test_swap_plain_index(self):
+        self.backend.create_index('test_documents', {})
+        new_index = create_index_version()
+
+        swap_index(new_index)
+        self.assertEqual(get_index_versions(), [new_index])
+
+    def test_finish_reindex_stops_logging(self):
+        create_index()
+        index, checkpoints = start_reindex([DemoMetadataRevision])
+        log_index_writes([self.docs[0].pk])
+
+        count = finish_reindex(index)
+        self.assertEqual(count, 1)
+        self.assertEqual(ReindexCheckpoint.objects.count(), 0)
+        self.assertEqual(get_index_versions(), [index])
+
+        log_index_writes([self.docs[0].pk])
+        self.assertEqual(IndexReplayEntry.objects.count(), 0)
@@ -0,0 +1,214 @@
+# -*- coding: utf8 -*-
+
+from __future__ import unicode_literals
+
+import json
+
+from django.test import TestCase
+from django.core.urlresolvers import reverse
+from django.core.cache import caches
+from django.conf import settings
+
+from mock import patch
+
+from accounts.factories import UserFactory
+from categories.factories import CategoryFactory
+from documents.factories import DocumentFactory
+from search.backends.local import LocalBackend
+from search.caching import (
+    mark_written, mark_refreshed, get_index_generation)
+from search.utils import (
+    create_index, delete_index, put_category_mapping, index_revisions,
+    build_index_actions, bulk_actions)
+
+
+@patch.object(LocalBackend, 'execute', autospec=True,
+              side_effect=LocalBackend.execute)
+class SearchCacheTests(TestCase):
+    def setUp(self):
+        delete_index()
+        create_index()
+        self.category = CategoryFactory()
+        self.other_category = CategoryFactory()
+        for category in (self.category, self.other_category):
+            put_category_mapping(category.pk)
+
+        user = UserFactory(
+            email='testadmin@phase.fr',
+            password='pass',
+            is_superuser=True,
+            category=self.category)
+        self.client.login(email=user.email, password='pass')
+
+        self.docs = [
+            DocumentFactory(category=self.category) for i in range(3)]
+        index_revisions([doc.get_latest_revision() for doc in self.docs])
+        self.url = reverse('search_documents', args=[
+            self.category.organisation.slug,
+            self.category.slug])
+
+    def search(self, **params):
+        response = self.client.get(self.url, params)
+        return json.loads(response.content)
+
+    def test_identical_searches_are_cached(self, execute_mock):
+        results = self.search()
+        self.assertEqual(results['total'], 3)
+        self.assertEqual(execute_mock.call_count, 1)
+
+        cached_results = self.search()
+        self.assertEqual(cached_results, results)
+        self.assertEqual(execute_mock.call_count, 1)
+
+    def test_different_filters_are_not_cached(self, execute_mock):
+        self.search()
+        self.search(start=1)
+        self.search(sort_by='title')
+        self.assertEqual(execute_mock.call_count, 3)
+
+    def test_indexing_invalidates_cache(self, execute_mock):
+        self.search()
+        doc = DocumentFactory(category=self.category)
+        index_revisions([doc.get_latest_revision()])
+
+        results = self.search()
+        self.assertEqual(results['total'], 4)
+        self.assertEqual(execute_mock.call_count, 2)
+
+    def test_indexing_other_category_keeps_cache(self, execute_mock):
+        self.search()
+        doc = DocumentFactory(category=self.other_category)
+        index_revisions([doc.get_latest_revision()])
+
+        self.search()
+        self.assertEqual(execute_mock.call_count, 1)
+
+    def get_cache_timeouts(self, **params):
+        cache = caches['default']
+        with patch.object(cache, 'set', wraps=cache.set) as set_mock:
+            self.search(**params)
+        return [call[0][2] for call in set_mock.call_args_list
+                if call[0][0].startswith('search_')]
+
+    def test_results_cached_before_refresh_expire_soon(self, execute_mock):
+        # Written, but not refreshed (e.g in a celery worker)
+        doc = DocumentFactory(category=self.category)
+        bulk_actions(build_index_actions([doc.get_latest_revision()]))
+
+        self.assertEqual(
+            self.get_cache_timeouts(),
+            [settings.SEARCH_CACHE_WRITE_DELAY] * 2)
+
+        caches['default'].clear()
+        self.assertEqual(
+            self.get_cache_timeouts(),
+            [settings.SEARCH_CACHE_TIMEOUT] * 2)
+
+    def test_old_writes_are_not_invalidated_on_refresh(self, execute_mock):
+        document_type = self.category.document_type()
+        with patch('search.caching.time.time', return_value=1000):
+            mark_written([document_type])
+        generation = get_index_generation(document_type)
+
+        delay = settings.SEARCH_CACHE_WRITE_DELAY
+        with patch('search.caching.time.time', return_value=1001 + delay):
+            mark_refreshed()
+        self.assertEqual(get_index_generation(document_type), generation)
+
+        mark_written([document_type])
+        generation = get_index_generation(document_type)
+        mark_refreshed()
+        self.assertNotEqual(get_index_generation(document_type), generation)
+
+    def has_aggregations(self, execute_call):
+        query = execute_call[0][1]
+        return 'aggs' in query.to_dict()
+
+    def test_paging_reuses_cached_facets(self, execute_mock):
+        results = self.search(size=1)
+        self.assertTrue(self.has_aggregations(execute_mock.call_args))
+
+        page = self.search(size=1, start=1)
+        self.assertEqual(execute_mock.call_count, 2)
+        self.assertFalse(self.has_aggregations(execute_mock.call_args))
+        self.assertEqual(page['aggregations'], results['aggregations'])
+        self.assertEqual(len(page['data']), 1)
+        self.assertNotEqual(page['data'], results['data'])
+
+        self.search(size=1, sort_by='title')
+        self.assertEqual(execute_mock.call_count, 3)
+        self.assertFalse(self.has_aggregations(execute_mock.call_args))
+
+    def test_filtering_computes_facets(self, execute_mock):
+        self.search()
+        self.search(search_terms=self.docs[0].document_key)
+        self.assertEqual(execute_mock.call_count, 2)
+        self.assertTrue(self.has_aggregations(execute_mock.call_args))
+
+    def test_indexing_invalidates_facets(self, execute_mock):
+        self.search()
+        doc = DocumentFactory(category=self.category)
+        index_revisions([doc.get_latest_revision()])
+
+        self.search(start=1)
+        self.assertTrue(self.has_aggregations(execute_mock.call_args))
+
+    def test_cursor_pagination(self, execute_mock):
+        first_page = self.search(size=2, sort_by='document_key')
+        self.assertEqual(len(first_page['data']), 2)
+
+        next_page = self.search(
+            size=2, start=2, sort_by='document_key',
+            after=first_page['cursor'])
+        keys = [doc['document_key'] for doc in
+                first_page['data'] + next_page['data']]
+        self.assertEqual(keys, sorted(doc.document_key for doc in self.docs))
+
+    def test_cursor_pages_keep_total_and_facets(self, execute_mock):
+        docs = [DocumentFactory(category=self.category) for i in range(7)]
+        index_revisions([doc.get_latest_revision() for doc in docs])
+
+        first_page = self.search(size=3, sort_by='document_key')
+        pages = [first_page]
+        while pages[-1]['cursor'] and len(pages) < 5:
+            pages.append(self.search(
+                size=3, sort_by='document_key', after=pages[-1]['cursor']))
+
+        self.assertEqual([page['total'] for page in pages], [10] * 5)
+        self.assertEqual(
+            sum(len(page['data']) for page in pages[:4]), 10)
+        for page in pages:
+            self.assertEqual(page['aggregations'], first_page['aggregations'])
+
+    def test_cursor_page_computes_full_facets(self, execute_mock):
+        first_page = self.search(size=2, sort_by='document_key')
+
+        # Indexing empties the facets cache
+        doc = DocumentFactory(category=self.category)
+        index_revisions([doc.get_latest_revision()])
+        execute_mock.reset_mock()
+
+        next_page = self.search(
+            size=2, sort_by='document_key', after=first_page['cursor'])
+        self.assertEqual(next_page['total'], 4)
+        facets_query = execute_mock.call_args_list[0][0][1].to_dict()
+        self.assertIn('aggs', facets_query)
+        self.assertNotIn('range', json.dumps(facets_query))
+
+        # The cached facets are not partial
+        page = self.search(size=2, sort_by='document_key')
+        self.assertEqual(page['total'], 4)
+        self.assertEqual(page['aggregations'], next_page['aggregations'])
+
+    def test_invalid_cursor(self, execute_mock):
+        results = self.search(after='invalid')
+        self.assertEqual(results['total'], 0)
+        self.assertEqual(execute_mock.call_count, 0)
+
+    def test_only_list_fields_are_returned(self, execute_mock):
+        results = self.search()
+        columns = self.category.document_class().PhaseConfig.column_fields
+        expected_keys = set(field for _, field in columns)
+        expected_keys.update(('document_pk', 'document_key'))
+        for row in results['data']:
+            self.assertEqual(set(row.keys()), expected_keys)
@@ -3,17 +3,28 @@
 from __future__ import unicode_literals
 
 import logging
+from collections import defaultdict
+from itertools import groupby
 
 from django.db.models.fields import FieldDoesNotExist
+from django.db.models import Min, Max
 from django.db import models
-
-from elasticsearch.helpers import bulk
-from elasticsearch.exceptions import ConnectionError
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
 
 from core.celery import app
 from categories.models import Category
-from search import elastic, INDEX_SETTINGS
+from search.analysis import (
+    get_profile, get_index_settings, get_all_field_mapping, get_field_mapping,
+    COMPACT, DOCUMENT_NUMBER_FIELDS)
+from search.backends import get_backend
+from search.bulk import bulk_index
+from search.caching import (
+    mark_written, mark_refreshed, bump_index_generation)
+from search.models import (
+    ReindexCheckpoint, IndexReplayEntry, IndexDeadLetter)
 from documents.models import Document
+from documents.serializers import get_serializer
 from django.conf import settings
 
 
@@ -23,35 +34,103 @@ logger = logging.getLogger(__name__)
 def refresh_index():
     """Make latest data available."""
     index = settings.ELASTIC_INDEX
-    elastic.indices.refresh(index=index)
+    get_backend().refresh(index)
+    mark_refreshed()
 
 
 def create_index():
-    """Create all needed indexes."""
-    index = settings.ELASTIC_INDEX
-    elastic.indices.create(index=index, ignore=400, body=INDEX_SETTINGS)
+    """Create all needed indexes.
+
+    `settings.ELASTIC_INDEX` is an alias to a versioned index, so the index
+    can be rebuilt without downtime.
+
+    """
+    alias = settings.ELASTIC_INDEX
+    backend = get_backend()
+    if not backend.index_exists(alias):
+        index = create_index_version()
+        backend.set_alias(alias, index)
+        bump_index_generation()
+
+
+def create_index_version():
+    """Create a new empty versioned index, and return it's name."""
+    index = '{}_{}'.format(
+        settings.ELASTIC_INDEX,
+        timezone.now().strftime('%Y%m%d%H%M%S%f'))
+    get_backend().create_index(index, get_index_settings())
+    return index
+
+
+def get_index_versions():
+    """Returns the names of the indexes behind the alias."""
+    return get_backend().get_alias_indexes(settings.ELASTIC_INDEX)
 
 
 def delete_index():
     """Delete existing ES indexes."""
-    index = settings.ELASTIC_INDEX
-    elastic.indices.delete(index=index, ignore=404)
+    # Before aliases were used, the index was a plain index
+    indexes = get_index_versions() or [settings.ELASTIC_INDEX]
+    get_backend().delete_indexes(indexes)
+    bump_index_generation()
+
+
+def swap_index(index):
+    """Make the alias point to the given index, and delete the old ones.
+
+    The alias is updated in a single atomic operation.
+
+    """
+    alias = settings.ELASTIC_INDEX
+    backend = get_backend()
+    old_indexes = get_index_versions()
+    if not old_indexes and backend.index_exists(alias):
+        # The live index is a plain index created before aliases were
+        # used. It must be deleted before an alias can be created with
+        # the same name.
+        backend.delete_indexes([alias])
+
+    backend.set_alias(alias, index, remove=old_indexes)
+    bump_index_generation()
+
+    old_indexes = [old_index for old_index in old_indexes if old_index != index]
+    if old_indexes:
+        backend.delete_indexes(old_indexes)
+
+
+def get_building_index():
+    """Returns the name of the index being built by a reindex, if any."""
+    checkpoint = ReindexCheckpoint.objects \
+        .exclude(index_name='') \
+        .only('index_name') \
+        .first()
+    return checkpoint.index_name if checkpoint else None
+
+
+def log_index_writes(document_ids):
+    """Keep track of the documents written in the live index.
+
+    If a new index is being built, those writes will be replayed on it.
+
+    """
+    if get_building_index():
+        IndexReplayEntry.objects.bulk_create([
+            IndexReplayEntry(document_id=document_id)
+            for document_id in set(document_ids)])
 
 
 def index_revision(revision):
     """Saves a document's revision into ES's index."""
     document = revision.document
     es_key = '{}_{}'.format(document.document_key, revision.revision)
-    try:
-        elastic.index(
-            index=settings.ELASTIC_INDEX,
-            doc_type=document.document_type(),
-            id=es_key,
-            body=revision.to_json(),
-        )
-    except ConnectionError:
-        logger.error('Error connecting to ES. The doc %d will no be indexed' %
-                     es_key)
+    log_index_writes([document.pk])
+    bulk_index([{
+        '_index': settings.ELASTIC_INDEX,
+        '_type': document.document_type(),
+        '_id': es_key,
+        '_source': revision.to_json(),
+    }])
+    mark_written([document.document_type()])
 
 
 @app.task
@@ -61,32 +140,23 @@ def index_document(document_id):
         .select_related() \
         .get(pk=document_id)
     revisions = document.get_all_revisions()
-    actions = map(build_index_data, revisions)
-
-    bulk(
-        elastic,
-        actions,
-        chunk_size=settings.ELASTIC_BULK_SIZE,
-        request_timeout=60)
+    actions = build_index_actions(revisions)
+    bulk_actions(actions)
 
 
 def index_revisions(revisions):
     """Index a bunch of revisions."""
-    actions = map(build_index_data, revisions)
-    bulk(
-        elastic,
-        actions,
-        chunk_size=settings.ELASTIC_BULK_SIZE,
-        request_timeout=60)
+    actions = build_index_actions(revisions)
+    bulk_actions(actions)
     refresh_index()
 
 
 def bulk_actions(actions):
-    bulk(
-        elastic,
-        actions,
-        chunk_size=settings.ELASTIC_BULK_SIZE,
-        request_timeout=60)
+    log_index_writes(
+        action['_source']['document_pk']
+        for action in actions if '_source' in action)
+    bulk_index(actions)
+    mark_written(action['_type'] for action in actions)
 
 
 def build_index_data(revision):
@@ -98,6 +168,253 @@ def build_index_data(revision):
     }
 
 
+def build_index_actions(revisions, index=None):
+    """Same as `build_index_data` for a list of revisions.
+
+    Revisions are serialized in batch, which is much faster than calling
+    `to_json` on every single revision.
+
+    """
+    index = index or settings.ELASTIC_INDEX
+    document_types = {}
+    actions = []
+    grouped = groupby(revisions, lambda revision: type(revision.metadata))
+    for metadata_class, group in grouped:
+        group = list(group)
+        sources = get_serializer(metadata_class).serialize_many(group)
+        for revision, source in zip(group, sources):
+            category = revision.metadata.document.category
+            if category.pk not in document_types:
+                document_types[category.pk] = category.document_type()
+
+            actions.append({
+                '_index': index,
+                '_type': document_types[category.pk],
+                '_id': revision.unique_id,
+                '_source': source,
+            })
+    return actions
+
+
+def get_indexable_revisions(revision_class):
+    """Returns the queryset of all revisions of a class that must be indexed."""
+    return revision_class.objects \
+        .filter(metadata__document__is_indexable=True) \
+        .select_related()
+
+
+def get_documents_revisions(document_ids):
+    """Returns all the indexable revisions of the given documents.
+
+    We run a single query per revision class, instead of one per document.
+
+    """
+    documents = Document.objects \
+        .filter(pk__in=document_ids) \
+        .filter(is_indexable=True) \
+        .select_related('category__category_template__metadata_model')
+
+    ids_by_class = defaultdict(list)
+    for document in documents:
+        ids_by_class[document.get_revision_class()].append(document.pk)
+
+    revisions = []
+    for revision_class, ids in ids_by_class.items():
+        revisions += list(get_indexable_revisions(revision_class)
+                          .filter(metadata__document__in=ids)
+                          .order_by('pk'))
+    return revisions
+
+
+def iter_chunks(qs, chunk_size, start_pk=0):
+    """Iterate over a queryset by chunks of objects ordered by pk.
+
+    We use keyset pagination (`pk > last_seen_pk`) instead of offsets, so
+    fetching a chunk does not get slower as we go, and only a single chunk
+    is ever held in memory.
+
+    """
+    last_pk = start_pk
+    while True:
+        chunk = list(qs.filter(pk__gt=last_pk).order_by('pk')[:chunk_size])
+        if not chunk:
+            break
+
+        yield chunk
+        last_pk = chunk[-1].pk
+
+
+def create_reindex_checkpoints(revision_classes, nb_ranges=1, index_name=''):
+    """Split the reindex of the given classes into resumable work units.
+
+    Every revision class is split into `nb_ranges` pk ranges of (roughly)
+    the same width. Existing checkpoints are deleted.
+
+    """
+    ReindexCheckpoint.objects.all().delete()
+    checkpoints = []
+    for revision_class in revision_classes:
+        revision_type = ContentType.objects.get_for_model(revision_class)
+        pks = get_indexable_revisions(revision_class) \
+            .aggregate(min_pk=Min('pk'), max_pk=Max('pk'))
+        if pks['max_pk'] is None:
+            continue
+
+        start = pks['min_pk'] - 1
+        end = pks['max_pk']
+        width = max((end - start) // nb_ranges, 1)
+        while start < end:
+            range_end = end if end - start < 2 * width else start + width
+            checkpoints.append(ReindexCheckpoint(
+                revision_type=revision_type,
+                start_pk=start,
+                end_pk=range_end,
+                last_pk=start,
+                index_name=index_name))
+            start = range_end
+
+    ReindexCheckpoint.objects.bulk_create(checkpoints)
+    return ReindexCheckpoint.objects.all()
+
+
+def index_checkpoint(checkpoint_id, chunk_size=None, backend=None):
+    """Index all the revisions of a single reindex work unit.
+
+    Revisions are streamed from the db and sent to ES chunk by chunk, and
+    the checkpoint is saved after every chunk.
+
+    """
+    chunk_size = chunk_size or settings.ELASTIC_REINDEX_CHUNK_SIZE
+    backend = backend or get_backend()
+    checkpoint = ReindexCheckpoint.objects \
+        .select_related('revision_type') \
+        .get(pk=checkpoint_id)
+    if checkpoint.is_done:
+        return 0
+
+    logger.info('Indexing {}'.format(checkpoint))
+    qs = checkpoint.get_queryset()
+    count = 0
+    index = checkpoint.index_name or settings.ELASTIC_INDEX
+    for chunk in iter_chunks(qs, chunk_size, start_pk=checkpoint.last_pk):
+        actions = build_index_actions(chunk, index=index)
+        bulk_index(actions, backend=backend, request_timeout=600)
+        checkpoint.mark_progress(chunk[-1].pk)
+        count += len(chunk)
+
+    checkpoint.mark_done()
+    return count
+
+
+def start_reindex(revision_classes, nb_ranges=1):
+    """Create a new index, and the work units to fill it.
+
+    From now on, and until `finish_reindex` is called, documents written
+    in the live index are logged to be replayed on the new index.
+
+    """
+    previous_index = get_building_index()
+    if previous_index:
+        logger.info('Deleting unfinished index {}'.format(previous_index))
+        get_backend().delete_indexes([previous_index])
+
+    IndexReplayEntry.objects.all().delete()
+    index = create_index_version()
+    categories = Category.objects.values_list('pk', flat=True)
+    for category_id in categories:
+        put_category_mapping(category_id, index=index)
+
+    checkpoints = create_reindex_checkpoints(
+        revision_classes, nb_ranges, index_name=index)
+    return index, checkpoints
+
+
+def replay_index_writes(index, batch_size=None):
+    """Copy to the new index the documents written in the live index.
+
+    Documents are reindexed from the db, and deleted documents or
+    revisions are removed.
+
+    """
+    batch_size = batch_size or settings.ELASTIC_REINDEX_CHUNK_SIZE
+    backend = get_backend()
+    count = 0
+    while True:
+        entries = list(IndexReplayEntry.objects
+                       .order_by('pk')
+                       .values_list('pk', 'document_id')[:batch_size])
+        if not entries:
+            break
+
+        document_ids = list(set(document_id for _, document_id in entries))
+        backend.delete_by_terms(index, 'document_pk', document_ids)
+        revisions = get_documents_revisions(document_ids)
+        bulk_index(build_index_actions(revisions, index=index), backend=backend)
+
+        entry_ids = [entry_id for entry_id, _ in entries]
+        IndexReplayEntry.objects.filter(pk__in=entry_ids).delete()
+        count += len(document_ids)
+    return count
+
+
+def replay_dead_letters(batch_size=None):
+    """Run again the index actions that failed.
+
+    Documents are reindexed from the db, so the latest data is indexed
+    whatever the failure date. Actions that fail again are moved back to
+    the dead letter table.
+
+    """
+    batch_size = batch_size or settings.ELASTIC_REINDEX_CHUNK_SIZE
+    max_pk = IndexDeadLetter.objects.aggregate(max_pk=Max('pk'))['max_pk']
+    count = 0
+    last_pk = 0
+    while max_pk is not None:
+        letters = list(IndexDeadLetter.objects
+                       .filter(pk__gt=last_pk, pk__lte=max_pk)
+                       .order_by('pk')[:batch_size])
+        if not letters:
+            break
+
+        document_ids = set(
+            letter.document_id for letter in letters
+            if letter.op_type != 'delete' and letter.document_id)
+        revisions = get_documents_revisions(document_ids)
+        actions = build_index_actions(revisions)
+        actions += [{
+            '_op_type': 'delete',
+            '_index': settings.ELASTIC_INDEX,
+            '_type': letter.doc_type,
+            '_id': letter.doc_id,
+        } for letter in letters if letter.op_type == 'delete']
+
+        # Letters are kept if ES cannot be reached. Actions that fail again
+        # are saved in new letters.
+        bulk_actions(actions)
+        last_pk = letters[-1].pk
+        IndexDeadLetter.objects \
+            .filter(pk__in=[letter.pk for letter in letters]) \
+            .delete()
+        count += len(letters)
+
+    refresh_index()
+    return count
+
+
+def finish_reindex(index):
+    """Replay the pending writes and make the new index live."""
+    count = replay_index_writes(index)
+    swap_index(index)
+
+    # The new index is live, so writes don't need to be logged anymore.
+    # Writes logged until then are replayed one last time.
+    ReindexCheckpoint.objects.all().delete()
+    count += replay_index_writes(index)
+    refresh_index()
+    bump_index_generation()
+    return count
+
+
 @app.task
 def unindex_document(document_id):
     """Removes all revisions of a document from the index."""
@@ -105,6 +422,7 @@ def unindex_document(document_id):
         .select_related() \
         .get(pk=document_id)
     revisions = document.get_all_revisions()
+    log_index_writes([document.pk])
     actions = map(lambda revision: {
         '_op_type': 'delete',
         '_index': settings.ELASTIC_INDEX,
@@ -112,12 +430,8 @@ def unindex_document(document_id):
         '_id': revision.unique_id,
     }, revisions)
 
-    bulk(
-        elastic,
-        actions,
-        raise_on_error=False,
-        chunk_size=settings.ELASTIC_BULK_SIZE,
-        request_timeout=60)
+    bulk_index(actions)
+    mark_written([document.document_type()])
 
 
 TYPE_MAPPING = [
@@ -130,23 +444,28 @@ TYPE_MAPPING = [
 
 
 @app.task
-def put_category_mapping(category_id):
+def put_category_mapping(category_id, index=None):
+    """Create the category mapping.
+
+    By default, the mapping is created in the live index, and in the index
+    being built if there is one.
+
+    """
     category = Category.objects \
         .select_related('organisation', 'category_template__metadata_model') \
         .get(pk=category_id)
 
+    if index is None:
+        indexes = [settings.ELASTIC_INDEX, get_building_index()]
+        index = ','.join(filter(None, indexes))
+
     doc_class = category.document_class()
     doc_type = category.document_type()
     mapping = get_mapping(doc_class)
-    elastic.indices.put_mapping(
-        index=settings.ELASTIC_INDEX,
-        doc_type=doc_type,
-        body=mapping,
-        ignore_conflicts=True
-    )
+    get_backend().put_mapping(index, doc_type, mapping)
 
 
-def get_mapping(doc_class):
+def get_mapping(doc_class, profile=None):
     """Creates an elasticsearch mapping for a given document class.
 
     See: http://www.elasticsearch.org/guide/en/elasticsearch/reference/current/mapping.html
@@ -157,14 +476,13 @@ def get_mapping(doc_class):
 
     See: http://www.elasticsearch.org/guide/en/elasticsearch/guide/current/multi-fields.html
 
+    Analyzers depend on the analyzer profile, see `search.analysis`.
+
     """
+    profile = get_profile(profile)
     revision_class = doc_class.get_revision_class()
     mapping = {
-        '_all': {
-            'index_analyzer': 'nGram_analyzer',
-            'search_analyzer': 'whitespace_analyzer',
-            'index': 'not_analyzed',
-        },
+        '_all': get_all_field_mapping(profile),
         'properties': {}
     }
 
@@ -190,19 +508,16 @@ def get_mapping(doc_class):
 
         es_type = get_mapping_type(field) if field else 'string'
 
-        mapping['properties'].update({
-            field_name: {
-                'type': es_type,
-                'include_in_all': field_name in column_fields,
-                'fields': {
-                    'raw': {
-                        'type': es_type,
-                        'index': 'not_analyzed',
-                        'include_in_all': False
-                    }
-                }
-            }
-        })
+        mapping['properties'][field_name] = get_field_mapping(
+            field_name, es_type, field_name in column_fields, profile)
+
+    if profile == COMPACT:
+        # Document numbers need a dedicated analysis, even if they are not
+        # displayed in columns
+        for field_name in DOCUMENT_NUMBER_FIELDS:
+            if field_name not in mapping['properties']:
+                mapping['properties'][field_name] = get_field_mapping(
+                    field_name, 'string', True, profile)
 
     return mapping
 
@@ -5,15 +5,29 @@ from __future__ import unicode_literals
 from braces.views import JSONResponseMixin
 
 from search.builder import SearchBuilder
+from search.caching import (
+    get_results_cache_key, get_facets_cache_key, get_cached_results,
+    set_cached_results)
+from documents.serializers import get_serializer
 from documents.views import BaseDocumentList
 from django.conf import settings
+from django.core.cache import cache
 
 
 class SearchDocuments(JSONResponseMixin, BaseDocumentList):
     http_method_names = ['get']
 
     def get_queryset(self):
-        """Given DataTables' GET parameters, filter the initial queryset."""
+        """Given DataTables' GET parameters, filter the initial queryset.
+
+        Search results are cached until documents of this category are
+        indexed again.
+
+        Aggregations (facets) and the total number of hits only depend on the
+        filters, so they are cached separately and are not computed again
+        when the user is only paging through or sorting the results.
+
+        """
         super(SearchDocuments, self).get_queryset()
         if self.request.user.is_external:
             entities = self.get_external_filtering()
@@ -22,32 +36,92 @@ class SearchDocuments(JSONResponseMixin, BaseDocumentList):
         try:
             builder = SearchBuilder(self.category,
                                     self.request.GET,
-                                    filter_on_entities=entities)
-            query = builder.build_query()
-            query = builder.add_aggregations(query)
-            results = query.execute()
+                                    filter_on_entities=entities,
+                                    search_after=self.request.GET.get('after'))
         except RuntimeError:
-            results = []
+            return {'total': 0, 'data': [], 'cursor': None, 'aggregations': {}}
+
+        document_type = self.category.document_type()
+        results_key = get_results_cache_key(builder)
+        facets_key = get_facets_cache_key(builder)
+        facets = cache.get(facets_key)
+        if facets is None and builder.sort_after is None:
+            # Facets are computed along with the first page of hits,
+            # so a new search only costs a single query
+            results = self.search(builder, with_aggregations=True)
+            facets = {
+                'total': results['total'],
+                'aggregations': results.pop('aggregations'),
+            }
+            set_cached_results(facets_key, facets, document_type)
+            set_cached_results(results_key, results, document_type)
+        else:
+            if facets is None:
+                # Cursor pages only contain the following hits, so the
+                # facets are computed on the whole result set
+                facets = self.search_facets(builder)
+                set_cached_results(facets_key, facets, document_type)
+            results = get_cached_results(
+                results_key, lambda: self.search(builder), document_type)
+
+        return dict(results, **facets)
+
+    def search(self, builder, with_aggregations=False):
+        """Run the search query.
 
+        Only the fields displayed in the document list are fetched.
+
+        """
+        list_fields = get_serializer(self.category.document_class()).list_fields
+        query = builder.build_query(source=list_fields)
+        if with_aggregations:
+            query = builder.add_aggregations(query)
+        response = builder.execute(query)
+        hits = response.hits
+
+        # The list template needs every column, even if the value is missing
+        empty_row = dict.fromkeys(list_fields)
+        data = []
+        for hit in hits:
+            row = empty_row.copy()
+            row.update(hit._d_)
+            data.append(row)
+
+        # When a cursor is set, only the hits after the cursor are counted
+        results = {
+            'total': hits.total,
+            'data': data,
+            'cursor': builder.get_cursor(hits[-1]) if hits else None,
+        }
+        if with_aggregations:
+            results['aggregations'] = self.format_aggregations(
+                response.aggregations)
         return results
 
+    def search_facets(self, builder):
+        """Returns the total and aggregations of the whole result set."""
+        response = builder.execute(builder.build_facets_query())
+        return {
+            'total': response.hits.total,
+            'aggregations': self.format_aggregations(response.aggregations),
+        }
+
     def render_to_response(self, context, **response_kwargs):
         return self.render_json_response(context, **response_kwargs)
 
     def get_context_data(self, **kwargs):
-        response = self.get_queryset()
+        results = self.object_list
         start = int(self.request.GET.get('start', 0))
         end = start + int(self.request.GET.get('length', settings.PAGINATE_BY))
-        total = response.hits.total
+        total = results['total']
         display = min(end, total)
-        search_data = [hit._d_ for hit in response.hits]
-        aggregations = self.format_aggregations(response.aggregations)
 
         return {
             'total': total,
             'display': display,
-            'data': search_data,
-            'aggregations': aggregations,
+            'data': results['data'],
+            'cursor': results['cursor'],
+            'aggregations': results['aggregations'],
         }
 
     def format_aggregations(self, aggregations):
@@ -0,0 +1,23 @@
+var Phase = Phase || {};
+
+jQuery(function($) {
+    "use strict";
+
+    /* reload the page to download the archive once it's built */
+
+    var $archive = $('.archive-download');
+    var pollId = setInterval(function() {
+        $.get($archive.data('poll-url'), function(data) {
+            if (!data.done) {
+                return;
+            }
+            clearInterval(pollId);
+            if (data.success) {
+                location.reload();
+            } else {
+                $archive.find('.archive-status').hide();
+                $archive.find('.archive-error').show();
+            }
+        });
+    }, 2000);
+});
@@ -37,14 +37,22 @@ var Phase = Phase || {};
         /**
          * Set the pagination params to fetch next batch of results.
          *
+         * The cursor returned with the last results is used when available,
+         * so the server does not have to skip all the previous results.
+         *
          * Since we don't want to replace the currently displayed results,
          * we don't trigger the "change" event, and let the calling object
          * be responsible of triggering the actual search query.
          */
-        nextPage: function() {
+        nextPage: function(cursor) {
             var start = this.get('start');
             var size = this.get('size');
             this.set('start', start + size, {silent: true});
+            if (cursor) {
+                this.set('after', cursor, {silent: true});
+            } else {
+                this.unset('after', {silent: true});
+            }
         },
         /**
          * Set the pagination params to fetch the first results.
@@ -58,6 +66,7 @@ var Phase = Phase || {};
                 'start': defaults.start,
                 'size': defaults.size
             }, {silent: true});
+            this.unset('after', {silent: true});
         }
     });
 
@@ -83,6 +83,7 @@ var Phase = Phase || {};
             // because it breaks… stuff.
             delete searchParams.size;
             delete searchParams.start;
+            delete searchParams.after;
 
             return searchParams;
         },
@@ -124,7 +125,7 @@ var Phase = Phase || {};
          * download more search results.
          */
         onMoreDocumentsRequested: function() {
-            this.search.nextPage();
+            this.search.nextPage(this.documentsCollection.cursor);
             this.fetchDocuments(false);
         },
         /**
@@ -172,6 +173,7 @@ var Phase = Phase || {};
             // Pagination params should not make it to the url
             delete attributes.start;
             delete attributes.size;
+            delete attributes.after;
 
             // Let's remove attributes with empty values, so the search
             // url only contains meaningful parameters
@@ -0,0 +1,35 @@
+var Phase = Phase || {};
+
+jQuery(function($) {
+    "use strict";
+
+    /* display the progress of pending exports and imports */
+
+    var formatEta = function(eta) {
+        var minutes = Math.floor(eta / 60);
+        var seconds = Math.round(eta % 60);
+        return minutes > 0 ? minutes + 'min ' + seconds + 's' : seconds + 's';
+    };
+
+    var pollTask = function(element) {
+        var $element = $(element);
+        var pollId = setInterval(function() {
+            $.get($element.data('poll-url'), function(data) {
+                if (data.done) {
+                    clearInterval(pollId);
+                    location.reload();
+                    return;
+                }
+                var text = Math.round(data.progress) + '%';
+                if (data.eta !== null && data.eta !== undefined) {
+                    text += ' (' + formatEta(data.eta) + ' left)';
+                }
+                $element.text(text);
+            });
+        }, 2000);
+    };
+
+    $('.task-progress').each(function() {
+        pollTask(this);
+    });
+});
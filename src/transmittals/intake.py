@@ -0,0 +1,465 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals, absolute_import
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import logging
+import ctypes
+import ctypes.util
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from django.db import connections
+from django.utils.six.moves import queue
+
+from transmittals.imports import TrsImport
+
+
+logger = logging.getLogger(__name__)
+
+
+# See inotify(7)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | \
+    IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+EVENT_HEADER = struct.Struct(b'iIII')
+READ_SIZE = 64 * 1024
+
+
+class PollingWatcher(object):
+    """Wakes up every `timeout` seconds, for a full scan."""
+
+    def watch(self, path):
+        pass
+
+    def unwatch(self, path):
+        pass
+
+    def wait(self, timeout):
+        """Returns the set of modified paths, or None if unknown."""
+        time.sleep(timeout)
+        return None
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(object):
+    """Reports modified paths with the linux inotify api.
+
+    Watching a directory reports the changes of its direct children.
+
+    Raises `OSError` if inotify is not available.
+
+    """
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c')
+        if libc_name is None:
+            raise OSError(errno.ENOSYS, 'libc not found')
+
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise self.get_error()
+
+        # wd -> path, path -> wd
+        self.paths = {}
+        self.wds = {}
+
+    def get_error(self):
+        error = ctypes.get_errno()
+        return OSError(error, os.strerror(error))
+
+    def watch(self, path):
+        if path in self.wds:
+            return
+
+        encoded_path = path.encode(sys.getfilesystemencoding())
+        wd = self.libc.inotify_add_watch(self.fd, encoded_path, WATCH_MASK)
+        if wd < 0:
+            raise self.get_error()
+
+        self.paths[wd] = path
+        self.wds[path] = wd
+
+    def unwatch(self, path):
+        wd = self.wds.pop(path, None)
+        if wd is not None:
+            del self.paths[wd]
+            self.libc.inotify_rm_watch(self.fd, wd)
+
+    def wait(self, timeout):
+        """Returns the set of modified paths, or None if events were lost.
+
+        Returns early if a signal is received (e.g. to stop the intake).
+
+        """
+        try:
+            readable, _, _ = select.select([self.fd], [], [], timeout)
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                return set()
+            raise
+        if not readable:
+            return set()
+
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return set()
+            raise
+
+        modified = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                return None
+
+            path = self.paths.get(wd)
+            if mask & IN_IGNORED:
+                if path is not None:
+                    del self.paths[wd]
+                    del self.wds[path]
+                continue
+
+            if path is None:
+                continue
+
+            modified.add(path)
+            if name:
+                name = name.decode(sys.getfilesystemencoding())
+                modified.add(os.path.join(path, name))
+        return modified
+
+    def close(self):
+        os.close(self.fd)
+
+
+def get_watcher(polling=False):
+    """Returns an inotify watcher, or a polling one if it's not available."""
+    if not polling:
+        try:
+            return InotifyWatcher()
+        except OSError as e:
+            logger.warning('Cannot use inotify ({}), polling instead'.format(e))
+    return PollingWatcher()
+
+
+class IntakeContractor(object):
+    """The import configuration of a single contractor.
+
+    `config` is the contractor entry of `TRS_IMPORTS_CONFIG`.
+
+    """
+    def __init__(self, contractor_id, config, doc_category, trs_category,
+                 trs_validator=None, csv_line_validator=None):
+        self.contractor_id = contractor_id
+        self.config = config
+        self.doc_category = doc_category
+        self.trs_category = trs_category
+        self.trs_validator = trs_validator
+        self.csv_line_validator = csv_line_validator
+
+    @property
+    def incoming_dir(self):
+        return self.config['INCOMING_DIR']
+
+    def get_import(self, directory):
+        return TrsImport(
+            directory,
+            tobechecked_dir=self.config['TO_BE_CHECKED_DIR'],
+            accepted_dir=self.config['ACCEPTED_DIR'],
+            rejected_dir=self.config['REJECTED_DIR'],
+            email_list=self.config['EMAIL_LIST'],
+            contractor=self.contractor_id,
+            doc_category=self.doc_category,
+            trs_category=self.trs_category,
+            trs_validator=self.trs_validator,
+            csv_line_validator=self.csv_line_validator,
+        )
+
+
+class IncomingDirectory(object):
+    """The intake state of a single incoming transmittal directory.
+
+    A directory is `pending` until its content (file names, sizes and
+    modification dates) did not change for the settle delay. It is then
+    `queued` and `processing`, and finally `done` or `failed`.
+
+    The content that was processed is kept, so a directory is only processed
+    again if it's modified (e.g. a failed upload is fixed).
+
+    """
+    PENDING = 'pending'
+    QUEUED = 'queued'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, path, contractor, now):
+        self.path = path
+        self.contractor = contractor
+        self.status = self.PENDING
+        self.snapshot = None
+        self.processed_snapshot = None
+        self.changed_on = now
+
+    def take_snapshot(self):
+        snapshot = []
+        try:
+            for name in sorted(os.listdir(self.path)):
+                try:
+                    st = os.stat(os.path.join(self.path, name))
+                except OSError:
+                    # The file is being removed
+                    continue
+                snapshot.append((name, st.st_size, st.st_mtime))
+        except OSError:
+            return None
+        return tuple(snapshot)
+
+    def refresh(self, now):
+        """Check if the directory content changed.
+
+        Returns True if it did.
+
+        """
+        snapshot = self.take_snapshot()
+        if snapshot == self.snapshot:
+            return False
+
+        self.snapshot = snapshot
+        self.changed_on = now
+        if snapshot is not None and \
+                self.status in (self.DONE, self.FAILED) and \
+                snapshot != self.processed_snapshot:
+            self.status = self.PENDING
+        return True
+
+    def is_stable(self, now, settle_delay):
+        return self.snapshot is not None and \
+            now - self.changed_on >= settle_delay
+
+
+class TransmittalIntake(object):
+    """Import the transmittals uploaded in the contractors incoming dirs.
+
+    The incoming directories are watched (with inotify if possible), and
+    each new transmittal directory is imported once its content did not
+    change for `settle_delay` seconds.
+
+    Imports are run in a pool of `workers` threads, shared by all
+    contractors. The transmittals of a contractor are imported one at a
+    time, in name order, because the validation of a transmittal depends on
+    the previous ones. With no workers, imports are run in the calling
+    thread.
+
+    """
+    def __init__(self, contractors, workers=4, settle_delay=30,
+                 poll_interval=5, watcher=None):
+        self.contractors = OrderedDict(
+            (contractor.contractor_id, contractor)
+            for contractor in contractors)
+        self.workers = workers
+        self.settle_delay = settle_delay
+        self.poll_interval = poll_interval
+        self.watcher = watcher or PollingWatcher()
+
+        self.pool = ThreadPool(workers) if workers else None
+        self.results = queue.Queue()
+        self.stopped = False
+
+        # path -> IncomingDirectory
+        self.directories = OrderedDict()
+        # contractor_id -> the directory being imported
+        self.running = {}
+
+    def run(self):
+        """Watch and import transmittals until `stop` is called."""
+        for contractor in self.contractors.values():
+            logger.info('Watching {} for {}'.format(
+                contractor.incoming_dir, contractor.contractor_id))
+            self.watcher.watch(contractor.incoming_dir)
+
+        self.scan()
+        while not self.stopped:
+            modified = self.watcher.wait(self.poll_interval)
+            self.scan(modified)
+            self.collect()
+            self.dispatch()
+
+        self.close()
+
+    def stop(self):
+        self.stopped = True
+
+    def close(self):
+        """Wait for the running imports."""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+        self.collect()
+        self.watcher.close()
+
+    def scan(self, modified=None, now=None):
+        """Update the state of the incoming directories.
+
+        `modified` is the set of paths that were reported as modified by the
+        watcher. If None, all directories are checked.
+
+        """
+        now = time.time() if now is None else now
+        for contractor in self.contractors.values():
+            incoming_dir = contractor.incoming_dir
+            if modified is None or incoming_dir in modified:
+                self.scan_incoming_dir(contractor, now)
+
+        for path, directory in self.directories.items():
+            if modified is None or path in modified:
+                directory.refresh(now)
+
+    def scan_incoming_dir(self, contractor, now):
+        incoming_dir = contractor.incoming_dir
+        try:
+            names = os.listdir(incoming_dir)
+        except OSError as e:
+            logger.error('Cannot read {} ({})'.format(incoming_dir, e))
+            return
+
+        paths = set()
+        for name in sorted(names):
+            path = os.path.join(incoming_dir, name)
+            if not os.path.isdir(path):
+                continue
+
+            paths.add(path)
+            if path not in self.directories:
+                logger.info('New transmittal directory {}'.format(path))
+                self.directories[path] = IncomingDirectory(
+                    path, contractor, now)
+                self.watch(path)
+
+        # Forget about directories that were moved away
+        gone = [
+            directory.path for directory in self.directories.values()
+            if directory.contractor == contractor and
+            directory.path not in paths and
+            directory.status not in (directory.QUEUED, directory.PROCESSING)]
+        for path in gone:
+            del self.directories[path]
+            self.watcher.unwatch(path)
+
+    def watch(self, path):
+        try:
+            self.watcher.watch(path)
+        except OSError as e:
+            # The directory is still checked every time the incoming dir
+            # is modified
+            logger.warning('Cannot watch {} ({})'.format(path, e))
+
+    def get_next_directories(self):
+        """Returns the first pending directory of every idle contractor."""
+        next_directories = OrderedDict()
+        for path in sorted(self.directories.keys()):
+            directory = self.directories[path]
+            contractor_id = directory.contractor.contractor_id
+            if directory.status != directory.PENDING or \
+                    contractor_id in self.running or \
+                    contractor_id in next_directories:
+                continue
+            next_directories[contractor_id] = directory
+        return next_directories.values()
+
+    def dispatch(self, now=None):
+        """Start the import of stable directories.
+
+        The next directory of a contractor is not imported until it's
+        stable, even if the following ones are.
+
+        """
+        now = time.time() if now is None else now
+        for directory in self.get_next_directories():
+            if not directory.is_stable(now, self.settle_delay):
+                continue
+
+            # Events may have been missed, e.g if the directory could not be
+            # watched
+            if directory.refresh(now):
+                continue
+
+            self.running[directory.contractor.contractor_id] = directory
+            directory.status = directory.QUEUED
+            directory.processed_snapshot = directory.snapshot
+            if self.pool is None:
+                self.results.put(import_directory(directory))
+            else:
+                self.pool.apply_async(
+                    import_directory, (directory,),
+                    {'close_connections': True},
+                    callback=self.results.put)
+
+    def collect(self):
+        """Update the state of the finished imports."""
+        while True:
+            try:
+                directory, success = self.results.get_nowait()
+            except queue.Empty:
+                break
+
+            directory.status = directory.DONE if success else directory.FAILED
+            del self.running[directory.contractor.contractor_id]
+
+            # Imported directories are moved away
+            if not os.path.isdir(directory.path):
+                del self.directories[directory.path]
+                self.watcher.unwatch(directory.path)
+
+
+def import_directory(directory, close_connections=False):
+    """Validate and import a single transmittal directory.
+
+    Returns the directory and a success boolean.
+
+    Worker threads must close their own db connections.
+
+    """
+    directory.status = directory.PROCESSING
+    logger.info('Starting import of trs in {}'.format(directory.path))
+    try:
+        trs_import = directory.contractor.get_import(directory.path)
+        trs_import.do_import()
+        return directory, True
+    except Exception:
+        logger.exception('Cannot import trs in {}'.format(directory.path))
+        return directory, False
+    finally:
+        if close_connections:
+            connections.close_all()
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import signal
+import logging
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.exceptions import ImproperlyConfigured
+from django.conf import settings
+
+from transmittals.intake import IntakeContractor, TransmittalIntake, get_watcher
+from transmittals.management.commands.import_transmittals import \
+    Command as ImportCommand
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(ImportCommand):
+    """Watch the incoming directories and import new transmittals.
+
+    This is a long running alternative to the `import_transmittals` cron
+    job. Contractors are read from `TRS_IMPORTS_CONFIG`, and must define
+    the `DOC_CATEGORY` and `TRS_CATEGORY` keys.
+
+    """
+    args = '[<contractor_id> ...]'
+    help = 'Watch the incoming directories and import new transmittals.'
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--workers',
+            action='store', type='int', dest='workers',
+            default=settings.TRS_INTAKE_WORKERS,
+            help='Number of transmittals imported at the same time.'),
+        make_option(
+            '--settle-delay',
+            action='store', type='int', dest='settle_delay',
+            default=settings.TRS_INTAKE_SETTLE_DELAY,
+            help='Seconds without modification before a directory is imported.'),
+        make_option(
+            '--poll-interval',
+            action='store', type='int', dest='poll_interval',
+            default=settings.TRS_INTAKE_POLL_INTERVAL,
+            help='Seconds between two checks of the directories.'),
+        make_option(
+            '--polling',
+            action='store_true', dest='polling', default=False,
+            help='Poll the directories, even if inotify is available.'))
+
+    def handle(self, *args, **options):
+        config = settings.TRS_IMPORTS_CONFIG
+        contractor_ids = args or sorted(config.keys())
+        contractors = [self.get_contractor(contractor_id, config)
+                       for contractor_id in contractor_ids]
+        if not contractors:
+            raise CommandError('No contractor to watch.')
+
+        intake = TransmittalIntake(
+            contractors,
+            workers=options['workers'],
+            settle_delay=options['settle_delay'],
+            poll_interval=options['poll_interval'],
+            watcher=get_watcher(polling=options['polling']))
+
+        def stop(signum, frame):
+            logger.info('Stopping the transmittals intake')
+            intake.stop()
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        intake.run()
+
+    def get_contractor(self, contractor_id, config):
+        from transmittals.models import Transmittal
+
+        ctr_config = config.get(contractor_id, None)
+        if ctr_config is None:
+            raise ImproperlyConfigured('The "%s" contractor is unknown. '
+                                       'Check your configuration.' % contractor_id)
+
+        doc_category = self.get_category(ctr_config.get('DOC_CATEGORY', ''))
+        if doc_category is None:
+            error = 'The document category of "%s" is unknown. ' \
+                    'Check your configuration.' % contractor_id
+            raise CommandError(error)
+
+        trs_category = self.get_category(ctr_config.get('TRS_CATEGORY', ''))
+        if trs_category is None:
+            error = 'The transmittal category of "%s" is unknown. ' \
+                    'Check your configuration.' % contractor_id
+            raise CommandError(error)
+
+        model_class = trs_category.category_template.metadata_model.model_class()
+        if model_class != Transmittal:
+            error = 'The transmittal category should host Transmittal documents.'
+            raise CommandError(error)
+
+        # Check directories permissions
+        self.assert_permissions(ctr_config['INCOMING_DIR'])
+        self.assert_permissions(ctr_config['REJECTED_DIR'])
+        self.assert_permissions(ctr_config['TO_BE_CHECKED_DIR'])
+        self.assert_permissions(ctr_config['ACCEPTED_DIR'])
+
+        TrsValidator = None
+        trs_validator = ctr_config.get('TRS_VALIDATOR')
+        if trs_validator:
+            TrsValidator = self.import_validator(trs_validator)
+
+        CsvLineValidator = None
+        csv_line_validator = ctr_config.get('CSV_LINE_VALIDATOR')
+        if csv_line_validator:
+            CsvLineValidator = self.import_validator(csv_line_validator)
+
+        return IntakeContractor(
+            contractor_id, ctr_config, doc_category, trs_category,
+            trs_validator=TrsValidator,
+            csv_line_validator=CsvLineValidator)
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transmittals', '0055_auto_20160303_1439'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transmittal',
+            name='last_processed_revision',
+            field=models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, blank=True, to='transmittals.TrsRevision', help_text='The processing resumes after this revision', null=True, verbose_name='Last processed revision'),
+        ),
+    ]
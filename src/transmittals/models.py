@@ -1,19 +1,17 @@
 # -*- coding: utf-8 -*-
 
-from __future__ import unicode_literals
+from __future__ import unicode_literals, absolute_import
 
 import os
 import logging
 import shutil
 import uuid
-import zipfile
-import tempfile
 import datetime
 from collections import OrderedDict
 
 from django import forms
 from django.db import models, transaction
-from django.db.models import Case, Value, When
+from django.db.models import Case, Value, When, Q
 from django.utils.translation import ugettext_lazy as _
 from django.core.urlresolvers import reverse
 from django.core.files.base import ContentFile
@@ -23,10 +21,11 @@ from model_utils import Choices
 from elasticsearch_dsl import F
 
 from documents.utils import save_document_forms
+from imports.lookups import ImportLookups
 from documents.models import Document, Metadata, MetadataRevision, MetadataRevisionBase
 from documents.templatetags.documents import MenuItem
 from reviews.models import CLASSES, ReviewMixin
-from search.utils import build_index_data, bulk_actions
+from search.utils import build_index_actions, bulk_actions
 from metadata.fields import ConfigurableChoiceField
 from default_documents.validators import StringNumberValidator
 from privatemedia.fields import ProtectedFileField, PrivateFileField
@@ -112,6 +111,15 @@ class Transmittal(Metadata):
     accepted_dir = models.CharField(max_length=255, null=True, blank=True)
     rejected_dir = models.CharField(max_length=255, null=True, blank=True)
 
+    # Processing cursor
+    last_processed_revision = models.ForeignKey(
+        'TrsRevision',
+        null=True, blank=True,
+        on_delete=models.SET_NULL,
+        related_name='+',
+        verbose_name=_('Last processed revision'),
+        help_text=_('The processing resumes after this revision'))
+
     class Meta:
         app_label = 'transmittals'
         ordering = ('document_number',)
@@ -223,6 +231,26 @@ class Transmittal(Metadata):
         self.document.document_key = new_key
         self.document.save()
 
+    def get_unprocessed_revisions(self):
+        """Revisions that were not saved to documents yet.
+
+        Revisions are returned in processing order. The processing can be
+        stopped and resumed at any point, by setting the
+        `last_processed_revision` cursor.
+
+        """
+        revisions = TrsRevision.objects \
+            .filter(transmittal=self) \
+            .order_by('revision', 'id') \
+            .select_related()
+
+        last = self.last_processed_revision
+        if last is not None:
+            revisions = revisions.filter(
+                Q(revision__gt=last.revision) |
+                Q(revision=last.revision, id__gt=last.id))
+        return revisions
+
     def accept(self):
         """Starts the transmittal import process.
 
@@ -434,39 +462,48 @@ class TrsRevision(models.Model):
 
         return fields_dict, files_dict
 
-    def save_to_document(self):
-        """Use self data to create / update the corresponding revision."""
+    def save_to_document(self, lookups=None, choices_cache=None,
+                         rewrite_schedule=True):
+        """Use self data to create / update the corresponding revision.
+
+        `lookups` are the `ImportLookups` of the revision category, shared
+        by all the revisions of the transmittal.
+
+        """
 
         fields, files = self.get_document_fields()
         kwargs = {
             'category': self.category,
             'data': fields,
-            'files': files
+            'files': files,
+            'choices_cache': choices_cache,
         }
 
-        # The document was created earlier during
+        # The document may have been created earlier during
         # the batch import
-        if self.document is None and self.revision > 0:
-            self.document = Document.objects.get(document_key=self.document_key)
-
-        metadata = getattr(self.document, 'metadata', None)
+        if lookups is None:
+            lookups = ImportLookups(self.category)
+        metadata = lookups.get_metadata(self.document_key)
         kwargs.update({'instance': metadata})
         Form = self.category.get_metadata_form_class()
         metadata_form = Form(**kwargs)
 
         # If there is no such revision, the method will return None
         # which is fine.
-        revision = metadata.get_revision(self.revision) if metadata else None
+        revision = lookups.get_revision(metadata, self.revision) if metadata else None
 
         kwargs.update({'instance': revision})
         RevisionForm = self.category.get_revision_form_class()
         revision_form = RevisionForm(**kwargs)
 
         doc, meta, rev = save_document_forms(
-            metadata_form, revision_form, self.category)
+            metadata_form, revision_form, self.category,
+            rewrite_schedule=rewrite_schedule)
+        lookups.add(meta, rev)
 
         # Performs custom import action
         rev.post_trs_import(self)
+        return doc, meta, rev
 
 
 class OutgoingTransmittal(Metadata):
@@ -612,63 +649,78 @@ class OutgoingTransmittal(Metadata):
         return TransmittalDownloadForm(data, queryset=queryset)
 
     @classmethod
-    def compress_documents(cls, documents, **kwargs):
-        """See `documents.models.Metadata.compress_documents`"""
+    def get_archive_files(cls, documents, **kwargs):
+        """See `documents.models.Metadata.get_archive_files`
+
+        * content can be either 'transmittal', 'revisions' or 'both'
+
+        """
         content = kwargs.get('content', 'transmittal')
         revisions = kwargs.get('revisions', 'latest')
 
-        temp_file = tempfile.TemporaryFile()
-
-        with zipfile.ZipFile(temp_file, mode='w') as zip_file:
-            for document in documents:
-                dirname = document.document_key
-                revision = document.get_latest_revision()
-
-                # Should we embed the transmittal pdf?
-                if content in ('transmittal', 'both'):
-
-                    # All revisions or just the latest?
-                    if revisions == 'latest':
-                        revs = [revision]
-                    elif revisions == 'all':
-                        revs = document.get_all_revisions()
-
-                    # Embed the file in the zip archive
-                    for rev in revs:
-                        pdf_file = rev.pdf_file
-                        pdf_basename = os.path.basename(pdf_file.name)
-
-                        # Avoiding to break export process
-                        if not pdf_file:
-                            continue
-
-                        # If file is gone, don't break export process
-                        try:
-                            zip_file.write(
-                                pdf_file.path,
-                                '{}/{}'.format(dirname, pdf_basename),
-                                compress_type=zipfile.ZIP_DEFLATED)
-                        except OSError:
-                            logger.warning(
-                                'File: {} missing in export process'.format(pdf_file))
-
-                # Should we embed review comments?
-                if content in ('revisions', 'both'):
-                    meta = document.get_metadata()
-                    exported_revs = meta.get_revisions()
-                    for rev in exported_revs:
-                        if rev.file_transmitted:
-                            comments_file = rev.file_transmitted
-                            comments_basename = os.path.basename(comments_file.path)
-                            zip_file.write(
-                                comments_file.path,
-                                '{}/{}/{}'.format(
-                                    dirname,
-                                    rev.document.document_key,
-                                    comments_basename),
-                                compress_type=zipfile.ZIP_DEFLATED)
-
-        return temp_file
+        files = []
+
+        # Should we embed the transmittal pdf?
+        if content in ('transmittal', 'both'):
+            for rev in cls.get_revisions_to_download(documents, revisions):
+                pdf_file = rev.pdf_file
+
+                # Avoiding to break export process
+                if not pdf_file:
+                    continue
+
+                files.append((pdf_file.path, '{}/{}'.format(
+                    rev.metadata.document.document_key,
+                    os.path.basename(pdf_file.name))))
+
+        # Should we embed review comments?
+        if content in ('revisions', 'both'):
+            transmittals = cls.objects \
+                .filter(document__in=documents) \
+                .select_related(
+                    'document',
+                    'revisions_category__category_template__metadata_model')
+            for transmittal, rev in cls.get_transmitted_revisions(transmittals):
+                if rev.file_transmitted:
+                    comments_file = rev.file_transmitted
+                    comments_basename = os.path.basename(comments_file.path)
+                    files.append((comments_file.path, '{}/{}/{}'.format(
+                        transmittal.document.document_key,
+                        rev.document.document_key,
+                        comments_basename)))
+
+        return files
+
+    @classmethod
+    def get_transmitted_revisions(cls, transmittals):
+        """Returns `(transmittal, revision)` pairs for the given transmittals.
+
+        Revisions are fetched with a single query per revision class (see
+        `get_revisions`).
+
+        """
+        by_class = OrderedDict()
+        for transmittal in transmittals:
+            Revision = transmittal.get_revisions_class()
+            by_class.setdefault(Revision, OrderedDict())[transmittal.pk] = \
+                transmittal
+
+        pairs = []
+        for Revision, transmittals_by_pk in by_class.items():
+            Link = Revision.transmittals.through
+            links = Link.objects \
+                .filter(outgoingtransmittal__in=transmittals_by_pk.keys()) \
+                .values_list('outgoingtransmittal_id',
+                             '{}_id'.format(Revision._meta.model_name)) \
+                .order_by('id')
+            links = list(links)
+            revisions = Revision.objects \
+                .select_related('metadata__document') \
+                .in_bulk([rev_id for _, rev_id in links])
+            pairs += [
+                (transmittals_by_pk[transmittal_id], revisions[rev_id])
+                for transmittal_id, rev_id in links]
+        return pairs
 
     def link_to_revisions(self, revisions):
         """Set the given revisions as related documents.
@@ -678,16 +730,13 @@ class OutgoingTransmittal(Metadata):
          - be transmittable objects
 
         """
-        ids = []
-        index_data = []
-        for revision in revisions:
-            ids.append(revision.id)
-
-            # Update ES index to make sure the "can_be_transmitted"
-            # filter is up to date
-            index_datum = build_index_data(revision)
+        ids = [revision.id for revision in revisions]
+
+        # Update ES index to make sure the "can_be_transmitted"
+        # filter is up to date
+        index_data = build_index_actions(revisions)
+        for index_datum in index_data:
             index_datum['_source']['can_be_transmitted'] = False
-            index_data.append(index_datum)
         with transaction.atomic():
             today = timezone.now()
             later = today + datetime.timedelta(days=self.EXTERNAL_REVIEW_DURATION)
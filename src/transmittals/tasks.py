@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
 
-from __future__ import unicode_literals
+from __future__ import unicode_literals, absolute_import
 
 import logging
 import os
+from collections import OrderedDict, defaultdict
 
+from django.conf import settings
 from django.db import transaction
 
 from celery import current_task
@@ -15,9 +17,12 @@ from core.celery import app
 from accounts.models import Entity, User
 from categories.models import Category
 from documents.models import Document
+from documents.signals import document_form_saved
+from imports.lookups import ImportLookups
 from notifications.models import notify
+from search.outbox import suspended_indexing
 from transmittals.models import (
-    Transmittal, TrsRevision, OutgoingTransmittal, OutgoingTransmittalRevision)
+    Transmittal, OutgoingTransmittal, OutgoingTransmittalRevision)
 from transmittals.utils import (
     create_transmittal, send_transmittal_creation_notifications)
 from transmittals.errors import TransmittalError
@@ -87,6 +92,25 @@ def do_create_transmittal(
     return 'done'
 
 
+def prefetch_documents(trs_revisions, lookups):
+    """Fetch the documents and revisions of a batch of trs revisions.
+
+    `lookups` is a dict of `ImportLookups` by category.
+
+    """
+    rows = defaultdict(list)
+    for trs_revision in trs_revisions:
+        category = trs_revision.category
+        if category.pk not in lookups:
+            lookups[category.pk] = ImportLookups(category)
+        rows[category.pk].append({
+            'document_key': trs_revision.document_key,
+            'revision': trs_revision.revision})
+
+    for category_pk, category_rows in rows.items():
+        lookups[category_pk].prefetch(category_rows)
+
+
 @app.task
 def process_transmittal(transmittal_id):
     """Processing the transmittal requires the following steps:
@@ -98,31 +122,62 @@ def process_transmittal(transmittal_id):
         - Move files into the 'accepted' directory
         - Update the Transmittal object status
 
+    Revisions are saved by batches, each in its own transaction, so
+    documents are not locked during the whole processing. The last saved
+    revision is kept, and a processing that failed resumes after it.
+
+    Documents are indexed all at once, when all revisions are saved.
+
     """
     logger.info('Starting to process transmittal {}'.format(transmittal_id))
 
     transmittal = Transmittal.objects.get(pk=transmittal_id)
-    revisions = TrsRevision.objects \
-        .filter(transmittal=transmittal) \
-        .order_by('revision') \
-        .select_related()
+    batch_size = settings.TRANSMITTALS_PROCESSING_BATCH_SIZE
+    lookups = {}
+    choices_cache = {}
+    trs_revision = None
 
     try:
-        # Update / create documents in db
-        with transaction.atomic():
-            line = 1
-            for trs_revision in revisions:
-                trs_revision.save_to_document()
-                if line % 100 == 0:
-                    logger.info('Importing line {}'.format(line))
-
-                line += 1
-
-            transmittal.status = 'accepted'
-            transmittal.save()
-
-            transmittal.document.is_indexable = True
-            transmittal.document.save()
+        with suspended_indexing():
+            # Update / create documents in db
+            count = 0
+            while True:
+                revisions = list(
+                    transmittal.get_unprocessed_revisions()[:batch_size])
+                if not revisions:
+                    break
+
+                prefetch_documents(revisions, lookups)
+                saved = OrderedDict()
+                with transaction.atomic():
+                    for trs_revision in revisions:
+                        doc, metadata, revision = trs_revision.save_to_document(
+                            lookups=lookups[trs_revision.category_id],
+                            choices_cache=choices_cache,
+                            rewrite_schedule=False)
+                        saved[doc.pk] = (doc, metadata, revision)
+
+                    # Schedules are rewritten once per document
+                    for doc, metadata, revision in saved.values():
+                        document_form_saved.send(
+                            document=doc,
+                            metadata=metadata,
+                            revision=revision,
+                            sender=doc.__class__)
+
+                    transmittal.last_processed_revision = trs_revision
+                    transmittal.save(
+                        update_fields=['last_processed_revision'])
+
+                count += len(revisions)
+                logger.info('Imported {} revisions'.format(count))
+
+            with transaction.atomic():
+                transmittal.status = 'accepted'
+                transmittal.save()
+
+                transmittal.document.is_indexable = True
+                transmittal.document.save()
 
         # Move to accepted directory
         if os.path.exists(transmittal.full_tobechecked_name):
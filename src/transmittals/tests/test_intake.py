@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import os
+import time
+import signal
+import shutil
+import tempfile
+from unittest import skipIf
+
+from django.test import TestCase, override_settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.exceptions import ImproperlyConfigured
+from django.contrib.contenttypes.models import ContentType
+
+from mock import MagicMock, patch
+
+from categories.factories import CategoryFactory
+from transmittals.models import Transmittal
+from transmittals.intake import (
+    IntakeContractor, IncomingDirectory, TransmittalIntake, InotifyWatcher,
+    get_watcher)
+
+
+def touch(path, content=''):
+    with open(path, 'a') as f:
+        f.write(content)
+
+
+def inotify_available():
+    try:
+        InotifyWatcher().close()
+        return True
+    except OSError:
+        return False
+
+
+class IntakeTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='phasetest_', suffix='_intake')
+        self.imported = []
+        self.contractors = [
+            self.create_contractor('ctr1'),
+            self.create_contractor('ctr2')]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def create_contractor(self, contractor_id):
+        config = {}
+        for key in ('INCOMING_DIR', 'REJECTED_DIR', 'TO_BE_CHECKED_DIR',
+                    'ACCEPTED_DIR'):
+            path = os.path.join(self.tmpdir, contractor_id, key.lower())
+            os.makedirs(path)
+            config[key] = path
+        config['EMAIL_LIST'] = []
+
+        contractor = IntakeContractor(contractor_id, config, None, None)
+        contractor.get_import = MagicMock(side_effect=self.get_import)
+        return contractor
+
+    def get_import(self, directory):
+        """Imports move the directory to the "to be checked" dir."""
+        def do_import():
+            self.imported.append(os.path.basename(directory))
+            tobechecked_dir = os.path.join(
+                os.path.dirname(os.path.dirname(directory)),
+                'to_be_checked_dir')
+            os.rename(directory, os.path.join(
+                tobechecked_dir, os.path.basename(directory)))
+
+        trs_import = MagicMock()
+        trs_import.do_import.side_effect = do_import
+        return trs_import
+
+    def create_trs(self, contractor, name):
+        path = os.path.join(contractor.incoming_dir, name)
+        os.mkdir(path)
+        touch(os.path.join(path, '{}.csv'.format(name)), 'csv content')
+        return path
+
+
+class IncomingDirectoryTests(IntakeTestCase):
+    def test_stability(self):
+        path = self.create_trs(self.contractors[0], 'trs1')
+        directory = IncomingDirectory(path, self.contractors[0], 0)
+        self.assertTrue(directory.refresh(10))
+        self.assertFalse(directory.refresh(15))
+        self.assertFalse(directory.is_stable(20, settle_delay=30))
+        self.assertTrue(directory.is_stable(40, settle_delay=30))
+
+        # Uploads delay the import
+        touch(os.path.join(path, 'document.pdf'))
+        self.assertTrue(directory.refresh(50))
+        self.assertFalse(directory.is_stable(60, settle_delay=30))
+
+        touch(os.path.join(path, 'document.pdf'), 'more data')
+        self.assertTrue(directory.refresh(60))
+        self.assertTrue(directory.is_stable(90, settle_delay=30))
+
+    def test_missing_directory_is_not_stable(self):
+        path = os.path.join(self.contractors[0].incoming_dir, 'trs1')
+        directory = IncomingDirectory(path, self.contractors[0], 0)
+        self.assertFalse(directory.refresh(10))
+        self.assertFalse(directory.is_stable(100, settle_delay=30))
+
+
+class TransmittalIntakeTests(IntakeTestCase):
+    def setUp(self):
+        super(TransmittalIntakeTests, self).setUp()
+        self.intake = TransmittalIntake(
+            self.contractors, workers=0, settle_delay=30)
+
+    def tick(self, now):
+        self.intake.scan(now=now)
+        self.intake.collect()
+        self.intake.dispatch(now=now)
+
+    def test_import_stable_directories(self):
+        self.create_trs(self.contractors[0], 'trs1')
+        self.create_trs(self.contractors[1], 'trs2')
+        touch(os.path.join(self.contractors[1].incoming_dir, 'not_a_trs'))
+
+        self.tick(0)
+        self.tick(20)
+        self.assertEqual(self.imported, [])
+
+        self.tick(40)
+        self.assertEqual(self.imported, ['trs1', 'trs2'])
+
+        # Imported directories are forgotten
+        self.tick(80)
+        self.assertEqual(self.imported, ['trs1', 'trs2'])
+        self.assertEqual(self.intake.directories, {})
+
+    def test_contractor_directories_are_imported_in_order(self):
+        self.create_trs(self.contractors[0], 'trs2')
+        self.tick(0)
+        self.create_trs(self.contractors[0], 'trs1')
+        self.tick(20)
+
+        # trs2 is stable, but trs1 must be imported first
+        self.tick(40)
+        self.assertEqual(self.imported, [])
+
+        self.tick(60)
+        self.assertEqual(self.imported, ['trs1'])
+
+        self.tick(70)
+        self.assertEqual(self.imported, ['trs1', 'trs2'])
+
+    def test_directories_are_imported_once(self):
+        path = self.create_trs(self.contractors[0], 'trs1')
+        contractor = self.contractors[0]
+        contractor.get_import.side_effect = RuntimeError('Failure')
+
+        self.tick(0)
+        self.tick(40)
+        self.tick(80)
+        self.assertEqual(contractor.get_import.call_count, 1)
+        directory = self.intake.directories[path]
+        self.assertEqual(directory.status, directory.FAILED)
+
+        # A modified directory is imported again
+        contractor.get_import.side_effect = self.get_import
+        touch(os.path.join(path, 'document.pdf'))
+        self.tick(90)
+        self.tick(130)
+        self.assertEqual(self.imported, ['trs1'])
+
+    def test_thread_pool(self):
+        intake = TransmittalIntake(
+            self.contractors, workers=2, settle_delay=30)
+        for contractor in self.contractors:
+            for name in ('trs1', 'trs2'):
+                self.create_trs(contractor, '{}-{}'.format(
+                    contractor.contractor_id, name))
+
+        intake.scan(now=0)
+        intake.dispatch(now=40)
+        intake.close()
+        self.assertEqual(
+            sorted(self.imported), ['ctr1-trs1', 'ctr2-trs1'])
+        self.assertEqual(intake.running, {})
+
+
+class RunIntakeCommandTests(IntakeTestCase):
+    def get_category_path(self, category):
+        return '{}/{}'.format(
+            category.organisation.slug,
+            category.category_template.slug)
+
+    def test_unknown_contractor(self):
+        with self.assertRaises(ImproperlyConfigured):
+            call_command('run_transmittals_intake', 'toto')
+
+    def test_missing_categories(self):
+        config = {'ctr1': self.contractors[0].config}
+        with override_settings(TRS_IMPORTS_CONFIG=config):
+            with self.assertRaises(CommandError):
+                call_command('run_transmittals_intake')
+
+    @patch('transmittals.management.commands.run_transmittals_intake.signal')
+    @patch('transmittals.management.commands.run_transmittals_intake.TransmittalIntake')
+    def test_watch_configured_contractors(self, intake_mock, signal_mock):
+        trs_content_type = ContentType.objects.get_for_model(Transmittal)
+        trs_category = CategoryFactory(
+            category_template__metadata_model=trs_content_type)
+        config = dict(self.contractors[0].config)
+        config.update({
+            'DOC_CATEGORY': self.get_category_path(CategoryFactory()),
+            'TRS_CATEGORY': self.get_category_path(trs_category),
+        })
+
+        with override_settings(TRS_IMPORTS_CONFIG={'ctr1': config}):
+            call_command('run_transmittals_intake', workers=2, polling=True)
+
+        contractors = intake_mock.call_args[0][0]
+        self.assertEqual(
+            [contractor.contractor_id for contractor in contractors],
+            ['ctr1'])
+        self.assertEqual(contractors[0].trs_category, trs_category)
+        self.assertEqual(intake_mock.call_args[1]['workers'], 2)
+        self.assertTrue(intake_mock.return_value.run.called)
+
+
+@skipIf(not inotify_available(), 'inotify is not available')
+class InotifyWatcherTests(IntakeTestCase):
+    def test_modified_paths(self):
+        watcher = get_watcher()
+        self.assertIsInstance(watcher, InotifyWatcher)
+
+        incoming_dir = self.contractors[0].incoming_dir
+        watcher.watch(incoming_dir)
+        self.assertEqual(watcher.wait(0), set())
+
+        path = self.create_trs(self.contractors[0], 'trs1')
+        self.assertEqual(watcher.wait(1), set([incoming_dir, path]))
+
+        watcher.watch(path)
+        touch(os.path.join(path, 'document.pdf'))
+        self.assertEqual(
+            watcher.wait(1),
+            set([path, os.path.join(path, 'document.pdf')]))
+
+        watcher.unwatch(path)
+        touch(os.path.join(path, 'document.pdf'), 'more data')
+        self.assertEqual(watcher.wait(0), set())
+        watcher.close()
+
+    def test_signal_stops_intake(self):
+        """Running imports are finished when the intake is stopped."""
+        def slow_import(directory):
+            trs_import = self.get_import(directory)
+            do_import = trs_import.do_import.side_effect
+
+            def slow_do_import():
+                time.sleep(0.5)
+                do_import()
+            trs_import.do_import.side_effect = slow_do_import
+            return trs_import
+
+        contractor = self.contractors[0]
+        contractor.get_import.side_effect = slow_import
+        self.create_trs(contractor, 'trs1')
+        intake = TransmittalIntake(
+            [contractor], workers=1, settle_delay=0, poll_interval=1,
+            watcher=InotifyWatcher())
+
+        # The import starts after the first wait, and the signal is received
+        # during the second one
+        previous_handler = signal.signal(
+            signal.SIGALRM, lambda signum, frame: intake.stop())
+        signal.setitimer(signal.ITIMER_REAL, 1.3)
+        try:
+            intake.run()
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+
+        self.assertEqual(self.imported, ['trs1'])
+        self.assertEqual(intake.running, {})
@@ -12,6 +12,7 @@ from django.utils import timezone
 
 from accounts.factories import UserFactory
 from documents.factories import DocumentFactory
+from transmittals.models import OutgoingTransmittal
 from transmittals.factories import (
     TransmittalFactory, TransmittalRevisionFactory, create_transmittal)
 
@@ -116,3 +117,19 @@ class OutgoingTransmittalModelTests(TestCase):
         today = timezone.now().date()
         self.assertEqual(self.trs.ack_of_receipt_date, today)
         self.assertEqual(self.trs.ack_of_receipt_author, self.user)
+
+    def test_get_transmitted_revisions(self):
+        transmittals = OutgoingTransmittal.objects \
+            .filter(pk=self.trs.pk) \
+            .select_related(
+                'revisions_category__category_template__metadata_model')
+        with self.assertNumQueries(3):
+            pairs = OutgoingTransmittal.get_transmitted_revisions(transmittals)
+            keys = [rev.document.document_key for _, rev in pairs]
+
+        self.assertEqual(len(pairs), 10)
+        self.assertEqual(set(trs for trs, _ in pairs), set([self.trs]))
+        self.assertEqual(
+            sorted(keys),
+            sorted(rev.document.document_key
+                   for rev in self.trs.get_revisions()))
@@ -6,7 +6,9 @@ import os
 from os.path import join
 import tempfile
 
-from django.test import TestCase
+from mock import patch
+
+from django.test import TestCase, override_settings
 from django.contrib.contenttypes.models import ContentType
 from django.core.files.uploadedfile import SimpleUploadedFile
 
@@ -19,7 +21,7 @@ from default_documents.factories import (
 from default_documents.models import ContractorDeliverable
 from accounts.factories import EntityFactory
 from notifications.models import Notification
-from transmittals.models import OutgoingTransmittal
+from transmittals.models import Transmittal, TrsRevision, OutgoingTransmittal
 from transmittals.factories import TransmittalFactory, TrsRevisionFactory
 from transmittals.tasks import process_transmittal, do_create_transmittal
 
@@ -172,6 +174,64 @@ class ProcessTransmittalTests(TestCase):
         self.assertFalse(os.path.exists(tobechecked_file))
         self.assertTrue(os.path.exists(accepted_file))
 
+    @override_settings(TRANSMITTALS_PROCESSING_BATCH_SIZE=3)
+    def test_process_by_batches(self):
+        process_transmittal(self.transmittal.pk)
+
+        transmittal = Transmittal.objects.get(pk=self.transmittal.pk)
+        self.assertEqual(transmittal.status, 'accepted')
+        self.assertEqual(
+            transmittal.last_processed_revision.revision, 4)
+        self.assertEqual(
+            [rev.status for rev in self.document.metadata.get_all_revisions()],
+            ['FIN', 'IFA', 'IFA', 'SPD'])
+
+    @override_settings(TRANSMITTALS_PROCESSING_BATCH_SIZE=2)
+    def test_failed_process_is_resumed(self):
+        save_to_document = TrsRevision.save_to_document
+
+        def failing_save(trs_revision, *args, **kwargs):
+            if trs_revision.revision == 3:
+                raise RuntimeError('Failure')
+            return save_to_document(trs_revision, *args, **kwargs)
+
+        with patch.object(TrsRevision, 'save_to_document', failing_save):
+            process_transmittal(self.transmittal.pk)
+
+        # The first batch was saved
+        transmittal = Transmittal.objects.get(pk=self.transmittal.pk)
+        self.assertEqual(transmittal.status, 'tobechecked')
+        self.assertEqual(transmittal.last_processed_revision.revision, 2)
+        self.assertEqual(self.document.metadata.get_revision(2).status, 'IFA')
+        self.assertIsNone(self.document.metadata.get_revision(3))
+        self.assertEqual(
+            [rev.revision for rev in transmittal.get_unprocessed_revisions()],
+            [3, 4])
+
+        # Only the remaining revisions are processed again
+        with patch.object(TrsRevision, 'save_to_document',
+                          autospec=True,
+                          side_effect=save_to_document) as save_mock:
+            process_transmittal(self.transmittal.pk)
+        self.assertEqual(
+            [call[0][0].revision for call in save_mock.call_args_list],
+            [3, 4])
+
+        transmittal = Transmittal.objects.get(pk=self.transmittal.pk)
+        self.assertEqual(transmittal.status, 'accepted')
+        self.assertEqual(self.document.metadata.get_revision(4).status, 'FIN')
+
+    @override_settings(TRANSMITTALS_PROCESSING_BATCH_SIZE=2)
+    def test_documents_are_indexed_once(self):
+        with patch('transmittals.tasks.suspended_indexing') as suspended_mock:
+            with patch('transmittals.tasks.document_form_saved') as signal_mock:
+                process_transmittal(self.transmittal.pk)
+
+        # All revisions belong to the same document, which is saved once
+        # by batch
+        self.assertEqual(suspended_mock.call_count, 1)
+        self.assertEqual(signal_mock.send.call_count, 2)
+
 
 class OutgoingTransmittalTests(TestCase):
 
@@ -2,20 +2,20 @@
 
 from __future__ import unicode_literals
 
+import os
 import logging
 
-from django.views.generic import ListView, DetailView
+from django.views.generic import View, ListView, DetailView
 from django.utils.translation import ugettext_lazy as _
 from django.core.urlresolvers import reverse
 from django.http import Http404, HttpResponseRedirect, HttpResponseForbidden
 from django.utils import timezone
 
 from braces.views import LoginRequiredMixin, PermissionRequiredMixin
-from zipview.views import BaseZipView
 from annoying.functions import get_object_or_None
 
 from notifications.models import notify
-from documents.views import BaseDocumentBatchActionView
+from documents.views import BaseDocumentBatchActionView, ArchiveDownloadMixin
 from transmittals.models import Transmittal, TrsRevision
 from transmittals.utils import FieldWrapper
 from transmittals.tasks import do_create_transmittal
@@ -233,11 +233,16 @@ class TransmittalRevisionDiff(LoginRequiredMixin, PermissionRequiredMixin, Detai
                   self.object.transmittal.document_key]))
 
 
-class TransmittalDownload(LoginRequiredMixin, PermissionRequiredMixin, BaseZipView):
-    zipfile_name = 'transmittal_documents.zip'
+class TransmittalDownload(LoginRequiredMixin, PermissionRequiredMixin,
+                          ArchiveDownloadMixin, View):
+    archive_name = 'transmittal_documents.zip'
     permission_required = 'documents.can_control_document'
+    http_method_names = ['get']
 
-    def get_files(self):
+    def get(self, request, *args, **kwargs):
+        return self.archive_response(self.get_archive())
+
+    def get_archive_files(self):
         transmittal_pk = self.kwargs.get('transmittal_pk')
         document_key = self.kwargs.get('document_key')
         revision_ids = self.request.GET.getlist('revision_ids')
@@ -252,12 +257,12 @@ class TransmittalDownload(LoginRequiredMixin, PermissionRequiredMixin, BaseZipVi
         files = []
         for revision in revisions:
             if file_format in ('pdf', 'both') and revision.pdf_file.name:
-                files.append(revision.pdf_file.file)
+                files.append(revision.pdf_file)
 
             if file_format in ('native', 'both') and revision.native_file.name:
-                files.append(revision.native_file.file)
+                files.append(revision.native_file)
 
-        return files
+        return [(file_.path, os.path.basename(file_.name)) for file_ in files]
 
 
 class PrepareTransmittal(BaseDocumentBatchActionView):